@@ -1,6 +1,10 @@
 # components/layout.py
 import streamlit as st
 from auth import check_authentication, display_user_sidebar
+from utils import data_age_seconds, api_queue_depth, delivery_tracker, ATTENDANCE_TAB_NAME
+
+DELIVERY_POLL_SEC = 1.5   # intervalo do polling do painel de envio enquanto há linhas na fila
+DELIVERY_STATE_LABELS = {"queued": "⏳ queued", "sent": "✅ sent", "failed": "❌ failed"}
 
 def _ensure_page_config_once():
     if not st.session_state.get("_page_config_done", False):
@@ -28,3 +32,55 @@ def bootstrap_page(page_title: str, require_auth: bool = True):
     # Sidebar unificado (marca que já foi desenhado)
     st.session_state["_unified_sidebar_rendered"] = True
     display_user_sidebar()
+
+def show_data_age(*tabs: str):
+    """
+    Legenda com a idade dos dados servidos pelo DataStore (stale-while-revalidate).
+    Mostra a aba mais antiga entre `tabs` (padrão: Attendance).
+    """
+    tabs = tabs or (ATTENDANCE_TAB_NAME,)
+    ages = [a for a in (data_age_seconds(t) for t in tabs) if a is not None]
+    if not ages:
+        return
+    age = int(max(ages))
+    label = f"{age}s" if age < 120 else f"{age // 60} min"
+    queued = api_queue_depth()
+    waiting = f" · ⏳ {queued} Google request(s) waiting for quota" if queued else ""
+    st.caption(f"🕒 Data updated {label} ago{waiting}")
+
+def show_delivery_status(key: str = "delivery"):
+    """
+    Painel dos envios em segundo plano da sessão (utils.deliver_in_background): uma linha por
+    registro (queued / sent / failed). Um fragmento faz o polling só enquanto há fila; quando o
+    último lote termina, a página roda de novo uma vez para mostrar os dados já confirmados.
+    """
+    tracker = delivery_tracker()
+    tracker.take_finished()   # esta execução já lê os dados depois do que terminou até aqui
+    if not tracker.rows():
+        return
+
+    @st.fragment(run_every=DELIVERY_POLL_SEC if tracker.pending() else None)
+    def _panel():
+        counts = tracker.counts()
+        if tracker.take_finished() and not counts["queued"]:
+            st.rerun()
+        summary = (f"📤 Uploads: ⏳ {counts['queued']} queued · ✅ {counts['sent']} sent"
+                   + (f" · ❌ {counts['failed']} failed" if counts["failed"] else ""))
+        with st.expander(summary, expanded=bool(counts["failed"])):
+            rows = tracker.rows()
+            st.dataframe(
+                [{"Row": r["label"], "State": DELIVERY_STATE_LABELS.get(r["state"], r["state"]), "Detail": r["detail"]}
+                 for r in rows],
+                hide_index=True, use_container_width=True, height=min(35 * len(rows) + 38, 300),
+            )
+            c1, c2 = st.columns(2)
+            with c1:
+                if st.button("Retry failed", key=f"{key}_retry", disabled=not counts["failed"], use_container_width=True):
+                    tracker.retry_failed()
+                    st.rerun()
+            with c2:
+                if st.button("Clear sent", key=f"{key}_clear", disabled=not counts["sent"], use_container_width=True):
+                    tracker.clear_finished()
+                    st.rerun()
+
+    _panel()
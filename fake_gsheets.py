@@ -0,0 +1,437 @@
+#fake_gsheets.py
+"""
+Backend falso do Google Sheets, em processo, para desenvolvimento offline e benchmarks.
+
+Imita só a superfície do gspread que o app usa:
+  client.open / open_by_key / get_file_drive_metadata
+  spreadsheet.worksheets / worksheet / values_get / values_batch_get / values_append
+  worksheet.get_all_values / get_all_records / row_values / col_values / append_row(s) / update
+
+Os dados ficam num SQLite (":memory:" por padrão, ou um arquivo para persistir entre execuções).
+Latência, erros de cota (429) e sementes em CSV são configuráveis; ver make_fake_client().
+Ativação (utils.get_gspread_client):
+  - st.secrets:  [fake_gsheets] enabled = true, path = "dev.db", seed_dir = "seed/", latency = 0.2 ...
+  - ou ambiente: FAKE_GSHEETS=1 (FAKE_GSHEETS_PATH, FAKE_GSHEETS_SEED, FAKE_GSHEETS_LATENCY,
+                 FAKE_GSHEETS_ERROR_RATE, FAKE_GSHEETS_QUOTA_PER_MIN)
+"""
+
+# --- 0. Import Libraries ---
+import csv
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from gspread.exceptions import APIError, SpreadsheetNotFound, WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range, numericise_all, rowcol_to_a1
+
+from quota_governor import governed_call
+
+# --- Constants ---
+ENV_SWITCH = "FAKE_GSHEETS"
+SECRETS_SECTION = "fake_gsheets"
+DEFAULT_ROWS = 1000
+DEFAULT_COLS = 26
+
+_RANGE_RE = re.compile(r"^(?:'((?:[^']|'')+)'|([^!]+))!(.*)$")
+
+
+# --- 1. Erros simulados ---
+class _FakeResponse:
+    """O suficiente de requests.Response para construir um gspread APIError."""
+    def __init__(self, code: int, message: str, status: str):
+        self.status_code = code
+        self._error = {"code": code, "message": message, "status": status}
+        self.text = json.dumps({"error": self._error})
+
+    def json(self):
+        return {"error": self._error}
+
+def _api_error(code: int, message: str, status: str) -> APIError:
+    return APIError(_FakeResponse(code, message, status))
+
+
+# --- 2. Armazenamento (SQLite) ---
+class SQLiteBackend:
+    """Uma linha da tabela `cells_rows` por linha da aba (valores em JSON, sempre strings)."""
+
+    def __init__(self, path: str = ":memory:"):
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS spreadsheets (key TEXT PRIMARY KEY, title TEXT UNIQUE, modified INTEGER);
+            CREATE TABLE IF NOT EXISTS tabs (key TEXT, title TEXT, gid INTEGER, PRIMARY KEY (key, title));
+            CREATE TABLE IF NOT EXISTS cells_rows (key TEXT, tab TEXT, idx INTEGER, data TEXT,
+                                                   PRIMARY KEY (key, tab, idx));
+        """)
+        self._db.commit()
+
+    # spreadsheets / abas
+    def spreadsheet_key(self, title: str):
+        with self._lock:
+            row = self._db.execute("SELECT key FROM spreadsheets WHERE title = ?", (title,)).fetchone()
+            return row[0] if row else None
+
+    def spreadsheet_title(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT title FROM spreadsheets WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+
+    def create_spreadsheet(self, title: str) -> str:
+        with self._lock:
+            key = self.spreadsheet_key(title)
+            if key is None:
+                key = "fake-" + re.sub(r"[^A-Za-z0-9]+", "-", title).strip("-").lower()
+                self._db.execute("INSERT INTO spreadsheets VALUES (?, ?, ?)", (key, title, 0))
+                self._db.commit()
+            return key
+
+    def tabs(self, key: str) -> list:
+        with self._lock:
+            return self._db.execute("SELECT title, gid FROM tabs WHERE key = ? ORDER BY gid", (key,)).fetchall()
+
+    def create_tab(self, key: str, title: str) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT gid FROM tabs WHERE key = ? AND title = ?", (key, title)).fetchone()
+            if row:
+                return row[0]
+            gid = self._db.execute("SELECT COALESCE(MAX(gid), -1) + 1 FROM tabs WHERE key = ?", (key,)).fetchone()[0]
+            self._db.execute("INSERT INTO tabs VALUES (?, ?, ?)", (key, title, gid))
+            self._touch(key)
+            return gid
+
+    def modified(self, key: str) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT modified FROM spreadsheets WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else 0
+
+    def _touch(self, key: str):
+        self._db.execute("UPDATE spreadsheets SET modified = modified + 1 WHERE key = ?", (key,))
+        self._db.commit()
+
+    # valores
+    def read(self, key: str, tab: str) -> list:
+        with self._lock:
+            rows = self._db.execute("SELECT idx, data FROM cells_rows WHERE key = ? AND tab = ? ORDER BY idx",
+                                    (key, tab)).fetchall()
+        values = []
+        for idx, data in rows:
+            values.extend([] for _ in range(idx - len(values)))
+            values.append(json.loads(data))
+        return values
+
+    def write(self, key: str, tab: str, start_row: int, start_col: int, block: list):
+        """Grava `block` a partir de (start_row, start_col), 0-based."""
+        with self._lock:
+            for offset, new_cells in enumerate(block):
+                idx = start_row + offset
+                row = self._db.execute("SELECT data FROM cells_rows WHERE key = ? AND tab = ? AND idx = ?",
+                                       (key, tab, idx)).fetchone()
+                cells = json.loads(row[0]) if row else []
+                cells.extend([""] * (start_col + len(new_cells) - len(cells)))
+                cells[start_col:start_col + len(new_cells)] = new_cells
+                self._db.execute("INSERT OR REPLACE INTO cells_rows VALUES (?, ?, ?, ?)",
+                                 (key, tab, idx, json.dumps(cells)))
+            self._touch(key)
+
+    def append(self, key: str, tab: str, block: list) -> int:
+        """Acrescenta após a última linha com conteúdo; devolve o índice (0-based) da 1ª linha gravada."""
+        with self._lock:
+            start = len(_trim(self.read(key, tab)))
+            self.write(key, tab, start, 0, block)
+            return start
+
+
+# --- 3. Helpers de valores ---
+def _cell(value) -> str:
+    """Como o Sheets devolve o valor formatado (values_get padrão)."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _cells(rows) -> list:
+    return [[_cell(v) for v in row] for row in rows]
+
+def _trim(values: list) -> list:
+    """A API omite células vazias no fim de cada linha e linhas vazias no fim da aba."""
+    rows = []
+    for row in values:
+        end = len(row)
+        while end and row[end - 1] == "":
+            end -= 1
+        rows.append(row[:end])
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+def _split_range(range_name: str):
+    match = _RANGE_RE.match(range_name)
+    if not match:   # aba inteira, ex.: "'df'" (absolute_range_name sem intervalo)
+        if len(range_name) > 1 and range_name[0] == range_name[-1] == "'":
+            range_name = range_name[1:-1].replace("''", "'")
+        return range_name, ""
+    tab = match.group(1).replace("''", "'") if match.group(1) is not None else match.group(2)
+    return tab, match.group(3)
+
+def _slice(values: list, a1: str) -> list:
+    if not a1:
+        return _trim(values)
+    grid = a1_range_to_grid_range(a1)
+    r0, r1 = grid.get("startRowIndex", 0), grid.get("endRowIndex")
+    c0, c1 = grid.get("startColumnIndex", 0), grid.get("endColumnIndex")
+    return _trim([row[c0:c1] for row in values[r0:r1]])
+
+
+# --- 4. Cliente / Spreadsheet / Worksheet falsos ---
+class FakeClient:
+    """
+    Substituto do gspread.Client.
+    latency: segundos por chamada (número ou (mín, máx)).
+    error_rate: probabilidade de uma chamada falhar com 429.
+    quota_per_min: 429 quando leituras ou gravações passam disso numa janela de 60 s.
+    autocreate: open()/worksheet() criam planilhas e abas que não existem.
+    """
+    def __init__(self, backend: SQLiteBackend = None, latency=0.0, error_rate: float = 0.0,
+                 quota_per_min: int = None, autocreate: bool = True):
+        self.backend = backend or SQLiteBackend()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota_per_min = quota_per_min
+        self.autocreate = autocreate
+        self.calls = {"read": 0, "write": 0}
+        self._windows = {"read": deque(), "write": deque()}
+        self._lock = threading.Lock()
+
+    # Toda chamada "de rede" passa pelo mesmo governador do cliente real
+    def _call(self, kind: str, fn):
+        return governed_call(kind, lambda: self._simulate(kind, fn))
+
+    def _simulate(self, kind: str, fn):
+        delay = random.uniform(*self.latency) if isinstance(self.latency, (tuple, list)) else self.latency
+        if delay:
+            time.sleep(delay)
+        over_quota = False
+        if kind:   # None = Drive (cota própria, não simulada)
+            with self._lock:
+                self.calls[kind] += 1
+                now = time.monotonic()
+                window = self._windows[kind]
+                while window and now - window[0] >= 60:
+                    window.popleft()
+                over_quota = self.quota_per_min is not None and len(window) >= self.quota_per_min
+                if not over_quota:
+                    window.append(now)
+        if over_quota or (self.error_rate and random.random() < self.error_rate):
+            raise _api_error(429, f"Quota exceeded for quota metric '{kind} requests' (fake)", "RESOURCE_EXHAUSTED")
+        return fn()
+
+    def open(self, title: str, folder_id: str = None):
+        key = self.backend.spreadsheet_key(title)
+        if key is None:
+            if not self.autocreate:
+                raise SpreadsheetNotFound(title)
+            key = self.backend.create_spreadsheet(title)
+        return FakeSpreadsheet(self, key)
+
+    def open_by_key(self, key: str):
+        if self.backend.spreadsheet_title(key) is None:
+            raise SpreadsheetNotFound(key)
+        return FakeSpreadsheet(self, key)
+
+    def get_file_drive_metadata(self, key: str) -> dict:
+        # só o que o DataStore consulta: modifiedTime muda a cada gravação
+        version = self._call(None, lambda: self.backend.modified(key))
+        stamp = datetime.fromtimestamp(version, tz=timezone.utc).isoformat()
+        return {"id": key, "name": self.backend.spreadsheet_title(key), "modifiedTime": stamp}
+
+
+class FakeSpreadsheet:
+    def __init__(self, client: FakeClient, key: str):
+        self.client = client
+        self.id = key
+
+    @property
+    def title(self) -> str:
+        return self.client.backend.spreadsheet_title(self.id)
+
+    def worksheets(self, exclude_hidden: bool = False) -> list:
+        tabs = self.client._call("read", lambda: self.client.backend.tabs(self.id))
+        return [FakeWorksheet(self, title, gid) for title, gid in tabs]
+
+    def worksheet(self, title: str):
+        for ws in self.worksheets():
+            if ws.title == title:
+                return ws
+        if not self.client.autocreate:
+            raise WorksheetNotFound(title)
+        return self.add_worksheet(title)
+
+    def add_worksheet(self, title: str, rows: int = DEFAULT_ROWS, cols: int = DEFAULT_COLS, index: int = None):
+        gid = self.client._call("write", lambda: self.client.backend.create_tab(self.id, title))
+        return FakeWorksheet(self, title, gid)
+
+    def _read_range(self, range_name: str) -> dict:
+        tab, a1 = _split_range(range_name)
+        if tab not in {t for t, _ in self.client.backend.tabs(self.id)}:
+            raise _api_error(400, f"Unable to parse range: {range_name}", "INVALID_ARGUMENT")
+        return {"range": range_name, "majorDimension": "ROWS",
+                "values": _slice(self.client.backend.read(self.id, tab), a1)}
+
+    def values_get(self, range: str, params: dict = None) -> dict:
+        result = self.client._call("read", lambda: self._read_range(range))
+        if not result["values"]:
+            result.pop("values")
+        return result
+
+    def values_batch_get(self, ranges: list, params: dict = None) -> dict:
+        def fetch():
+            value_ranges = [self._read_range(r) for r in ranges]
+            for vr in value_ranges:
+                if not vr["values"]:
+                    vr.pop("values")
+            return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+        return self.client._call("read", fetch)
+
+    def values_append(self, range: str, params: dict = None, body: dict = None) -> dict:
+        tab, _ = _split_range(range)
+        rows = _cells((body or {}).get("values", []))
+
+        def append():
+            start = self.client.backend.append(self.id, tab, rows)
+            width = max((len(r) for r in rows), default=1)
+            return {"spreadsheetId": self.id, "tableRange": range, "updates": {
+                "updatedRange": f"{tab}!A{start + 1}:{rowcol_to_a1(start + len(rows), width)}",
+                "updatedRows": len(rows),
+            }}
+        return self.client._call("write", append)
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet: FakeSpreadsheet, title: str, gid: int):
+        self.spreadsheet = spreadsheet
+        self.client = spreadsheet.client
+        self.title = title
+        self.id = gid
+
+    @property
+    def spreadsheet_id(self) -> str:
+        return self.spreadsheet.id
+
+    def _values(self) -> list:
+        return self.client.backend.read(self.spreadsheet.id, self.title)
+
+    @property
+    def row_count(self) -> int:
+        return max(DEFAULT_ROWS, len(self._values()))
+
+    @property
+    def col_count(self) -> int:
+        return max([DEFAULT_COLS] + [len(r) for r in self._values()])
+
+    def get_all_values(self, *args, **kwargs) -> list:
+        values = self.client._call("read", lambda: _trim(self._values()))
+        width = max((len(r) for r in values), default=0)
+        return [row + [""] * (width - len(row)) for row in values]
+
+    def get_all_records(self, *args, **kwargs) -> list:
+        values = self.get_all_values()
+        if not values:
+            return []
+        header = values[0]
+        return [dict(zip(header, numericise_all(row))) for row in values[1:]]
+
+    def row_values(self, row: int, **kwargs) -> list:
+        values = self.client._call("read", lambda: _slice(self._values(), f"{row}:{row}"))
+        return values[0] if values else []
+
+    def col_values(self, col: int, **kwargs) -> list:
+        a1 = rowcol_to_a1(1, col)[:-1]
+        values = self.client._call("read", lambda: _slice(self._values(), f"{a1}:{a1}"))
+        return [row[0] if row else "" for row in values]
+
+    def append_row(self, values: list, value_input_option: str = "RAW", **kwargs) -> dict:
+        return self.append_rows([values], value_input_option=value_input_option)
+
+    def append_rows(self, values: list, value_input_option: str = "RAW", **kwargs) -> dict:
+        return self.spreadsheet.values_append(self.title, params={"valueInputOption": value_input_option},
+                                              body={"values": values})
+
+    def update(self, values=None, range_name: str = None, **kwargs) -> dict:
+        # aceita a ordem antiga (range, values), como o gspread 6 ainda aceita
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        grid = a1_range_to_grid_range(range_name or "A1")
+        r0, c0 = grid.get("startRowIndex", 0), grid.get("startColumnIndex", 0)
+        rows = _cells(values if values and isinstance(values[0], (list, tuple)) else [values or []])
+        self.client._call("write", lambda: self.client.backend.write(self.spreadsheet.id, self.title, r0, c0, rows))
+        return {"spreadsheetId": self.spreadsheet.id, "updatedRange": f"{self.title}!{range_name or 'A1'}",
+                "updatedRows": len(rows)}
+
+
+# --- 5. Sementes e configuração ---
+def seed_from_csv(client: FakeClient, seed_dir: str, default_spreadsheet: str):
+    """
+    Carrega CSVs (cabeçalho na 1ª linha) como abas:
+      seed_dir/<Aba>.csv              -> aba da planilha `default_spreadsheet`
+      seed_dir/<Planilha>/<Aba>.csv   -> aba da planilha <Planilha>
+    Abas que já têm dados (SQLite em arquivo) não são sobrescritas.
+    """
+    for entry in sorted(os.listdir(seed_dir)):
+        path = os.path.join(seed_dir, entry)
+        if os.path.isdir(path):
+            files = [(entry, os.path.join(path, f)) for f in sorted(os.listdir(path)) if f.lower().endswith(".csv")]
+        elif entry.lower().endswith(".csv"):
+            files = [(default_spreadsheet, path)]
+        else:
+            continue
+        for spreadsheet_title, csv_path in files:
+            key = client.backend.create_spreadsheet(spreadsheet_title)
+            tab = os.path.splitext(os.path.basename(csv_path))[0]
+            client.backend.create_tab(key, tab)
+            if client.backend.read(key, tab):
+                continue
+            with open(csv_path, newline="", encoding="utf-8-sig") as fh:
+                rows = list(csv.reader(fh))
+            if rows:
+                client.backend.write(key, tab, 0, 0, rows)
+
+def fake_config(secrets=None) -> dict:
+    """Configuração do fake (None = desligado). st.secrets[fake_gsheets] tem precedência sobre o ambiente."""
+    try:
+        section = dict(secrets.get(SECRETS_SECTION, {})) if secrets is not None else {}
+    except Exception:
+        section = {}
+    if section:
+        return section if section.get("enabled", True) else None
+    if os.environ.get(ENV_SWITCH, "").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    env = lambda name: os.environ.get(f"{ENV_SWITCH}_{name}")
+    return {
+        "path": env("PATH") or ":memory:",
+        "seed_dir": env("SEED"),
+        "latency": float(env("LATENCY") or 0),
+        "error_rate": float(env("ERROR_RATE") or 0),
+        "quota_per_min": int(env("QUOTA_PER_MIN")) if env("QUOTA_PER_MIN") else None,
+    }
+
+def make_fake_client(config: dict, default_spreadsheet: str) -> FakeClient:
+    latency = config.get("latency", 0.0)
+    client = FakeClient(
+        SQLiteBackend(config.get("path") or ":memory:"),
+        latency=tuple(latency) if isinstance(latency, (list, tuple)) else float(latency),
+        error_rate=float(config.get("error_rate", 0.0)),
+        quota_per_min=config.get("quota_per_min"),
+        autocreate=bool(config.get("autocreate", True)),
+    )
+    if config.get("seed_dir"):
+        seed_from_csv(client, config["seed_dir"], default_spreadsheet)
+    return client
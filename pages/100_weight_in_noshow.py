@@ -12,7 +12,7 @@
 # - Nenhuma outra mudança de layout/fluxo além do descrito acima
 # =============================================================================
 
-from components.layout import bootstrap_page
+from components.layout import bootstrap_page, show_data_age, show_delivery_status
 import streamlit as st
 import pandas as pd
 import re, html
@@ -24,7 +24,7 @@ try:
 except Exception:
     ZoneInfo = None
 
-from utils import get_gspread_client, connect_gsheet_tab
+from utils import invalidate_snapshot, store_derived, journal_queue, journal_discard, deliver_in_background, append_rows, tab_header, allocate_row_number, next_sequence, get_status_index, status_overlay
 
 # >>> Importante: não exigir auth aqui para não derrubar a Running Order
 bootstrap_page("Weight-in", require_auth=False)
@@ -71,7 +71,6 @@ st.session_state.setdefault("weighin_mode", "Check in")  # "Check in" | "Check o
 st.session_state.setdefault("weighin_event_selected", None)
 st.session_state.setdefault("weighin_local_mode", False)
 st.session_state.setdefault("weighin_buffer", [])
-st.session_state.setdefault("weighin_overlay", pd.DataFrame())
 
 # Sliders (sidebar) — display do Running Order
 st.session_state.setdefault("title_size", 56)
@@ -89,74 +88,59 @@ def _extract_event_num(ev: str) -> int:
     m = re.search(r"(\d+)$", str(ev))
     return int(m.group(1)) if m else 10**9
 
-@st.cache_data(ttl=600, show_spinner=False)
 def load_athletes() -> pd.DataFrame:
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET, Config.ATHLETES_TAB)
-        df = pd.DataFrame(ws.get_all_records())
-        if df.empty: return pd.DataFrame()
-        df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
-
-        if Config.COL_ROLE not in df.columns or Config.COL_INACTIVE not in df.columns:
-            return pd.DataFrame()
-
-        def _inactive_to_bool(x):
-            s = str(x).strip().upper()
-            return False if s in ("FALSE", "0", "") else True if s in ("TRUE", "1") else False
-
-        df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].apply(_inactive_to_bool)
-        df = df[(df[Config.COL_ROLE] == "1 - Fighter") & (df[Config.COL_INACTIVE] == False)].copy()
-
-        for c in [Config.COL_EVENT, Config.COL_IMAGE, Config.COL_FIGHT, Config.COL_CORNER]:
-            if c not in df.columns: df[c] = ""
-        df[Config.COL_EVENT] = df[Config.COL_EVENT].fillna(Config.DEFAULT_EVENT)
-        return df
+        return store_derived(Config.ATHLETES_TAB, "weighin_noshow:athletes", _prepare_athletes, Config.MAIN_SHEET)
     except Exception:
         return pd.DataFrame()
 
-@st.cache_data(ttl=120, show_spinner=False)
+def _prepare_athletes(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty: return pd.DataFrame()
+    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+
+    if Config.COL_ROLE not in df.columns or Config.COL_INACTIVE not in df.columns:
+        return pd.DataFrame()
+
+    def _inactive_to_bool(x):
+        s = str(x).strip().upper()
+        return False if s in ("FALSE", "0", "") else True if s in ("TRUE", "1") else False
+
+    df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].apply(_inactive_to_bool)
+    df = df[(df[Config.COL_ROLE] == "1 - Fighter") & (df[Config.COL_INACTIVE] == False)].copy()
+
+    for c in [Config.COL_EVENT, Config.COL_IMAGE, Config.COL_FIGHT, Config.COL_CORNER]:
+        if c not in df.columns: df[c] = ""
+    df[Config.COL_EVENT] = df[Config.COL_EVENT].fillna(Config.DEFAULT_EVENT)
+    return df
+
 def load_attendance() -> pd.DataFrame:
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET, Config.ATT_TAB)
-        df = pd.DataFrame(ws.get_all_records())
-        for c in Config.ATT_COLS:
-            if c not in df.columns: df[c] = ""
-        return df
+        return store_derived(Config.ATT_TAB, "weighin_noshow:attendance", _prepare_attendance, Config.MAIN_SHEET)
     except Exception:
         return pd.DataFrame(columns=Config.ATT_COLS)
 
-def _attendance_with_overlay() -> pd.DataFrame:
-    base = load_attendance().copy()
-    ov = st.session_state["weighin_overlay"]
-    if not ov.empty:
-        for c in Config.ATT_COLS:
-            if c not in ov.columns: ov[c] = ""
-        base = pd.concat([base, ov[Config.ATT_COLS]], ignore_index=True)
-    return base
+def _prepare_attendance(df: pd.DataFrame) -> pd.DataFrame:
+    for c in Config.ATT_COLS:
+        if c not in df.columns: df[c] = ""
+    return df
 
 def _events_from_athletes(df_ath: pd.DataFrame) -> list[str]:
     evts = [x for x in df_ath[Config.COL_EVENT].unique() if x and x != Config.DEFAULT_EVENT]
     evts_sorted = sorted(evts, key=_extract_event_num)  # menor número é padrão
     return evts_sorted
 
-def _last_status_for_event(df_att: pd.DataFrame, event: str) -> pd.DataFrame:
-    if df_att.empty: return pd.DataFrame(columns=["Athlete ID","Status","Notes","TS","Fighter"])
-    df = df_att.copy()
-    df = df[(df["Event"].astype(str)==str(event)) & (df["Task"].astype(str)==Config.TASK_NAME)]
-    if df.empty: return pd.DataFrame(columns=["Athlete ID","Status","Notes","TS","Fighter"])
-    ts = pd.to_datetime(df["TimeStamp"], format="%d/%m/%Y %H:%M:%S", errors="coerce")
-    df = df.assign(_ts=ts).sort_values(by=["Athlete ID","_ts"], ascending=[True, True])
-    latest = df.groupby("Athlete ID", as_index=False).tail(1)
-    latest["TS"] = latest["_ts"]
-    return latest[["Athlete ID","Status","Notes","TS","Fighter"]]
+def _last_status_for_event(df_ev: pd.DataFrame) -> pd.DataFrame:
+    """Último Weigh-in de cada atleta de df_ev: índice compartilhado da Attendance + linhas da sessão ainda não lidas."""
+    idx = get_status_index("id", Config.MAIN_SHEET)
+    overlay = status_overlay()
+    overlay.prune(idx)
+    return idx.join(df_ev[Config.COL_ID], df_ev[Config.COL_EVENT], (Config.TASK_NAME.lower(),), overlay)
 
 def _order_from_notes(x):
     try: return int(str(x).strip())
     except Exception: return None
 
-def _checked_partitions(df_ath: pd.DataFrame, df_att: pd.DataFrame, event: str, *, for_running_display: bool = False):
+def _checked_partitions(df_ath: pd.DataFrame, event: str, *, for_running_display: bool = False):
     """
     Particiona atletas em:
       - df_in  : último status = Check in
@@ -166,37 +150,18 @@ def _checked_partitions(df_ath: pd.DataFrame, df_att: pd.DataFrame, event: str,
       - __order__: número inteiro do running order (se houver)
       - __noshow__: True se último status foi No show
     """
-    last = _last_status_for_event(df_att, event)
-    last.index = last["Athlete ID"].astype(str)
-
-    def _row_status(row):
-        aid = str(row.get(Config.COL_ID, ""))
-        if aid in last.index:
-            stt = str(last.loc[aid, "Status"])
-            if stt == Config.STATUS_IN:
-                return "IN"
-            if stt == Config.STATUS_OUT:
-                return "OUT"
-            if stt == Config.STATUS_NOSHOW:
-                # No show aparece como OUT apenas no display (Running Order),
-                # e como NONE nas telas interativas (para poder fazer novo check in).
-                return "OUT" if for_running_display else "NONE"
-        return "NONE"
-
     df_ev = df_ath[df_ath[Config.COL_EVENT]==event].copy()
     if df_ev.empty: 
         return df_ev.copy(), df_ev.copy(), df_ev.copy()
 
-    df_ev["__st__"] = df_ev.apply(_row_status, axis=1)
-    df_ev["__order__"] = df_ev[Config.COL_ID].astype(str).map(
-        lambda aid: _order_from_notes(last.loc[str(aid), "Notes"]) if str(aid) in last.index else None
-    )
-
-    def _was_noshow(aid: str) -> bool:
-        if aid in last.index:
-            return str(last.loc[aid, "Status"]) == Config.STATUS_NOSHOW
-        return False
-    df_ev["__noshow__"] = df_ev[Config.COL_ID].astype(str).map(_was_noshow)
+    last = _last_status_for_event(df_ev)
+    # No show aparece como OUT apenas no display (Running Order),
+    # e como NONE nas telas interativas (para poder fazer novo check in).
+    st_map = {Config.STATUS_IN: "IN", Config.STATUS_OUT: "OUT",
+              Config.STATUS_NOSHOW: "OUT" if for_running_display else "NONE"}
+    df_ev["__st__"] = last["status"].map(st_map).fillna("NONE")
+    df_ev["__order__"] = last["notes"].map(_order_from_notes)
+    df_ev["__noshow__"] = last["status"].eq(Config.STATUS_NOSHOW)
 
     df_in  = df_ev[df_ev["__st__"]=="IN"].copy().sort_values(by=["__order__", Config.COL_NAME])
     df_out = df_ev[df_ev["__st__"]=="OUT"].copy().sort_values(by=[Config.COL_NAME])
@@ -204,55 +169,60 @@ def _checked_partitions(df_ath: pd.DataFrame, df_att: pd.DataFrame, event: str,
 
     return df_in, df_out, df_rest
 
-def _next_checkin_order(df_att: pd.DataFrame, event: str) -> int:
-    last = _last_status_for_event(df_att, event)
-    return 1 if last.empty else int((last["Status"]==Config.STATUS_IN).sum()) + 1
+def _max_checkin_order(df_att: pd.DataFrame, event: str) -> int:
+    """Maior número de running order já gravado (Notes dos 'Check in') no evento."""
+    if df_att.empty: return 0
+    df = df_att[(df_att["Event"].astype(str)==str(event)) & (df_att["Task"].astype(str)==Config.TASK_NAME)
+                & (df_att["Status"].astype(str)==Config.STATUS_IN)]
+    orders = pd.to_numeric(df["Notes"], errors="coerce").dropna()
+    return int(orders.max()) if not orders.empty else 0
+
+def _next_checkin_order(event: str) -> int:
+    # alocado no servidor (atômico entre mesas, sem ler a planilha); a Attendance só semeia o contador
+    return next_sequence("weighin", (event, Config.TASK_NAME),
+                         seed=lambda: max(_max_checkin_order(load_attendance(), event),
+                                          _max_checkin_order(pd.DataFrame(status_overlay().rows(), columns=Config.ATT_COLS), event)))
 
 # ---------------- Append helpers ----------------
-def _append_attendance_row(values: dict):
-    gc = get_gspread_client()
-    ws = connect_gsheet_tab(gc, Config.MAIN_SHEET, Config.ATT_TAB)
-
-    header = ws.row_values(1)
-    if not header:
-        header = Config.ATT_COLS[:]
-        ws.append_row(header, value_input_option="USER_ENTERED")
-
-    next_num = ""
-    if "#" in header:
-        col_idx = header.index("#") + 1
-        col_vals = ws.col_values(col_idx)
-        if len(col_vals) > 1:
-            last = None
-            for v in reversed(col_vals[1:]):
-                vv = str(v).strip()
-                if vv:
-                    last = vv; break
-            next_num = str(int(last) + 1) if (last and last.isdigit()) else str(len(col_vals))
-        else:
-            next_num = "1"
+def _attendance_rows(values_list: list) -> list:
+    """Linhas alinhadas ao cabeçalho; cabeçalho e "#" vêm do registro do processo (sem leitura)."""
+    header = tab_header(Config.ATT_TAB, Config.MAIN_SHEET, default=Config.ATT_COLS)
+    first = allocate_row_number(Config.ATT_TAB, Config.MAIN_SHEET, len(values_list)) if "#" in header else None
+
+    rows = []
+    for n, values in enumerate(values_list):
+        values = dict(values)
+        values["#"] = "" if first is None else str(first + n)
+        rows.append([values.get(col, "") for col in header])
+    return rows
+
+def _send_attendance_rows(values_list: list):
+    """
+    Modo local: todas as linhas num único values_append, em segundo plano (a mesa segue nos próximos atletas).
+    Estado de cada linha: show_delivery_status.
+    """
+    if not values_list:
+        return
+    deliver_in_background(Config.ATT_TAB, _attendance_rows(values_list), values_list, Config.MAIN_SHEET)
 
-    values = dict(values)
-    values["#"] = next_num
-    row = [values.get(col, "") for col in header]
-    ws.append_row(row, value_input_option="USER_ENTERED")
+def _append_attendance_row(values: dict):
+    """Modo direto: grava já e espera a confirmação do Sheets (erro sobe para quem chamou)."""
+    append_rows(Config.ATT_TAB, _attendance_rows([values]), Config.MAIN_SHEET)
 
 def _queue_overlay(values: dict):
-    df = st.session_state["weighin_overlay"]
-    new = pd.DataFrame([values], columns=Config.ATT_COLS)
-    st.session_state["weighin_overlay"] = pd.concat([df, new], ignore_index=True)
+    # diário local primeiro: a fila sobrevive a reload/restart até o ack do Sheets
+    values = journal_queue(Config.ATT_TAB, values, Config.MAIN_SHEET)
+    status_overlay().add(values)
     st.session_state["weighin_buffer"].append(values)
 
 def flush_buffer():
     if not st.session_state["weighin_buffer"]:
         st.info("No pending rows to save.")
         return
-    for row in st.session_state["weighin_buffer"]:
-        _append_attendance_row(row)
+    _send_attendance_rows(list(st.session_state["weighin_buffer"]))
     st.session_state["weighin_buffer"].clear()
-    st.session_state["weighin_overlay"] = pd.DataFrame()
-    load_attendance.clear()
-    st.success("Buffered rows saved.", icon="✅")
+    # o overlay segura os cards até o snapshot trazer as linhas (a aba fica suja quando o Sheets confirma)
+    st.success("Buffered rows queued for upload.", icon="📤")
     st.rerun()
 
 def _log_action(athlete_id: str, fighter_name: str, event: str, status: str, notes: str):
@@ -275,8 +245,12 @@ def _log_action(athlete_id: str, fighter_name: str, event: str, status: str, not
         _queue_overlay(payload)
         st.toast("Added to local buffer.", icon="📝")
     else:
-        _append_attendance_row(payload)
-        load_attendance.clear()
+        try:
+            _append_attendance_row(payload)
+        except Exception as e:
+            st.error(f"Error writing to sheet: {e}", icon="🚨")
+            return
+        invalidate_snapshot(tabs=(Config.ATT_TAB,))
         st.toast("Saved to sheet.", icon="💾")
     st.rerun()
 
@@ -385,10 +359,12 @@ def _settings_expander_top(events: list[str]):
                 flush_buffer()
         with c2:
             if st.button("Sync data", use_container_width=True):
-                st.session_state["weighin_overlay"] = pd.DataFrame()
+                status_overlay().discard(st.session_state["weighin_buffer"])
+                journal_discard(st.session_state["weighin_buffer"])
                 st.session_state["weighin_buffer"].clear()
-                load_attendance.clear()
+                invalidate_snapshot()
                 st.rerun()
+        show_delivery_status("weighin_delivery")
 
 def _settings_expander_bottom():
     """Somente no Running Order: no rodapé, fechado e sem 'Sync data'."""
@@ -445,18 +421,18 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-df_att_full = _attendance_with_overlay()
+show_data_age()
 
 # Particionamento:
 # - telas interativas: No show volta para disponíveis (NONE)
 # - display (running): No show aparece em OUT (coluna da direita) e vermelho
 if mode == "Running Order":
-    df_in, df_out, df_rest = _checked_partitions(df_ath, df_att_full, selected_event, for_running_display=True)
+    df_in, df_out, df_rest = _checked_partitions(df_ath, selected_event, for_running_display=True)
 else:
-    df_in, df_out, df_rest = _checked_partitions(df_ath, df_att_full, selected_event, for_running_display=False)
+    df_in, df_out, df_rest = _checked_partitions(df_ath, selected_event, for_running_display=False)
 
 def on_check_in(aid, name, event):
-    order_num = _next_checkin_order(_attendance_with_overlay(), event)
+    order_num = _next_checkin_order(event)
     _log_action(aid, name, event, Config.STATUS_IN, str(order_num))
 
 def on_check_out(aid, name, event):
@@ -8,11 +8,8 @@ st.title("Event Check")
 # --- 0. Import Libraries ---
 import streamlit as st
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
 from datetime import datetime
 import html
-import time
 
 # --- 1. Page Configuration ---
 st.set_page_config(page_title="UAEW | Transfer & Check-In", layout="wide")
@@ -24,49 +21,40 @@ USERS_TAB_NAME = "Users"
 DF_TRANSFERS_TAB_NAME = "df [Transfers]"
 
 # --- 2. Google Sheets Connection ---
-@st.cache_resource(ttl=3600)
-def get_gspread_client():
-    try:
-        scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-        creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=scope)
-        return gspread.authorize(creds)
-    except Exception as e: st.error(f"Erro API Google: {e}", icon="🚨"); st.stop()
-
-def connect_gsheet_tab(gspread_client, sheet_name: str, tab_name: str):
-    try:
-        spreadsheet = gspread_client.open(sheet_name)
-        return spreadsheet.worksheet(tab_name)
-    except gspread.exceptions.SpreadsheetNotFound: st.error(f"Erro: Planilha '{sheet_name}' não encontrada.", icon="🚨"); st.stop()
-    except gspread.exceptions.WorksheetNotFound: st.error(f"Erro: Aba '{tab_name}' não encontrada.", icon="🚨"); st.stop()
-    except Exception as e: st.error(f"Erro ao conectar à aba '{tab_name}': {e}", icon="🚨"); st.stop()
+from utils import snapshot_records, invalidate_snapshot, store_derived, get_upsert_tab
 
 # --- 3. Data Loading Functions ---
-@st.cache_data(ttl=600)
 def load_athlete_data():
     try:
-        gspread_client = get_gspread_client(); worksheet = connect_gsheet_tab(gspread_client, MAIN_SHEET_NAME, ATHLETES_TAB_NAME)
-        df = pd.DataFrame(worksheet.get_all_records())
-        if df.empty: return pd.DataFrame()
-        df.columns = df.columns.str.strip()
-        df["INACTIVE"] = df["INACTIVE"].astype(str).str.upper().map({'FALSE': False, 'TRUE': True, '': True}).fillna(True)
-        df = df[(df["ROLE"] == "1 - Fighter") & (df["INACTIVE"] == False)].copy()
-        for col_check in ["IMAGE", "NAME", "EVENT", "FIGHT NUMBER", "CORNER"]:
-            if col_check not in df.columns: df[col_check] = ""
-            df[col_check] = df[col_check].fillna("")
-        return df
+        return store_derived(ATHLETES_TAB_NAME, "event_check:athletes", _prepare_athlete_data, MAIN_SHEET_NAME)
     except Exception as e: st.error(f"Erro ao carregar atletas: {e}", icon="🚨"); return pd.DataFrame()
 
-@st.cache_data(ttl=120)
+def _prepare_athlete_data(df: pd.DataFrame):
+    if df.empty: return pd.DataFrame()
+    df.columns = df.columns.str.strip()
+    df["INACTIVE"] = df["INACTIVE"].astype(str).str.upper().map({'FALSE': False, 'TRUE': True, '': True}).fillna(True)
+    df = df[(df["ROLE"] == "1 - Fighter") & (df["INACTIVE"] == False)].copy()
+    for col_check in ["IMAGE", "NAME", "EVENT", "FIGHT NUMBER", "CORNER"]:
+        if col_check not in df.columns: df[col_check] = ""
+        df[col_check] = df[col_check].fillna("")
+    return df
+
+TRANSFER_KEY = ("athlete_id", "event")
+TRANSFER_HEADERS = ['check_in_id', 'athlete_id', 'athlete_name', 'event', 'bus_number',
+                    'passport_status', 'nails_status', 'cups_status', 'uniform_status', 'mouthguard_status',
+                    'corner_1_status', 'corner_2_status', 'corner_3_status', 'notes',
+                    'transfer_type', 'updated_by', 'updated_at', 'check_in_status']
+
+def transfer_table():
+    # Cópia local indexada por (athlete_id, event), compartilhada no processo (ver utils.UpsertTab)
+    return get_upsert_tab(DF_TRANSFERS_TAB_NAME, TRANSFER_KEY, MAIN_SHEET_NAME)
+
 def load_transfer_checkin_data():
-    try: 
-        gspread_client = get_gspread_client()
-        worksheet = connect_gsheet_tab(gspread_client, MAIN_SHEET_NAME, DF_TRANSFERS_TAB_NAME)
-        return pd.DataFrame(worksheet.get_all_records())
+    try: return pd.DataFrame(transfer_table().records())
     except Exception as e: st.error(f"Erro ao carregar dados de check-in/transfer: {e}", icon="🚨"); return pd.DataFrame()
 
-@st.cache_data(ttl=300)
 def load_users_data():
-    try: gspread_client = get_gspread_client(); worksheet = connect_gsheet_tab(gspread_client, MAIN_SHEET_NAME, USERS_TAB_NAME); return worksheet.get_all_records() or []
+    try: return snapshot_records(USERS_TAB_NAME, MAIN_SHEET_NAME) or []
     except Exception as e: st.error(f"Erro ao carregar usuários: {e}", icon="🚨"); return []
 
 def get_valid_user_info(user_input: str):
@@ -81,36 +69,20 @@ def get_valid_user_info(user_input: str):
 # --- 4. Data Writing Functions ---
 def save_checkin_record(data: dict):
     try:
-        gspread_client = get_gspread_client(); ws = connect_gsheet_tab(gspread_client, MAIN_SHEET_NAME, DF_TRANSFERS_TAB_NAME)
-        all_records = ws.get_all_records()
-        df_checkin = pd.DataFrame(all_records)
-        
-        existing_row_index = -1
-        if not df_checkin.empty and 'athlete_id' in df_checkin.columns and 'event' in df_checkin.columns:
-            match = df_checkin[(df_checkin['athlete_id'].astype(str) == str(data['athlete_id'])) & (df_checkin['event'] == data['event'])]
-            if not match.empty:
-                existing_row_index = match.index[0]
-
-        headers = ['check_in_id', 'athlete_id', 'athlete_name', 'event', 'bus_number', 
-                   'passport_status', 'nails_status', 'cups_status', 'uniform_status', 'mouthguard_status',
-                   'corner_1_status', 'corner_2_status', 'corner_3_status', 'notes',
-                   'transfer_type', 'updated_by', 'updated_at', 'check_in_status']
-        
-        if existing_row_index != -1:
-            row_to_update = existing_row_index + 2
-            cell_range = f'B{row_to_update}:{chr(ord("A")+len(headers)-1)}{row_to_update}'
-            update_values = [[str(data.get(h, "")) for h in headers if h != 'check_in_id']]
-            ws.update(cell_range, update_values, value_input_option="USER_ENTERED")
+        table = transfer_table()
+        existing = table.get((data['athlete_id'], data['event']))
+        data = {**{h: "" for h in TRANSFER_HEADERS}, **data}   # coluna ausente grava vazio, como antes
+
+        if existing is not None:
+            # um update só no intervalo da linha; check_in_id original preservado
+            data['check_in_id'] = existing.get('check_in_id', "")
+            table.upsert(data, TRANSFER_HEADERS, keep=('check_in_id',))
             st.success(f"Check-in de {data['athlete_name']} atualizado!");
         else:
-            next_id = int(df_checkin['check_in_id'].max()) + 1 if not df_checkin.empty and 'check_in_id' in df_checkin.columns and df_checkin['check_in_id'].notna().any() else 1
-            data['check_in_id'] = next_id
-            new_row = [data.get(h, "") for h in headers]
-            ws.append_row(new_row, value_input_option="USER_ENTERED")
+            data['check_in_id'] = table.max_int('check_in_id') + 1
+            table.upsert(data, TRANSFER_HEADERS)
             st.success(f"Check-in de {data['athlete_name']} salvo com sucesso!");
-        
-        time.sleep(2) # Pausa para garantir a consistência dos dados
-        load_transfer_checkin_data.clear()
+        # a cópia local já tem a gravação (read-your-writes): sem pausa nem releitura
         return data 
     except Exception as e: st.error(f"Erro ao salvar check-in: {e}", icon="🚨"); return None
 
@@ -135,7 +107,7 @@ if st.session_state.user_confirmed:
         st.selectbox("Filtrar Evento:", options=event_list, key="selected_event")
     with c2: st.selectbox("Filtrar Corner:", ["Todos os Corners", "Red", "Blue"], key="selected_corner")
     with c3: st.text_input("Pesquisar Lutador:", placeholder="Digite nome ou ID...", key="fighter_search_query")
-    with c4: st.markdown("<br>", True); st.button("🔄 Atualizar", on_click=lambda:(load_athlete_data.clear(), load_transfer_checkin_data.clear(), st.toast("Dados atualizados!")))
+    with c4: st.markdown("<br>", True); st.button("🔄 Atualizar", on_click=lambda:(invalidate_snapshot(), transfer_table().invalidate(), st.toast("Dados atualizados!")))
 
     st.markdown("---")
 
@@ -1,4 +1,4 @@
-from components.layout import bootstrap_page
+from components.layout import bootstrap_page, show_data_age
 import streamlit as st
 
 bootstrap_page("Medical Team")  # <- PRIMEIRA LINHA DA PÁGINA
@@ -9,8 +9,6 @@ st.title("Medical Team")
 # --- 0. Import Libraries ---
 import streamlit as st
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
 from datetime import datetime
 import html
 # import altair as alt # Removido, pois a seção de estatísticas foi removida
@@ -24,6 +22,7 @@ MAIN_SHEET_NAME = "UAEW_App"
 ATHLETES_TAB_NAME = "df"
 USERS_TAB_NAME = "Users"
 ATTENDANCE_TAB_NAME = "Attendance"
+ATTENDANCE_COLUMNS = ["#", "Event", "Athlete ID", "Name", "Task", "Status", "User", "Timestamp", "Notes"] # ordem das linhas gravadas (cabeçalho se a aba estiver vazia)
 ID_COLUMN_IN_ATTENDANCE = "Athlete ID"
 CONFIG_TAB_NAME = "Config"
 # NO_TASK_SELECTED_LABEL = "-- Choose Task --" # Não é mais necessário, pois a tarefa é fixa
@@ -55,67 +54,41 @@ STATUS_COLOR_MAP = {
 }
 
 # --- 2. Google Sheets Connection ---
-@st.cache_resource(ttl=3600)
-def get_gspread_client():
-    try:
-        scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-        if "gcp_service_account" not in st.secrets:
-            st.error("Erro: Credenciais `gcp_service_account` não encontradas.", icon="🚨"); st.stop()
-        creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=scope)
-        return gspread.authorize(creds)
-    except KeyError as e:
-        st.error(f"Erro config: Chave GCP ausente. Detalhes: {e}", icon="🚨"); st.stop()
-    except Exception as e:
-        st.error(f"Erro API Google: {e}", icon="🚨"); st.stop()
-
-def connect_gsheet_tab(gspread_client, sheet_name: str, tab_name: str):
-    try:
-        spreadsheet = gspread_client.open(sheet_name)
-        return spreadsheet.worksheet(tab_name)
-    except gspread.exceptions.SpreadsheetNotFound:
-        st.error(f"Erro: Planilha '{sheet_name}' não encontrada.", icon="🚨"); st.stop()
-    except gspread.exceptions.WorksheetNotFound:
-        st.error(f"Erro: Aba '{tab_name}' não encontrada em '{sheet_name}'.", icon="🚨"); st.stop()
-    except Exception as e:
-        st.error(f"Erro ao conectar à aba '{tab_name}': {e}", icon="🚨"); st.stop()
+from utils import snapshot_records, invalidate_snapshot, store_derived, show_notices, with_notices, append_rows, allocate_row_number, get_status_index
 
 # --- 3. Data Loading ---
-@st.cache_data(ttl=600)
 def load_athlete_data(sheet_name: str = MAIN_SHEET_NAME, athletes_tab_name: str = ATHLETES_TAB_NAME):
     try:
-        gspread_client = get_gspread_client()
-        worksheet = connect_gsheet_tab(gspread_client, sheet_name, athletes_tab_name)
-        data = worksheet.get_all_records()
-        if not data: return pd.DataFrame()
-        df = pd.DataFrame(data)
-        if df.empty: return pd.DataFrame()
-        if "ROLE" not in df.columns or "INACTIVE" not in df.columns:
-            st.error(f"Colunas 'ROLE'/'INACTIVE' não encontradas em '{athletes_tab_name}'.", icon="🚨"); return pd.DataFrame()
-        df.columns = df.columns.str.strip()
-        if df["INACTIVE"].dtype == 'object':
-            df["INACTIVE"] = df["INACTIVE"].astype(str).str.upper().map({'FALSE': False, 'TRUE': True, '': True}).fillna(True)
-        elif pd.api.types.is_numeric_dtype(df["INACTIVE"]):
-            df["INACTIVE"] = df["INACTIVE"].map({0: False, 1: True}).fillna(True)
-        df = df[(df["ROLE"] == "1 - Fighter") & (df["INACTIVE"] == False)].copy()
-        df["EVENT"] = df["EVENT"].fillna("Z") if "EVENT" in df.columns else "Z"
-        date_cols = ["DOB", "PASSPORT EXPIRE DATE", "BLOOD TEST"]
-        for col in date_cols:
-            if col in df.columns: df[col] = pd.to_datetime(df[col], errors="coerce").dt.strftime("%d/%m/%Y").fillna("")
-            else: df[col] = ""
-        for col_check in ["IMAGE", "PASSPORT IMAGE", "MOBILE"]:
-            df[col_check] = df[col_check].fillna("") if col_check in df.columns else ""
-        if "NAME" not in df.columns:
-            st.error(f"'NAME' não encontrada em '{athletes_tab_name}'.", icon="🚨"); return pd.DataFrame()
-        return df.sort_values(by=["EVENT", "NAME"]).reset_index(drop=True)
+        return show_notices(store_derived(athletes_tab_name, "medical:athletes", lambda data: _prepare_athlete_data(data, athletes_tab_name), sheet_name, source="record_dicts"))
     except Exception as e:
         st.error(f"Erro ao carregar atletas (gspread): {e}", icon="🚨"); return pd.DataFrame()
 
-@st.cache_data(ttl=300)
+def _prepare_athlete_data(data: list, athletes_tab_name: str):
+    if not data: return pd.DataFrame()
+    df = pd.DataFrame(data)
+    if df.empty: return pd.DataFrame()
+    if "ROLE" not in df.columns or "INACTIVE" not in df.columns:
+        return with_notices(pd.DataFrame(), ("error", f"Colunas 'ROLE'/'INACTIVE' não encontradas em '{athletes_tab_name}'."))
+    df.columns = df.columns.str.strip()
+    if df["INACTIVE"].dtype == 'object':
+        df["INACTIVE"] = df["INACTIVE"].astype(str).str.upper().map({'FALSE': False, 'TRUE': True, '': True}).fillna(True)
+    elif pd.api.types.is_numeric_dtype(df["INACTIVE"]):
+        df["INACTIVE"] = df["INACTIVE"].map({0: False, 1: True}).fillna(True)
+    df = df[(df["ROLE"] == "1 - Fighter") & (df["INACTIVE"] == False)].copy()
+    df["EVENT"] = df["EVENT"].fillna("Z") if "EVENT" in df.columns else "Z"
+    date_cols = ["DOB", "PASSPORT EXPIRE DATE", "BLOOD TEST"]
+    for col in date_cols:
+        if col in df.columns: df[col] = pd.to_datetime(df[col], errors="coerce").dt.strftime("%d/%m/%Y").fillna("")
+        else: df[col] = ""
+    for col_check in ["IMAGE", "PASSPORT IMAGE", "MOBILE"]:
+        df[col_check] = df[col_check].fillna("") if col_check in df.columns else ""
+    if "NAME" not in df.columns:
+        return with_notices(pd.DataFrame(), ("error", f"'NAME' não encontrada em '{athletes_tab_name}'."))
+    return df.sort_values(by=["EVENT", "NAME"]).reset_index(drop=True)
+
 def load_users_data(sheet_name: str = MAIN_SHEET_NAME, users_tab_name: str = USERS_TAB_NAME):
     try:
-        gspread_client = get_gspread_client()
-        worksheet = connect_gsheet_tab(gspread_client, sheet_name, users_tab_name)
-        return worksheet.get_all_records() or []
+        return snapshot_records(users_tab_name, sheet_name) or []
     except Exception as e:
         st.error(f"Erro ao carregar usuários '{users_tab_name}': {e}", icon="🚨"); return []
 
@@ -130,95 +103,59 @@ def get_valid_user_info(user_input: str, sheet_name: str = MAIN_SHEET_NAME, user
         if ps_sheet == val_id_input or ("PS" + ps_sheet) == proc_input or name_sheet == proc_input or ps_sheet == proc_input: return record
     return None
 
-@st.cache_data(ttl=600)
 def load_config_data(sheet_name: str = MAIN_SHEET_NAME, config_tab_name: str = CONFIG_TAB_NAME):
     try:
-        gspread_client = get_gspread_client()
-        worksheet = connect_gsheet_tab(gspread_client, sheet_name, config_tab_name)
-        data = worksheet.get_all_values()
-        if not data or len(data) < 1: st.error(f"Aba '{config_tab_name}' vazia/sem cabeçalho.", icon="🚨"); return [],[]
-        df_conf = pd.DataFrame(data[1:], columns=data[0])
-        tasks = df_conf["TaskList"].dropna().unique().tolist() if "TaskList" in df_conf.columns else []
-        if not tasks: st.warning(f"'TaskList' não encontrada/vazia em '{config_tab_name}'.", icon="⚠️")
-        return tasks, [] # Retorna lista de status vazia, pois usaremos status fixos definidos nas constantes
+        return show_notices(store_derived(config_tab_name, "medical:config", lambda data: _prepare_config_data(data, config_tab_name), sheet_name, source="values"))
     except Exception as e: st.error(f"Erro ao carregar config '{config_tab_name}': {e}", icon="🚨"); return [], []
 
-@st.cache_data(ttl=120)
-def load_attendance_data(sheet_name: str = MAIN_SHEET_NAME, attendance_tab_name: str = ATTENDANCE_TAB_NAME):
-    try:
-        gspread_client = get_gspread_client()
-        worksheet = connect_gsheet_tab(gspread_client, sheet_name, attendance_tab_name)
-        df_att = pd.DataFrame(worksheet.get_all_records())
-        if df_att.empty: return pd.DataFrame(columns=["#", "Event", ID_COLUMN_IN_ATTENDANCE, "Name", "Task", "Status", "User", "Timestamp", "Notes"])
-        expected_cols_order = ["#", "Event", ID_COLUMN_IN_ATTENDANCE, "Name", "Task", "Status", "User", "Timestamp", "Notes"]
-        for col in expected_cols_order:
-            if col not in df_att.columns: df_att[col] = pd.NA
-        return df_att
-    except Exception as e: st.error(f"Erro ao carregar presença '{attendance_tab_name}': {e}", icon="🚨"); return pd.DataFrame()
+def _prepare_config_data(data: list, config_tab_name: str):
+    if not data or len(data) < 1: return with_notices(([], []), ("error", f"Aba '{config_tab_name}' vazia/sem cabeçalho."))
+    df_conf = pd.DataFrame(data[1:], columns=data[0])
+    tasks = df_conf["TaskList"].dropna().unique().tolist() if "TaskList" in df_conf.columns else []
+    notices = [("warning", f"'TaskList' não encontrada/vazia em '{config_tab_name}'.")] if not tasks else []
+    return with_notices((tasks, []), *notices) # Retorna lista de status vazia, pois usaremos status fixos definidos nas constantes
 
 def registrar_log(ath_id: str, ath_name: str, ath_event: str, task: str, status: str, notes: str, user_log_id: str,
                   sheet_name: str = MAIN_SHEET_NAME, att_tab_name: str = ATTENDANCE_TAB_NAME):
     try:
-        gspread_client = get_gspread_client()
-        log_ws = connect_gsheet_tab(gspread_client, sheet_name, att_tab_name)
         ts = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
         user_ident = st.session_state.get('current_user_name', user_log_id) if st.session_state.get('user_confirmed') else user_log_id
-        next_num = len(log_ws.get_all_values()) + 1
+        next_num = allocate_row_number(att_tab_name, sheet_name)
         new_row_data = [str(next_num), ath_event, ath_id, ath_name, task, status, user_ident, ts, notes]
-        log_ws.append_row(new_row_data, value_input_option="USER_ENTERED")
+        append_rows(att_tab_name, [new_row_data], sheet_name, header_default=ATTENDANCE_COLUMNS)
         st.success(f"'{task}' para {ath_name} registrado como '{status}'.", icon="✍️")
-        load_attendance_data.clear() # Limpa o cache para recarregar dados
-        load_athlete_data.clear() # Limpa o cache para recarregar dados (se necessário, para exibir mudanças)
+        invalidate_snapshot(tabs=(att_tab_name,))
         return True
     except Exception as e:
         st.error(f"Erro ao registrar em '{att_tab_name}': {e}", icon="🚨")
         return False
 
 # --- Helper Function ---
-# Função atualizada para retornar status, usuário e timestamp
-def get_latest_status_and_user(athlete_id, task, attendance_df):
-    status = STATUS_PENDING
-    user = "N/A"
-    timestamp = "N/A"
-
-    if attendance_df.empty or task is None:
-        return status, user, timestamp
-
-    athlete_records = attendance_df[
-        (attendance_df[ID_COLUMN_IN_ATTENDANCE].astype(str) == str(athlete_id)) & 
-        (attendance_df["Task"] == task)
-    ].copy() # Use .copy() para evitar SettingWithCopyWarning
-
-    if athlete_records.empty:
-        return status, user, timestamp
-
-    if "Timestamp" in athlete_records.columns:
-        athlete_records['TS_dt'] = pd.to_datetime(athlete_records['Timestamp'], format="%d/%m/%Y %H:%M:%S", errors='coerce')
-        valid_records = athlete_records.dropna(subset=['TS_dt'])
-        if not valid_records.empty:
-            latest_record = valid_records.sort_values(by="TS_dt", ascending=False).iloc[0]
-        else: # Fallback se nenhum timestamp for válido, pega o último registro
-            latest_record = athlete_records.iloc[-1]
-    else: # Fallback se não houver coluna Timestamp
-        latest_record = athlete_records.iloc[-1]
-    
-    status_raw = latest_record.get("Status", STATUS_PENDING)
-    user = latest_record.get("User", "N/A")
-    timestamp = latest_record.get("Timestamp", "N/A")
-
-    # Mapeamento de status brutos da planilha para os novos status lógicos
+def map_medical_status(status_raw) -> str:
+    """Mapeamento de status brutos da planilha para os status lógicos."""
     if status_raw == "Done" or status_raw == STATUS_CLEAR_DOCTOR: # Trata "Done" antigo e o novo "Clear by Doctor" como o mesmo
-        status = STATUS_CLEAR_DOCTOR
-    elif status_raw == STATUS_UNDER_OBSERVATION:
-        status = STATUS_UNDER_OBSERVATION
-    elif status_raw == STATUS_STABLE_LOW_RISK:
-        status = STATUS_STABLE_LOW_RISK
-    elif status_raw == STATUS_SERIOUS_AMBULANCE:
-        status = STATUS_SERIOUS_AMBULANCE
-    else: # Inclui "Requested", "---", "Pending", "Not Registred" e qualquer outro não mapeado
-        status = STATUS_PENDING
-
-    return status, user, timestamp
+        return STATUS_CLEAR_DOCTOR
+    if status_raw in (STATUS_UNDER_OBSERVATION, STATUS_STABLE_LOW_RISK, STATUS_SERIOUS_AMBULANCE):
+        return status_raw
+    return STATUS_PENDING # Inclui "Requested", "---", "Pending", "Not Registred" e qualquer outro não mapeado
+
+# Status, usuário e timestamp do último registro (qualquer evento), do índice compartilhado da Attendance
+def get_latest_status_and_user(athlete_id, task, status_idx):
+    if task is None:
+        return STATUS_PENDING, "N/A", "N/A"
+    latest = status_idx.find(athlete_id, None, task)
+    if latest is None:
+        return STATUS_PENDING, "N/A", "N/A"
+    return map_medical_status(latest["status"]), latest["user"] or "N/A", latest["ts_raw"] or "N/A"
+
+def get_latest_status_for_all(athlete_ids: pd.Series, task, status_idx) -> pd.DataFrame:
+    """Mesmo que get_latest_status_and_user, para a coluna de IDs inteira numa passada."""
+    latest = status_idx.join(athlete_ids, None, task)
+    return pd.DataFrame({
+        'current_task_status': latest["status"].map(map_medical_status),
+        'latest_task_user': latest["user"].replace("", pd.NA).fillna("N/A"),
+        'latest_task_timestamp': latest["ts_raw"].replace("", pd.NA).fillna("N/A"),
+    })
 
 # --- 6. Main Application Logic ---
 st.title("UAEW | Task Control")
@@ -274,7 +211,8 @@ if st.session_state.user_confirmed and st.session_state.current_user_name!="User
     with st.spinner("Carregando dados..."):
         tasks_raw, _ = load_config_data() # Ainda carregamos todas as tarefas para o multibox de badges
         df_athletes = load_athlete_data()
-        df_attendance = load_attendance_data()
+        status_idx = get_status_index("id", MAIN_SHEET_NAME)
+    show_data_age()
 
     # REMOVIDA: A seleção da tarefa (selectbox)
     # A tarefa selecionada é agora fixada como "Medical"
@@ -282,8 +220,8 @@ if st.session_state.user_confirmed and st.session_state.current_user_name!="User
 
     if sel_task_actual: # Esta condição agora sempre será verdadeira
         # Aplica a função de status e usuário/timestamp a todo o DataFrame
-        df_athletes[['current_task_status', 'latest_task_user', 'latest_task_timestamp']] = df_athletes['ID'].apply(
-            lambda id: pd.Series(get_latest_status_and_user(id, sel_task_actual, df_attendance))
+        df_athletes[['current_task_status', 'latest_task_user', 'latest_task_timestamp']] = get_latest_status_for_all(
+            df_athletes['ID'], sel_task_actual, status_idx
         )
         st.divider() # Mantém o divisor para separação visual
 
@@ -403,7 +341,7 @@ if st.session_state.user_confirmed and st.session_state.current_user_name!="User
                         continue # Pula esta tarefa se ela não estiver selecionada no multiselect
                     
                     # Obtém o status, usuário e timestamp para a tarefa atual no loop
-                    status_for_badge, user_for_badge, ts_for_badge = get_latest_status_and_user(ath_id_d, task_name_in_badge_list, df_attendance)
+                    status_for_badge, user_for_badge, ts_for_badge = get_latest_status_and_user(ath_id_d, task_name_in_badge_list, status_idx)
                     
                     # Usa o mapa de cores para o status da tarefa
                     color = STATUS_COLOR_MAP.get(status_for_badge, STATUS_COLOR_MAP[STATUS_PENDING])
@@ -1,4 +1,4 @@
-from components.layout import bootstrap_page
+from components.layout import bootstrap_page, show_data_age
 import streamlit as st
 from datetime import datetime
 from streamlit_autorefresh import st_autorefresh
@@ -7,7 +7,7 @@ import html
 from typing import List, Dict
 
 # Helpers centralizados (evita duplicar código de credenciais e conexão)
-from utils import get_gspread_client, connect_gsheet_tab
+from utils import store_derived, invalidate_snapshot, get_status_index, StatusIndex
 
 # ------------------------------------------------------------------------------
 # Bootstrap da página (config/layout/sidebar centralizados)
@@ -26,12 +26,6 @@ FIGHTCARD_SHEET_URL = (
 )
 
 ATTENDANCE_TAB_NAME = "Attendance"
-ATTENDANCE_ATHLETE_ID_COL = "Athlete ID"
-ATTENDANCE_TASK_COL = "Task"
-ATTENDANCE_STATUS_COL = "Status"
-ATTENDANCE_TIMESTAMP_COL = "Timestamp"     # pode vir vazio
-ATTENDANCE_TIMESTAMP_ALT_COL = "TimeStamp" # onde gravamos
-ATTENDANCE_EVENT_COL = "Event"
 
 FC_EVENT_COL = "Event"
 FC_FIGHTER_COL = "Fighter"
@@ -114,85 +108,39 @@ def load_fightcard_data() -> pd.DataFrame:
         return pd.DataFrame(columns=[FC_EVENT_COL, FC_FIGHTER_COL, FC_ATHLETE_ID_COL, FC_CORNER_COL, FC_ORDER_COL, FC_PICTURE_COL, FC_DIVISION_COL])
 
 
-@st.cache_data(ttl=120)
-def load_attendance_data(sheet_name=MAIN_SHEET_NAME, attendance_tab_name=ATTENDANCE_TAB_NAME) -> pd.DataFrame:
-    try:
-        gspread_client = get_gspread_client()
-        worksheet = connect_gsheet_tab(gspread_client, sheet_name, attendance_tab_name)
-        df_att = pd.DataFrame(worksheet.get_all_records())
-        if df_att.empty:
-            return pd.DataFrame(columns=[ATTENDANCE_ATHLETE_ID_COL, ATTENDANCE_TASK_COL, ATTENDANCE_STATUS_COL, ATTENDANCE_EVENT_COL, ATTENDANCE_TIMESTAMP_COL, ATTENDANCE_TIMESTAMP_ALT_COL])
-
-        # Normalizações e garantia de colunas
-        for col in [ATTENDANCE_ATHLETE_ID_COL, ATTENDANCE_TASK_COL, ATTENDANCE_STATUS_COL, ATTENDANCE_EVENT_COL, ATTENDANCE_TIMESTAMP_COL, ATTENDANCE_TIMESTAMP_ALT_COL]:
-            if col not in df_att.columns:
-                df_att[col] = ""
-            df_att[col] = df_att[col].astype(str).str.strip()
-
-        return df_att
-    except Exception as e:
-        st.error(f"Error loading Attendance: {e}", icon="🚨")
-        return pd.DataFrame(columns=[ATTENDANCE_ATHLETE_ID_COL, ATTENDANCE_TASK_COL, ATTENDANCE_STATUS_COL, ATTENDANCE_EVENT_COL, ATTENDANCE_TIMESTAMP_COL, ATTENDANCE_TIMESTAMP_ALT_COL])
-
-
-@st.cache_data(ttl=600)
 def get_task_list(sheet_name=MAIN_SHEET_NAME, config_tab=CONFIG_TAB_NAME) -> List[str]:
     try:
-        gspread_client = get_gspread_client()
-        worksheet = connect_gsheet_tab(gspread_client, sheet_name, config_tab)
-        data = worksheet.get_all_values()
-        if not data or len(data) < 1:
-            return []
-        df_conf = pd.DataFrame(data[1:], columns=data[0])
-        return df_conf["TaskList"].dropna().astype(str).str.strip().unique().tolist() if "TaskList" in df_conf.columns else []
+        return store_derived(config_tab, "dashboard:tasks", _prepare_task_list, sheet_name, source="values")
     except Exception as e:
         st.error(f"Error loading TaskList from Config: {e}", icon="🚨")
         return []
 
+def _prepare_task_list(data: list) -> List[str]:
+    if not data or len(data) < 1:
+        return []
+    df_conf = pd.DataFrame(data[1:], columns=data[0])
+    return df_conf["TaskList"].dropna().astype(str).str.strip().unique().tolist() if "TaskList" in df_conf.columns else []
+
 # ------------------------------------------------------------------------------
 # Lógica
 # ------------------------------------------------------------------------------
-def _latest_status_row(relevant_records: pd.DataFrame) -> pd.Series | None:
-    """
-    Retorna a linha mais recente, considerando primeiro TimeStamp (ALT) e depois Timestamp.
-    """
-    if relevant_records.empty:
-        return None
-
-    df = relevant_records.copy()
-    df["TS_dt_alt"] = pd.to_datetime(df.get(ATTENDANCE_TIMESTAMP_ALT_COL, ""), format="%d/%m/%Y %H:%M:%S", errors="coerce")
-    df["TS_dt"] = pd.to_datetime(df.get(ATTENDANCE_TIMESTAMP_COL, ""), errors="coerce", dayfirst=True)
-    df["TS_best"] = df["TS_dt_alt"].where(df["TS_dt_alt"].notna(), df["TS_dt"])
-    df = df.sort_values(by=["TS_best"], ascending=False, na_position="last")
-    return df.iloc[0] if not df.empty else None
-
-
-def get_task_status(athlete_id: str, task_name: str, event_name: str, df_attendance: pd.DataFrame) -> dict:
+def get_task_status(athlete_id: str, task_name: str, event_name: str, status_idx: StatusIndex) -> dict:
     """
     Retorna {class, text} para colorir a célula do grid.
-    Faz matching por Athlete ID + Task + Event e mapeia Status de forma case-insensitive.
+    Consulta O(1) no índice compartilhado da Attendance por (Athlete ID, Event, Task);
+    o Status é mapeado de forma case-insensitive.
     """
     if (
-        df_attendance.empty
-        or not str(athlete_id).strip()
+        not str(athlete_id).strip()
         or not str(task_name).strip()
         or not str(event_name).strip()
     ):
         return STATUS_INFO_NORM["pending"]
 
-    mask = (
-        (df_attendance[ATTENDANCE_ATHLETE_ID_COL] == str(athlete_id).strip())
-        & (df_attendance[ATTENDANCE_TASK_COL] == str(task_name).strip())
-        & (df_attendance[ATTENDANCE_EVENT_COL] == str(event_name).strip())
-    )
-    relevant = df_attendance.loc[mask]
-    if relevant.empty:
+    latest = status_idx.find(athlete_id, event_name, task_name)
+    if latest is None:
         return STATUS_INFO_NORM["pending"]
-
-    last_row = _latest_status_row(relevant)
-    latest_status_str = str(last_row[ATTENDANCE_STATUS_COL]).strip() if last_row is not None else "Pending"
-    key = _normalize_status_key(latest_status_str)
-    return STATUS_INFO_NORM.get(key, STATUS_INFO_NORM["pending"])
+    return STATUS_INFO_NORM.get(_normalize_status_key(latest["status"]), STATUS_INFO_NORM["pending"])
 
 # ------------------------------------------------------------------------------
 # NOVO: contadores totais de "Requested" por tarefa (Blue+Red)
@@ -402,13 +350,15 @@ st_autorefresh(interval=60_000, key="dash_auto_refresh_v17")
 
 with st.spinner("Loading data..."):
     df_fc = load_fightcard_data()
-    df_att = load_attendance_data()
+    status_idx = get_status_index("id", MAIN_SHEET_NAME)
     all_tsks = get_task_list()
+show_data_age()
 
 # Sidebar
 st.sidebar.title("Dashboard Controls")
 if st.sidebar.button("🔄 Refresh Now", use_container_width=True):
     st.cache_data.clear()
+    invalidate_snapshot()
     st.toast("Data refreshed!", icon="🎉")
     st.rerun()
 
@@ -491,7 +441,7 @@ for (ev, f_ord), group in df_fc_disp.sort_values(by=[FC_EVENT_COL, FC_ORDER_COL]
         row_d["Foto Azul"] = pic if isinstance(pic, str) and pic.startswith(("http://", "https://")) else "https://via.placeholder.com/50?text=N/A"
         row_d["Lutador Azul"] = f"{name}"
         for task in selected_tasks:
-            row_d[f"{task} (Azul)"] = get_task_status(athlete_id, task, ev, df_att)
+            row_d[f"{task} (Azul)"] = get_task_status(athlete_id, task, ev, status_idx)
     else:
         row_d["Foto Azul"] = "https://via.placeholder.com/50?text=N/A"
         row_d["Lutador Azul"] = "N/A"
@@ -506,7 +456,7 @@ for (ev, f_ord), group in df_fc_disp.sort_values(by=[FC_EVENT_COL, FC_ORDER_COL]
         row_d["Foto Vermelho"] = pic if isinstance(pic, str) and pic.startswith(("http://", "https://")) else "https://via.placeholder.com/50?text=N/A"
         row_d["Lutador Vermelho"] = f"{name}"
         for task in selected_tasks:
-            row_d[f"{task} (Vermelho)"] = get_task_status(athlete_id, task, ev, df_att)
+            row_d[f"{task} (Vermelho)"] = get_task_status(athlete_id, task, ev, status_idx)
     else:
         row_d["Foto Vermelho"] = "https://via.placeholder.com/50?text=N/A"
         row_d["Lutador Vermelho"] = "N/A"
@@ -9,50 +9,43 @@ bootstrap_page("Arrival List")
 st.title("Arrival List")
 
 # --- Project Imports ---
-from utils import get_gspread_client, connect_gsheet_tab
+from utils import store_derived, show_notices, with_notices
 
 # --- Constants ---
 MAIN_SHEET_NAME = "UAEW_App"
 DATA_TAB_NAME = "df"
+# Só estas colunas do df (aba larga) são lidas
+ARRIVAL_COLUMNS = [
+    'INACTIVE', 'ID', 'ROLE', 'CORNER', 'NAME',
+    'ArrivalFlight', 'ArrivalDate', 'ArrivalTime', 'ArrivalAirport',
+    'transfer_arrival_status', 'transfer_arrival_car', 'transfer_arrival_driver'
+]
+ARRIVAL_DTYPES = {'INACTIVE': 'bool', 'CORNER': 'category'}
 
 # --- Data Loading ---
-@st.cache_data(ttl=600)
 def load_arrival_data(sheet_name: str = MAIN_SHEET_NAME, data_tab_name: str = DATA_TAB_NAME):
     """Loads and processes arrival data from the Google Sheet."""
     try:
-        gspread_client = get_gspread_client()
-        worksheet = connect_gsheet_tab(gspread_client, sheet_name, data_tab_name)
-        data = worksheet.get_all_records()
-        if not data:
-            return pd.DataFrame()
-        
-        df = pd.DataFrame(data)
-        if df.empty:
-            return pd.DataFrame()
-
-        # mantém apenas colunas relevantes que existirem
-        display_cols = [
-            'INACTIVE', 'ID', 'ROLE', 'CORNER', 'NAME',
-            'ArrivalFlight', 'ArrivalDate', 'ArrivalTime', 'ArrivalAirport',
-            'transfer_arrival_status', 'transfer_arrival_car', 'transfer_arrival_driver'
-        ]
-        existing_cols = [c for c in display_cols if c in df.columns]
-        df = df[existing_cols]
-
-        # NAME é essencial
-        if 'NAME' in df.columns:
-            df.dropna(subset=['NAME'], inplace=True)
-            df = df[df['NAME'].astype(str).str.strip() != ''].copy()
-        else:
-            st.error("The 'NAME' column is essential and was not found in the sheet.")
-            return pd.DataFrame()
-
-        return df
-        
+        return show_notices(store_derived(data_tab_name, "arrival:athletes", _prepare_arrival_data, sheet_name,
+                                          columns=ARRIVAL_COLUMNS, dtypes=ARRIVAL_DTYPES))
     except Exception as e:
         st.error(f"Error loading arrival data: {e}", icon="🚨")
         return pd.DataFrame()
 
+def _prepare_arrival_data(df: pd.DataFrame):
+    # já vem só com as colunas relevantes que existirem (ARRIVAL_COLUMNS)
+    if df.empty:
+        return pd.DataFrame()
+
+    # NAME é essencial
+    if 'NAME' in df.columns:
+        df.dropna(subset=['NAME'], inplace=True)
+        df = df[df['NAME'].astype(str).str.strip() != ''].copy()
+    else:
+        return with_notices(pd.DataFrame(), ("error", "The 'NAME' column is essential and was not found in the sheet."))
+
+    return df
+
 def highlight_today(row):
     today = datetime.datetime.now().strftime('%d/%m')
     if 'ArrivalDate' in row and str(row['ArrivalDate']) == today:
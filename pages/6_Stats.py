@@ -23,7 +23,7 @@
 #   - Append no Attendance alinhado ao cabeçalho real (ordem correta).
 # ==============================================================================
 
-from components.layout import bootstrap_page
+from components.layout import bootstrap_page, show_data_age
 import streamlit as st
 import pandas as pd
 import numpy as np
@@ -38,7 +38,9 @@ bootstrap_page("Stats")
 st.title("Stats")
 
 # --- Project Imports ---
-from utils import get_gspread_client, connect_gsheet_tab
+from utils import snapshot_records, invalidate_snapshot, store_derived, show_notices, with_notices, append_rows, ROSTER_DTYPES, tab_header, allocate_row_number, get_status_index
+from status_index import format_dates
+from ts_parse import parse_ts_series
 
 # ==============================================================================
 # CONSTANTES & CONFIG
@@ -76,6 +78,9 @@ class Config:
     COL_CORNER = "corner"
     COL_PASSPORT_IMAGE = "passport_image"
     COL_ROOM = "room"
+    # Só estas colunas do df (aba larga) são lidas, já tipadas
+    ATHLETE_COLUMNS = [COL_ID, COL_NAME, COL_EVENT, COL_ROLE, COL_INACTIVE, COL_IMAGE, COL_MOBILE,
+                       COL_FIGHT_NUMBER, COL_CORNER, COL_PASSPORT_IMAGE, COL_ROOM]
 
     DEFAULT_EVENT_PLACEHOLDER = "Z"
 
@@ -157,21 +162,6 @@ def clean_and_normalize(text: str) -> str:
     text = "".join([c for c in text if not unicodedata.combining(c)])
     return " ".join(text.split())
 
-def parse_ts_series(raw: pd.Series) -> pd.Series:
-    if raw is None or raw.empty:
-        return pd.Series([], dtype='datetime64[ns]')
-    tries = [
-        pd.to_datetime(raw, format="%d/%m/%Y %H:%M:%S", errors="coerce"),
-        pd.to_datetime(raw, format="%d/%m/%Y", errors="coerce"),
-        pd.to_datetime(raw, format="%d-%m-%Y %H:%M:%S", errors="coerce"),
-        pd.to_datetime(raw, format="%d-%m-%Y", errors="coerce"),
-        pd.to_datetime(raw, errors="coerce"),
-    ]
-    ts_final = tries[0]
-    for cand in tries[1:]:
-        ts_final = ts_final.fillna(cand)
-    return ts_final
-
 def _clean_str_series(s: pd.Series) -> pd.Series:
     if s is None or s.empty:
         return pd.Series([], dtype=str)
@@ -209,73 +199,68 @@ def field_is_empty(value) -> bool:
 # ==============================================================================
 # DATA LOADING
 # ==============================================================================
-@st.cache_data(ttl=600)
 def load_athletes() -> pd.DataFrame:
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET_NAME, Config.ATHLETES_TAB_NAME)
-        df = pd.DataFrame(ws.get_all_records())
-        if df.empty:
-            return pd.DataFrame()
-        df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
-
-        if Config.COL_ROLE not in df.columns or Config.COL_INACTIVE not in df.columns:
-            st.error("Columns 'ROLE'/'INACTIVE' not found in athletes sheet.", icon="🚨")
-            return pd.DataFrame()
-
-        if df[Config.COL_INACTIVE].dtype == "object":
-            df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].astype(str).str.upper().map(
-                {"FALSE": False, "TRUE": True, "": True}
-            ).fillna(True)
-        elif pd.api.types.is_numeric_dtype(df[Config.COL_INACTIVE]):
-            df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].map({0: False, 1: True}).fillna(True)
-
-        df = df[(df[Config.COL_ROLE] == "1 - Fighter") & (df[Config.COL_INACTIVE] == False)].copy()
-
-        df[Config.COL_EVENT] = df.get(Config.COL_EVENT, "").fillna(Config.DEFAULT_EVENT_PLACEHOLDER)
-        for col in [Config.COL_IMAGE, Config.COL_MOBILE, Config.COL_FIGHT_NUMBER, Config.COL_CORNER,
-                    Config.COL_PASSPORT_IMAGE, Config.COL_ROOM]:
-            if col not in df.columns:
-                df[col] = ""
-            else:
-                df[col] = df[col].fillna("")
-
-        if Config.COL_NAME not in df.columns or Config.COL_ID not in df.columns:
-            st.error("'name' or 'id' missing in athletes sheet.", icon="🚨")
-            return pd.DataFrame()
-
-        return df.sort_values(by=[Config.COL_EVENT, Config.COL_NAME]).reset_index(drop=True)
+        return show_notices(store_derived(Config.ATHLETES_TAB_NAME, "stats:athletes", _prepare_athletes, Config.MAIN_SHEET_NAME,
+                                          columns=Config.ATHLETE_COLUMNS, dtypes=ROSTER_DTYPES))
     except Exception as e:
         st.error(f"Error loading athletes: {e}", icon="🚨")
         return pd.DataFrame()
 
-@st.cache_data(ttl=120)
+def _prepare_athletes(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        return pd.DataFrame()
+
+    if Config.COL_ROLE not in df.columns or Config.COL_INACTIVE not in df.columns:
+        return with_notices(pd.DataFrame(), ("error", "Columns 'ROLE'/'INACTIVE' not found in athletes sheet."))
+
+    # inactive já vem booleano; vazio/desconhecido conta como inativo
+    df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].fillna(True).astype(bool)
+
+    df = df[(df[Config.COL_ROLE] == "1 - Fighter") & (df[Config.COL_INACTIVE] == False)].copy()
+
+    df[Config.COL_EVENT] = df.get(Config.COL_EVENT, "").fillna(Config.DEFAULT_EVENT_PLACEHOLDER)
+    for col in [Config.COL_IMAGE, Config.COL_MOBILE, Config.COL_CORNER,
+                Config.COL_PASSPORT_IMAGE, Config.COL_ROOM]:
+        if col not in df.columns:
+            df[col] = ""
+        else:
+            df[col] = df[col].fillna("")
+    if Config.COL_FIGHT_NUMBER not in df.columns:
+        df[Config.COL_FIGHT_NUMBER] = pd.Series(pd.NA, index=df.index, dtype="Int64")
+
+    if Config.COL_NAME not in df.columns or Config.COL_ID not in df.columns:
+        return with_notices(pd.DataFrame(), ("error", "'name' or 'id' missing in athletes sheet."))
+
+    return df.sort_values(by=[Config.COL_EVENT, Config.COL_NAME]).reset_index(drop=True)
+
 def load_attendance() -> pd.DataFrame:
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET_NAME, Config.ATTENDANCE_TAB_NAME)
-        df_att = pd.DataFrame(ws.get_all_records())
-        if df_att.empty:
-            return pd.DataFrame(columns=[
-                Config.ATT_COL_ROWID, Config.ATT_COL_EVENT, Config.ATT_COL_ATHLETE_ID,
-                Config.ATT_COL_NAME, Config.ATT_COL_FIGHTER, Config.ATT_COL_TASK, Config.ATT_COL_STATUS,
-                Config.ATT_COL_USER, Config.ATT_COL_TIMESTAMP, Config.ATT_COL_TIMESTAMP_ALT, Config.ATT_COL_NOTES
-            ])
-        for col in [
-            Config.ATT_COL_ROWID, Config.ATT_COL_EVENT, Config.ATT_COL_ATHLETE_ID,
-            Config.ATT_COL_NAME, Config.ATT_COL_FIGHTER, Config.ATT_COL_TASK, Config.ATT_COL_STATUS,
-            Config.ATT_COL_USER, Config.ATT_COL_TIMESTAMP, Config.ATT_COL_TIMESTAMP_ALT, Config.ATT_COL_NOTES
-        ]:
-            if col not in df_att.columns:
-                df_att[col] = pd.NA
-        df_att[Config.ATT_COL_ATHLETE_ID] = df_att[Config.ATT_COL_ATHLETE_ID].astype(str)
-        return df_att
+        return store_derived(Config.ATTENDANCE_TAB_NAME, "stats:attendance_norm",
+                             lambda df: preprocess_attendance(_prepare_attendance(df)), Config.MAIN_SHEET_NAME)
     except Exception as e:
         st.error(f"Error loading attendance: {e}", icon="🚨")
         return pd.DataFrame()
 
-@st.cache_data(ttl=120)
+def _prepare_attendance(df_att: pd.DataFrame) -> pd.DataFrame:
+    if df_att.empty:
+        return pd.DataFrame(columns=[
+            Config.ATT_COL_ROWID, Config.ATT_COL_EVENT, Config.ATT_COL_ATHLETE_ID,
+            Config.ATT_COL_NAME, Config.ATT_COL_FIGHTER, Config.ATT_COL_TASK, Config.ATT_COL_STATUS,
+            Config.ATT_COL_USER, Config.ATT_COL_TIMESTAMP, Config.ATT_COL_TIMESTAMP_ALT, Config.ATT_COL_NOTES
+        ])
+    for col in [
+        Config.ATT_COL_ROWID, Config.ATT_COL_EVENT, Config.ATT_COL_ATHLETE_ID,
+        Config.ATT_COL_NAME, Config.ATT_COL_FIGHTER, Config.ATT_COL_TASK, Config.ATT_COL_STATUS,
+        Config.ATT_COL_USER, Config.ATT_COL_TIMESTAMP, Config.ATT_COL_TIMESTAMP_ALT, Config.ATT_COL_NOTES
+    ]:
+        if col not in df_att.columns:
+            df_att[col] = pd.NA
+    df_att[Config.ATT_COL_ATHLETE_ID] = df_att[Config.ATT_COL_ATHLETE_ID].astype(str)
+    return df_att
+
 def preprocess_attendance(df_attendance: pd.DataFrame) -> pd.DataFrame:
+    """Colunas normalizadas e TS_dt; roda dentro do loader, uma vez por versão da Attendance."""
     if df_attendance is None or df_attendance.empty:
         return pd.DataFrame()
     df = df_attendance.copy()
@@ -299,10 +284,8 @@ def preprocess_attendance(df_attendance: pd.DataFrame) -> pd.DataFrame:
 @st.cache_data(ttl=600)
 def load_stats() -> pd.DataFrame:
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET_NAME, Config.STATS_TAB_NAME)
-        df = pd.DataFrame(ws.get_all_records())
-        return df
+        # aba fora do snapshot: servida pelo espelho local quando configurado
+        return pd.DataFrame(snapshot_records(Config.STATS_TAB_NAME, Config.MAIN_SHEET_NAME))
     except Exception as e:
         st.error(f"Error loading stats: {e}", icon="🚨")
         return pd.DataFrame()
@@ -310,38 +293,21 @@ def load_stats() -> pd.DataFrame:
 # ==============================================================================
 # “LAST DONE” — PELO NOME (fighter_norm) para a tarefa fixa
 # ==============================================================================
-@st.cache_data(ttl=600, show_spinner=False)
-def last_done_for_task_by_name(
-    df_attendance: pd.DataFrame,
-    athlete_name: str,
-    fixed_task: str,
-    aliases: list[str],
-) -> tuple[str, str]:
-    if df_attendance is None or df_attendance.empty:
-        return "N/A", ""
-
-    name_n = clean_and_normalize(athlete_name)
-    if not name_n:
-        return "N/A", ""
-
-    task_is   = make_task_mask(df_attendance["task_norm"], fixed_task, aliases)
-    status_is = df_attendance["status_norm"] == "done"
-    name_is   = df_attendance["fighter_norm"] == name_n
-
-    cand = df_attendance[task_is & status_is & name_is].copy()
-    if cand.empty:
-        return "N/A", ""
-
-    cand["__idx__"] = np.arange(len(cand))
-    cand = cand.sort_values(by=["TS_dt", "__idx__"], ascending=[False, False])
-    row = cand.iloc[0]
-
-    event_label = str(row.get(Config.ATT_COL_EVENT, "")).strip()
-    if pd.notna(row.get("TS_dt", pd.NaT)):
-        dt_str = row["TS_dt"].strftime("%d/%m/%Y")
-    else:
-        dt_str = _fmt_date_from_text(row.get("TS_raw", row.get(Config.ATT_COL_TIMESTAMP_ALT, row.get(Config.ATT_COL_TIMESTAMP, ""))))
-    return (dt_str if dt_str else "N/A"), event_label
+def last_done_for_task(df_athletes: pd.DataFrame, fixed_task: str, aliases: list[str]) -> pd.DataFrame:
+    """
+    (last_dt, last_event) do último Done da tarefa (qualquer evento) para o roster inteiro,
+    alinhado ao índice de df_athletes: uma consulta ao índice compartilhado da Attendance.
+    """
+    if df_athletes is None or df_athletes.empty:
+        return pd.DataFrame(columns=["last_dt", "last_event"])
+    status_idx = get_status_index("name", Config.MAIN_SHEET_NAME)
+    last = status_idx.last_done(df_athletes[Config.COL_NAME], None,
+                                status_idx.task_keys(fixed_task, aliases, regex=True))
+    dated = format_dates(last["ts"], default="")
+    return pd.DataFrame({
+        "last_dt": dated.where(dated != "", last["ts_raw"].map(_fmt_date_from_text)),
+        "last_event": last["event"].fillna("").astype(str).str.strip(),
+    }, index=df_athletes.index)
 
 # ==============================================================================
 # OUTRAS TAREFAS — chips (apenas Done/Requested)
@@ -407,10 +373,6 @@ def chips_for_other_tasks(
 # ==============================================================================
 def add_stats_record(row_dict: dict) -> bool:
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET_NAME, Config.STATS_TAB_NAME)
-        all_vals = ws.get_all_values()
-
         default_header = [
             'stats_record_id', 'fighter_id', 'fighter_event_name', 'gender',
             'weight_kg', 'height_cm', 'reach_cm', 'fight_style',
@@ -418,25 +380,17 @@ def add_stats_record(row_dict: dict) -> bool:
             'tshirt_size', 'updated_by_user', 'updated_at', 'event',
             'tshirt_size_c1', 'tshirt_size_c2', 'tshirt_size_c3', 'operation'
         ]
-
-        if not all_vals:
-            ws.append_row(default_header, value_input_option="USER_ENTERED")
-            header = default_header
-            next_id = 1
-        else:
-            header = all_vals[0]
-            if set(default_header) - set(header):
-                header = header + [c for c in default_header if c not in header]
-                last_col_letter = chr(64 + len(header))
-                ws.update(f"A1:{last_col_letter}1", [header])
-            next_id = len(all_vals)
+        # cabeçalho em cache no processo (só grava a linha 1 se a aba estiver vazia ou faltar coluna)
+        header = tab_header(Config.STATS_TAB_NAME, Config.MAIN_SHEET_NAME, default=default_header, required=default_header)
+        next_id = allocate_row_number(Config.STATS_TAB_NAME, Config.MAIN_SHEET_NAME) - 1  # header + existing rows
 
         row_dict = dict(row_dict)
         row_dict['stats_record_id'] = row_dict.get('stats_record_id', next_id)
         aligned = [row_dict.get(c, "") for c in header]
-        ws.append_row(aligned, value_input_option="USER_ENTERED")
+        append_rows(Config.STATS_TAB_NAME, [aligned], Config.MAIN_SHEET_NAME)
         st.success("Stats saved.", icon="💾")
         load_stats.clear()
+        invalidate_snapshot(tabs=(Config.STATS_TAB_NAME,))
         return True
     except Exception as e:
         st.error(f"Error saving stats: {e}", icon="🚨")
@@ -452,31 +406,16 @@ def registrar_log(
     notes: str = ""
 ) -> bool:
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET_NAME, Config.ATTENDANCE_TAB_NAME)
-
-        header: list[str] = ws.row_values(1)
-        if not header:
-            header = [
-                Config.ATT_COL_ROWID, Config.ATT_COL_EVENT, Config.ATT_COL_ATHLETE_ID,
-                Config.ATT_COL_NAME, Config.ATT_COL_FIGHTER, Config.ATT_COL_TASK, Config.ATT_COL_STATUS,
-                Config.ATT_COL_USER, Config.ATT_COL_TIMESTAMP, Config.ATT_COL_TIMESTAMP_ALT, Config.ATT_COL_NOTES
-            ]
-            ws.append_row(header, value_input_option="USER_ENTERED")
+        default_header = [
+            Config.ATT_COL_ROWID, Config.ATT_COL_EVENT, Config.ATT_COL_ATHLETE_ID,
+            Config.ATT_COL_NAME, Config.ATT_COL_FIGHTER, Config.ATT_COL_TASK, Config.ATT_COL_STATUS,
+            Config.ATT_COL_USER, Config.ATT_COL_TIMESTAMP, Config.ATT_COL_TIMESTAMP_ALT, Config.ATT_COL_NOTES
+        ]
+        header: list[str] = tab_header(Config.ATTENDANCE_TAB_NAME, Config.MAIN_SHEET_NAME, default=default_header)
 
         next_num = ""
         if Config.ATT_COL_ROWID in header:
-            col_idx = header.index(Config.ATT_COL_ROWID) + 1
-            col_vals = ws.col_values(col_idx)
-            if len(col_vals) > 1:
-                last = None
-                for v in reversed(col_vals[1:]):
-                    if str(v).strip():
-                        last = str(v).strip()
-                        break
-                next_num = str(int(last) + 1) if (last and last.isdigit()) else str(len(col_vals))
-            else:
-                next_num = "1"
+            next_num = str(allocate_row_number(Config.ATTENDANCE_TAB_NAME, Config.MAIN_SHEET_NAME))
 
         ts_now = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
         user_ident = st.session_state.get('current_user_name', user_log_id)
@@ -496,8 +435,8 @@ def registrar_log(
         }
 
         row_to_append = [values_by_name.get(col_name, "") for col_name in header]
-        ws.append_row(row_to_append, value_input_option="USER_ENTERED")
-        load_attendance.clear()
+        append_rows(Config.ATTENDANCE_TAB_NAME, [row_to_append], Config.MAIN_SHEET_NAME)
+        invalidate_snapshot(tabs=(Config.ATTENDANCE_TAB_NAME,))
         return True
 
     except Exception as e:
@@ -519,10 +458,10 @@ for k, v in default_ss.items():
 
 with st.spinner("Loading data..."):
     df_athletes = load_athletes()
-    df_att_raw  = load_attendance()
+    df_att      = load_attendance()   # já normalizada (uma vez por versão)
     df_stats    = load_stats()
+show_data_age()
 
-df_att = preprocess_attendance(df_att_raw)
 
 def compute_task_status_for_athletes(df_athletes, df_attendance, fixed_task: str) -> pd.DataFrame:
     if df_athletes is None or df_athletes.empty:
@@ -663,7 +602,10 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- Render: cards + formulário de Stats ---
-for _, row in df_filtered.iterrows():
+# “Last Stats” (pelo NOME) para todos os cards de uma vez
+last_done = last_done_for_task(df_filtered, Config.FIXED_TASK, Config.TASK_ALIASES)
+
+for i_row, row in df_filtered.iterrows():
     ath_id = str(row.get(Config.COL_ID, ""))
     ath_name = str(row.get(Config.COL_NAME, ""))
     ath_event = str(row.get(Config.COL_EVENT, ""))
@@ -677,8 +619,9 @@ for _, row in df_filtered.iterrows():
     info_parts = []
     if ath_event != Config.DEFAULT_EVENT_PLACEHOLDER:
         info_parts.append(html.escape(ath_event))
-    if row.get(Config.COL_FIGHT_NUMBER, ""):
-        info_parts.append(f"FIGHT {html.escape(str(row.get(Config.COL_FIGHT_NUMBER, '')))}")
+    fight_number = row.get(Config.COL_FIGHT_NUMBER, "")
+    if not pd.isna(fight_number) and fight_number != "":
+        info_parts.append(f"FIGHT {html.escape(str(fight_number))}")
     if row.get(Config.COL_CORNER, ""):
         info_parts.append(html.escape(str(row.get(Config.COL_CORNER, "")).upper()))
     fight_info_text = " | ".join(info_parts)
@@ -719,9 +662,7 @@ for _, row in df_filtered.iterrows():
     other_chips_html = chips_for_other_tasks(df_att, ath_name, ath_event, Config.FIXED_TASK)
 
     # “Last Stats” (pelo NOME)
-    last_dt_str, last_event_str = last_done_for_task_by_name(
-        df_att, ath_name, Config.FIXED_TASK, Config.TASK_ALIASES
-    )
+    last_dt_str, last_event_str = last_done.at[i_row, "last_dt"], last_done.at[i_row, "last_event"]
     last_label = f"Last {html.escape(Config.FIXED_TASK)}"
     last_html = (
         f"<span class='event-badge'>{html.escape(last_event_str)} | {html.escape(last_dt_str)}</span>"
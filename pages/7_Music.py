@@ -1,5 +1,5 @@
 # pages/7_Music.py
-from components.layout import bootstrap_page
+from components.layout import bootstrap_page, show_data_age
 import streamlit as st
 import pandas as pd
 from datetime import datetime
@@ -13,7 +13,8 @@ bootstrap_page("Walkout Music")
 st.title("Walkout Music")
 
 # --- Project Imports ---
-from utils import get_gspread_client, connect_gsheet_tab
+from utils import invalidate_snapshot, store_derived, show_notices, with_notices, append_rows, tab_header, allocate_row_number, get_status_index
+from ts_parse import parse_ts_series
 
 # ==============================================================================
 # CONFIG
@@ -22,6 +23,8 @@ class Config:
     MAIN_SHEET_NAME = "UAEW_App"
     ATHLETES_TAB_NAME = "df"
     ATTENDANCE_TAB_NAME = "Attendance"
+    # Header written if Attendance is still empty
+    ATTENDANCE_COLUMNS = ["#", "Event", "Athlete ID", "Name", "Task", "Status", "User", "TimeStamp", "Notes"]
 
     FIXED_TASK = "Walkout Music"
     TASK_ALIASES = [r"\bwalkout\s*music\b", r"\bwalkout\b", r"\bmusic\b"]
@@ -124,103 +127,85 @@ def _clean_str_series(s: pd.Series) -> pd.Series:
     s = pd.Series(s).fillna("").astype(str).str.strip()
     return s
 
-def parse_ts_series(raw: pd.Series) -> pd.Series:
-    if raw is None or len(raw) == 0:
-        return pd.Series([], dtype='datetime64[ns]')
-    tries = [
-        pd.to_datetime(raw, format="%d/%m/%Y %H:%M:%S", errors="coerce"),
-        pd.to_datetime(raw, format="%d/%m/%Y", errors="coerce"),
-        pd.to_datetime(raw, format="%d-%m-%Y %H:%M:%S", errors="coerce"),
-        pd.to_datetime(raw, format="%d-%m-%Y", errors="coerce"),
-        pd.to_datetime(raw, errors="coerce"),
-    ]
-    ts_final = tries[0]
-    for cand in tries[1:]:
-        ts_final = ts_final.fillna(cand)
-    return ts_final
-
 # ==============================================================================
 # DATA LOADING
 # ==============================================================================
-@st.cache_data(ttl=600)
 def load_athlete_data() -> pd.DataFrame:
     try:
-        gspread_client = get_gspread_client()
-        ws = connect_gsheet_tab(gspread_client, Config.MAIN_SHEET_NAME, Config.ATHLETES_TAB_NAME)
-        data = ws.get_all_records()
-        if not data:
-            return pd.DataFrame()
-        df = pd.DataFrame(data)
-        if df.empty:
-            return pd.DataFrame()
-        df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
-
-        if Config.COL_ROLE not in df.columns or Config.COL_INACTIVE not in df.columns:
-            st.error("Required columns 'ROLE'/'INACTIVE' not found.", icon="🚨")
-            return pd.DataFrame()
-
-        if df[Config.COL_INACTIVE].dtype == 'object':
-            df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].astype(str).str.upper().map({'FALSE': False, 'TRUE': True, '': True}).fillna(True)
-        elif pd.api.types.is_numeric_dtype(df[Config.COL_INACTIVE]):
-            df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].map({0: False, 1: True}).fillna(True)
-
-        df = df[(df[Config.COL_ROLE] == "1 - Fighter") & (df[Config.COL_INACTIVE] == False)].copy()
-
-        if Config.COL_EVENT in df.columns:
-            df[Config.COL_EVENT] = df[Config.COL_EVENT].fillna(Config.DEFAULT_EVENT_PLACEHOLDER)
-        else:
-            df[Config.COL_EVENT] = Config.DEFAULT_EVENT_PLACEHOLDER
-
-        for c in [Config.COL_IMAGE, Config.COL_MOBILE, Config.COL_FIGHT_NUMBER, Config.COL_CORNER, Config.COL_PASSPORT_IMAGE]:
-            if c not in df.columns:
-                df[c] = ""
-            else:
-                df[c] = df[c].fillna("")
-
-        if Config.COL_NAME not in df.columns or Config.COL_ID not in df.columns:
-            st.error("Required columns 'name'/'id' not found.", icon="🚨")
-            return pd.DataFrame()
-
-        return df.sort_values(by=[Config.COL_EVENT, Config.COL_NAME]).reset_index(drop=True)
+        return show_notices(store_derived(Config.ATHLETES_TAB_NAME, "music:athletes", _prepare_athlete_data, Config.MAIN_SHEET_NAME, source="record_dicts"))
     except Exception as e:
         st.error(f"Error loading athletes: {e}", icon="🚨")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)
+def _prepare_athlete_data(data: list) -> pd.DataFrame:
+    if not data:
+        return pd.DataFrame()
+    df = pd.DataFrame(data)
+    if df.empty:
+        return pd.DataFrame()
+    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+
+    if Config.COL_ROLE not in df.columns or Config.COL_INACTIVE not in df.columns:
+        return with_notices(pd.DataFrame(), ("error", "Required columns 'ROLE'/'INACTIVE' not found."))
+
+    if df[Config.COL_INACTIVE].dtype == 'object':
+        df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].astype(str).str.upper().map({'FALSE': False, 'TRUE': True, '': True}).fillna(True)
+    elif pd.api.types.is_numeric_dtype(df[Config.COL_INACTIVE]):
+        df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].map({0: False, 1: True}).fillna(True)
+
+    df = df[(df[Config.COL_ROLE] == "1 - Fighter") & (df[Config.COL_INACTIVE] == False)].copy()
+
+    if Config.COL_EVENT in df.columns:
+        df[Config.COL_EVENT] = df[Config.COL_EVENT].fillna(Config.DEFAULT_EVENT_PLACEHOLDER)
+    else:
+        df[Config.COL_EVENT] = Config.DEFAULT_EVENT_PLACEHOLDER
+
+    for c in [Config.COL_IMAGE, Config.COL_MOBILE, Config.COL_FIGHT_NUMBER, Config.COL_CORNER, Config.COL_PASSPORT_IMAGE]:
+        if c not in df.columns:
+            df[c] = ""
+        else:
+            df[c] = df[c].fillna("")
+
+    if Config.COL_NAME not in df.columns or Config.COL_ID not in df.columns:
+        return with_notices(pd.DataFrame(), ("error", "Required columns 'name'/'id' not found."))
+
+    return df.sort_values(by=[Config.COL_EVENT, Config.COL_NAME]).reset_index(drop=True)
+
 def load_attendance_data() -> pd.DataFrame:
     """
     Robust loader: reads the actual header row from the sheet and adapts.
     No expected_headers (avoids warnings when headers differ).
     """
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET_NAME, Config.ATTENDANCE_TAB_NAME)
-        all_vals = ws.get_all_values()
-        if not all_vals:
-            return pd.DataFrame()
-        headers = [h if h is not None else "" for h in (all_vals[0] if all_vals else [])]
-        rows = all_vals[1:] if len(all_vals) > 1 else []
-        df = pd.DataFrame(rows, columns=headers)
-
-        # Ensure the columns we use exist (create empty if missing)
-        for col in ["Event", "Fighter", "Task", "Status", "User", "TimeStamp", "Timestamp", "Notes"]:
-            if col not in df.columns:
-                df[col] = ""
-
-        # Keep Athlete ID string if exists
-        if "Athlete ID" in df.columns:
-            df["Athlete ID"] = df["Athlete ID"].astype(str)
-
-        return df
+        return store_derived(Config.ATTENDANCE_TAB_NAME, "music:attendance_norm",
+                             lambda vals: preprocess_attendance(_prepare_attendance_data(vals)), Config.MAIN_SHEET_NAME, source="values")
     except Exception:
         # Fail safe; return empty compatible df
         return pd.DataFrame(columns=["Event", "Fighter", "Task", "Status", "User", "TimeStamp", "Timestamp", "Notes", "Athlete ID"])
 
+def _prepare_attendance_data(all_vals: list) -> pd.DataFrame:
+    if not all_vals:
+        return pd.DataFrame()
+    headers = [h if h is not None else "" for h in (all_vals[0] if all_vals else [])]
+    rows = all_vals[1:] if len(all_vals) > 1 else []
+    df = pd.DataFrame(rows, columns=headers)
+
+    # Ensure the columns we use exist (create empty if missing)
+    for col in ["Event", "Fighter", "Task", "Status", "User", "TimeStamp", "Timestamp", "Notes"]:
+        if col not in df.columns:
+            df[col] = ""
+
+    # Keep Athlete ID string if exists
+    if "Athlete ID" in df.columns:
+        df["Athlete ID"] = df["Athlete ID"].astype(str)
+
+    return df
+
 # ==============================================================================
 # PREPROCESS ATTENDANCE
 # ==============================================================================
-@st.cache_data(ttl=180)
 def preprocess_attendance(df_attendance: pd.DataFrame) -> pd.DataFrame:
+    """Normalized columns and TS_dt; runs inside the loader, once per Attendance version."""
     if df_attendance is None or df_attendance.empty:
         return pd.DataFrame()
     df = df_attendance.copy()
@@ -244,24 +229,12 @@ def preprocess_attendance(df_attendance: pd.DataFrame) -> pd.DataFrame:
     df["TS_dt"] = parse_ts_series(df["TS_raw"])
     return df
 
-def current_status_for_event(df_att: pd.DataFrame, name: str, event: str) -> str:
-    if df_att is None or df_att.empty:
-        return Config.STATUS_PENDING
-    name_n = clean_and_normalize(name)
-    evt_n  = clean_and_normalize(event)
-    mask = (df_att["fighter_norm"] == name_n) & (df_att["event_norm"] == evt_n) & make_task_mask(df_att["task_norm"], Config.FIXED_TASK, Config.TASK_ALIASES)
-    if not mask.any():
-        return Config.STATUS_PENDING
-    logs = df_att.loc[mask].copy()
-    if logs.empty:
-        return Config.STATUS_PENDING
-    if logs["TS_dt"].notna().any():
-        logs = logs.dropna(subset=["TS_dt"]).sort_values("TS_dt", ascending=False)
-    else:
-        logs = logs.reset_index(drop=False).sort_values("index", ascending=False)
-    last = logs.iloc[0]
-    st_raw = str(last.get("Status", "")).strip().lower()
-    return Config.STATUS_DONE if st_raw == "done" else Config.STATUS_PENDING
+def current_status_for_event(names: pd.Series, events: pd.Series) -> pd.Series:
+    """Done/Pending of the latest music log per (name, event), joined from the shared Attendance index."""
+    idx = get_status_index("name", Config.MAIN_SHEET_NAME)
+    latest = idx.join(names, events, idx.task_keys(Config.FIXED_TASK, Config.TASK_ALIASES, regex=True))
+    done = latest["status"].fillna("").astype(str).str.strip().str.lower().eq("done")
+    return done.map({True: Config.STATUS_DONE, False: Config.STATUS_PENDING})
 
 def previous_event_music_links(df_att: pd.DataFrame, name: str, current_event: str) -> list[tuple[str, str]]:
     """
@@ -318,16 +291,9 @@ def registrar_log_music_link(
     Append ONE row to Attendance for ONE link using the sheet's actual headers.
     """
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET_NAME, Config.ATTENDANCE_TAB_NAME)
-
-        all_vals = ws.get_all_values()
-        headers = all_vals[0] if all_vals else []
-        # compute next '#'
-        if len(all_vals) > 1 and str(all_vals[-1][0]).isdigit():
-            next_num = int(all_vals[-1][0]) + 1
-        else:
-            next_num = len(all_vals) + 1
+        headers = tab_header(Config.ATTENDANCE_TAB_NAME, Config.MAIN_SHEET_NAME, default=Config.ATTENDANCE_COLUMNS)
+        # next '#' from the process-wide allocator (no full-tab read)
+        next_num = allocate_row_number(Config.ATTENDANCE_TAB_NAME, Config.MAIN_SHEET_NAME)
 
         ts_now = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
         user_ident = st.session_state.get('current_user_name', user_log_id)
@@ -361,13 +327,7 @@ def registrar_log_music_link(
             else:
                 # unknown or extra column -> blank
                 row_values.append("")
-        if not headers:
-            # if the sheet is empty, append with a safe default order
-            row_values = [
-                str(next_num), ath_event, ath_id, ath_name, Config.FIXED_TASK,
-                Config.STATUS_DONE, user_ident, ts_now, link_url
-            ]
-        ws.append_row(row_values, value_input_option="USER_ENTERED")
+        append_rows(Config.ATTENDANCE_TAB_NAME, [row_values], Config.MAIN_SHEET_NAME)
         return True
     except Exception as e:
         st.error(f"Error writing Attendance: {e}", icon="🚨")
@@ -391,8 +351,8 @@ for k, v in defaults.items():
 # ==============================================================================
 with st.spinner("Loading data..."):
     df_athletes = load_athlete_data()
-    df_att_raw = load_attendance_data()
-    df_att = preprocess_attendance(df_att_raw)
+    df_att = load_attendance_data()   # already normalized, once per version
+show_data_age()
 
 # ==============================================================================
 # FILTERS
@@ -431,7 +391,7 @@ if not df_show.empty:
 
     # attach current status
     if not df_show.empty:
-        df_show["__status__"] = df_show.apply(lambda r: current_status_for_event(df_att, r[Config.COL_NAME], r[Config.COL_EVENT]), axis=1)
+        df_show["__status__"] = current_status_for_event(df_show[Config.COL_NAME], df_show[Config.COL_EVENT])
 
         if st.session_state.wm_selected_status == "Done":
             df_show = df_show[df_show["__status__"] == Config.STATUS_DONE]
@@ -583,7 +543,7 @@ for i, row in df_show.iterrows():
                         time.sleep(0.05)
                 if ok_any:
                     # refresh data + leave values in inputs; status updates to Done
-                    load_attendance_data.clear(); preprocess_attendance.clear()
+                    invalidate_snapshot(tabs=(Config.ATTENDANCE_TAB_NAME,))
                     st.session_state[edit_key] = False
                     st.success("Links saved!", icon="✅")
                     st.rerun()
@@ -1,13 +1,12 @@
 # pages/11_Task_Table.py
-from components.layout import bootstrap_page
+from components.layout import bootstrap_page, show_delivery_status
 import streamlit as st
 import pandas as pd
-import numpy as np
 from datetime import datetime
-import unicodedata
 
 # utils base (recomendado: @st.cache_resource dentro de utils)
-from utils import get_gspread_client, connect_gsheet_tab, load_config_data
+from utils import get_gspread_client, connect_gsheet_tab, load_config_data, invalidate_snapshot, store_derived, tab_version, deliver_in_background, new_op_id, tab_header, allocate_row_number, OP_ID_COL, ROSTER_DTYPES, get_status_index, status_overlay
+from status_index import format_dates
 
 # =========================
 # Toggle de performance (fusível)
@@ -27,50 +26,12 @@ MAIN_SHEET_NAME   = "UAEW_App"
 ATHLETES_TAB_NAME = "df"
 ATTENDANCE_TAB    = "Attendance"
 DEFAULT_EVENT     = "Z"
+# Colunas lidas do df (aba larga); o resto nem é montado
+ATHLETE_COLS      = ["id", "name", "event", "role", "inactive", "fight_number", "corner"]
 
 # =========================
 # Helpers
 # =========================
-def _clean_str_series(s: pd.Series) -> pd.Series:
-    if s is None or s.empty:
-        return pd.Series([], dtype=str)
-    s = s.fillna("").astype(str).str.strip()
-    invalid = {"", "none", "None", "null", "NULL", "nan", "NaN", "<NA>"}
-    return s.replace({k: "" for k in invalid})
-
-def _normalize_txt(t: str) -> str:
-    if not isinstance(t, str):
-        return ""
-    t = t.strip().lower()
-    t = unicodedata.normalize("NFKD", t)
-    t = "".join([c for c in t if not unicodedata.combining(c)])
-    return " ".join(t.split())
-
-def _parse_ts_series(raw: pd.Series) -> pd.Series:
-    if raw is None or raw.empty:
-        return pd.Series([], dtype="datetime64[ns]")
-    tries = [
-        pd.to_datetime(raw, format="%d/%m/%Y %H:%M:%S", errors="coerce"),
-        pd.to_datetime(raw, format="%d/%m/%Y", errors="coerce"),
-        pd.to_datetime(raw, format="%d-%m-%Y %H:%M:%S", errors="coerce"),
-        pd.to_datetime(raw, format="%d-%m-%Y", errors="coerce"),
-        pd.to_datetime(raw, errors="coerce"),
-    ]
-    out = tries[0]
-    for cand in tries[1:]:
-        out = out.fillna(cand)
-    return out
-
-def _fmt_dt_or_text(row) -> str:
-    if pd.notna(row.get("TS_dt", pd.NaT)):
-        return row["TS_dt"].strftime("%d/%m/%Y")
-    for k in ("TS_raw", "TimeStamp", "Timestamp"):
-        if k in row and str(row[k]).strip():
-            dt = pd.to_datetime(str(row[k]), dayfirst=True, errors="coerce")
-            if pd.notna(dt):
-                return dt.strftime("%d/%m/%Y")
-    return "N/A"
-
 def _status_logical(raw: str) -> str:
     s = "" if raw is None else str(raw).strip()
     low = s.lower()
@@ -82,152 +43,92 @@ def _status_logical(raw: str) -> str:
 # =========================
 # Data loaders (cache)
 # =========================
-@st.cache_data(ttl=600)
 def load_athletes() -> pd.DataFrame:
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, MAIN_SHEET_NAME, ATHLETES_TAB_NAME)
-        data = ws.get_all_records()
-        if not data:
-            return pd.DataFrame()
-        df = pd.DataFrame(data)
-        if df.empty:
-            return pd.DataFrame()
-
-        df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
-
-        if "role" not in df.columns or "inactive" not in df.columns:
-            return pd.DataFrame()
-
-        if df["inactive"].dtype == "object":
-            df["inactive"] = df["inactive"].astype(str).str.upper().map(
-                {"FALSE": False, "TRUE": True, "": True}
-            ).fillna(True)
-        elif pd.api.types.is_numeric_dtype(df["inactive"]):
-            df["inactive"] = df["inactive"].map({0: False, 1: True}).fillna(True)
-
-        df = df[(df["role"] == "1 - Fighter") & (df["inactive"] == False)].copy()
-
-        for c in ["event", "id", "name", "fight_number", "corner"]:
-            if c not in df.columns:
-                df[c] = ""
-        df["event"] = df["event"].fillna(DEFAULT_EVENT)
-
-        return df.sort_values(by=["event", "name"]).reset_index(drop=True)
+        return store_derived(ATHLETES_TAB_NAME, "admin:athletes", _prepare_athletes, MAIN_SHEET_NAME,
+                             columns=ATHLETE_COLS, dtypes=ROSTER_DTYPES)
     except Exception as e:
         st.error(f"Error loading athletes: {e}", icon="🚨")
         return pd.DataFrame()
 
-@st.cache_data(ttl=300)
-def load_attendance() -> pd.DataFrame:
-    try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, MAIN_SHEET_NAME, ATTENDANCE_TAB)
-        all_vals = ws.get_all_values()
-        if not all_vals:
-            return pd.DataFrame()
-        headers = [h if h is not None else "" for h in (all_vals[0] if all_vals else [])]
-        rows = all_vals[1:] if len(all_vals) > 1 else []
-        df = pd.DataFrame(rows, columns=headers)
-
-        for col in ["Event", "Fighter", "Task", "Status", "User", "TimeStamp", "Timestamp", "Notes", "Athlete ID"]:
-            if col not in df.columns:
-                df[col] = ""
-
-        df["fighter_norm"] = df["Fighter"].astype(str).apply(_normalize_txt)
-        df["event_norm"]   = df["Event"].astype(str).apply(_normalize_txt)
-        df["task_norm"]    = df["Task"].astype(str).str.strip().str.lower()
-        df["status_norm"]  = df["Status"].astype(str).str.strip().str.lower()
-
-        t2 = df.get("TimeStamp")
-        t1 = df.get("Timestamp")
-        if t2 is None and t1 is None:
-            df["TS_raw"] = ""
-        else:
-            s2 = _clean_str_series(t2) if t2 is not None else pd.Series([""]*len(df))
-            s1 = _clean_str_series(t1) if t1 is not None else pd.Series([""]*len(df))
-            df["TS_raw"] = s2.where(s2 != "", s1)
-        df["TS_dt"] = _parse_ts_series(df["TS_raw"])
-        return df
-    except Exception as e:
-        st.error(f"Error loading attendance: {e}", icon="🚨")
+def _prepare_athletes(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
         return pd.DataFrame()
 
-# =========================
-# Índice cacheado (último status por grupo)
-# =========================
-@st.cache_data(ttl=120)
-def build_attendance_index() -> pd.DataFrame:
-    """Último registro por (event_norm, fighter_norm, task_norm)."""
-    df_att = load_attendance()
-    if df_att.empty:
+    if "role" not in df.columns or "inactive" not in df.columns:
         return pd.DataFrame()
 
-    idx_cols = ["event_norm", "fighter_norm", "task_norm"]
-    df_sorted = df_att.sort_values(by=["TS_dt"], ascending=False)
-    latest = df_sorted.drop_duplicates(subset=idx_cols, keep="first")
+    # inactive já vem booleano; aqui vazio/desconhecido conta como inativo
+    df["inactive"] = df["inactive"].fillna(True).astype(bool)
+
+    df = df[(df["role"] == "1 - Fighter") & (df["inactive"] == False)].copy()
 
-    keep = idx_cols + ["Status", "User", "TS_dt", "TS_raw"]
-    for c in keep:
-        if c not in latest.columns:
-            latest[c] = ""
-    return latest[keep].reset_index(drop=True)
+    for c in ["event", "id", "name", "fight_number", "corner"]:
+        if c not in df.columns:
+            df[c] = ""
+    df["event"] = df["event"].fillna(DEFAULT_EVENT)
+
+    return df.sort_values(by=["event", "name"]).reset_index(drop=True)
 
 # =========================
-# Status por task / All (cacheados)
+# Status por task / All (cacheados por versão dos dados)
 # =========================
-@st.cache_data(ttl=120)
-def compute_status_for_task(task_name: str) -> pd.DataFrame:
+def _data_version() -> tuple:
+    """Token (versão df, versão Attendance): muda sozinho quando os dados mudam."""
+    return (tab_version(ATHLETES_TAB_NAME, MAIN_SHEET_NAME), tab_version(ATTENDANCE_TAB, MAIN_SHEET_NAME))
+
+STATUS_COLS = ["id","name","event","fight_number","corner","current_status","latest_user","latest_date"]
+
+@st.cache_data(ttl=600)
+def compute_status_for_task(task_name: str, data_version: tuple = None) -> pd.DataFrame:
+    """Último status da task por atleta (nome + evento), do índice compartilhado da Attendance."""
     df_a = load_athletes()
     if df_a.empty:
         return pd.DataFrame()
 
     base = df_a.copy()
-    base["name_norm"]  = base["name"].apply(_normalize_txt)
-    base["event_norm"] = base["event"].apply(_normalize_txt)
-
-    idx = build_attendance_index()
-    if idx.empty or not task_name:
+    for c in STATUS_COLS[:5]:
+        if c not in base.columns: base[c] = ""
+    if not task_name:
         base["current_status"] = "Pending"
         base["latest_user"] = "N/A"
         base["latest_date"] = "N/A"
-        return base[["id","name","event","fight_number","corner","current_status","latest_user","latest_date"]]
-
-    t_norm = task_name.strip().lower()
-    idx_t = idx[idx["task_norm"] == t_norm]
-
-    merged = pd.merge(
-        base,
-        idx_t,
-        left_on=["name_norm", "event_norm"],
-        right_on=["fighter_norm", "event_norm"],
-        how="left"
-    )
-
-    merged["current_status"] = merged["Status"].apply(_status_logical)
-    merged["latest_user"]    = merged["User"].fillna("N/A")
-
-    def _fmt_row(row):
-        if pd.notna(row.get("TS_dt", pd.NaT)):
-            return row["TS_dt"].strftime("%d/%m/%Y")
-        raw = str(row.get("TS_raw", "")).strip()
-        if raw:
-            dt = pd.to_datetime(raw, dayfirst=True, errors="coerce")
-            if pd.notna(dt): return dt.strftime("%d/%m/%Y")
-        return "N/A"
-
-    merged["latest_date"] = merged.apply(_fmt_row, axis=1)
-
-    keep_cols = ["id","name","event","fight_number","corner","current_status","latest_user","latest_date"]
-    for c in keep_cols:
-        if c not in merged.columns: merged[c] = ""
-    return merged[keep_cols].reset_index(drop=True)
+        return base[STATUS_COLS]
+
+    latest = get_status_index("name", MAIN_SHEET_NAME).join(base["name"], base["event"], task_name)
+    base["current_status"] = latest["status"].map(_status_logical)
+    base["latest_user"]    = latest["user"].fillna("N/A")
+    base["latest_date"]    = format_dates(latest["ts"])
+    return base[STATUS_COLS].reset_index(drop=True)
+
+def with_session_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Linhas que esta sessão mandou e o Sheets ainda não devolveu, por cima do status cacheado
+    (fora do st.cache_data: o overlay é da sessão).
+    """
+    overlay = status_overlay()
+    if df.empty or not len(overlay):
+        return df
+    idx = get_status_index("name", MAIN_SHEET_NAME)
+    overlay.prune(idx)
+    if not len(overlay):
+        return df
+    df = df.copy()
+    for task, part in df.groupby("task", sort=False):
+        pend = idx.patch_rows(part["name"], part["event"], task, overlay)
+        mask = pend["pending"].eq(True)
+        if mask.any():
+            rows = pend.index[mask]
+            df.loc[rows, "current_status"] = pend.loc[mask, "status"].map(_status_logical)
+            df.loc[rows, "latest_user"]    = pend.loc[mask, "user"]
+            df.loc[rows, "latest_date"]    = format_dates(pend.loc[mask, "ts"])
+    return df
 
-@st.cache_data(ttl=120)
-def compute_status_for_all(tasks: list[str]) -> pd.DataFrame:
+@st.cache_data(ttl=600)
+def compute_status_for_all(tasks: list[str], data_version: tuple = None) -> pd.DataFrame:
     dfs = []
     for t in tasks:
-        dft = compute_status_for_task(t)
+        dft = compute_status_for_task(t, data_version)
         if not dft.empty:
             dft = dft.copy()
             dft["task"] = t
@@ -238,11 +139,15 @@ def compute_status_for_all(tasks: list[str]) -> pd.DataFrame:
 # View filtrada + ordenada (cache)
 # =========================
 @st.cache_data(ttl=60)
-def get_filtered_view(df: pd.DataFrame, event_filter: str, status_filter: str, q: str, sel_task: str) -> pd.DataFrame:
-    if df.empty:
-        return df
-
-    out = df
+def get_filtered_view(_df: pd.DataFrame, view_key: tuple, event_filter: str, status_filter: str, q: str, sel_task: str) -> pd.DataFrame:
+    """
+    _df não entra no hash do cache (seria hashear a tabela inteira a cada rerun): quem
+    identifica o conteúdo é view_key = (versão dos dados, tasks, Op IDs do overlay da sessão).
+    """
+    if _df.empty:
+        return _df
+
+    out = _df
     if event_filter != "All Events":
         out = out[out["event"] == event_filter]
 
@@ -268,17 +173,11 @@ def get_filtered_view(df: pd.DataFrame, event_filter: str, status_filter: str, q
 # =========================
 # Writer — duas versões (FAST e LEGACY)
 # =========================
-def _ensure_header_and_get_next(ws):
-    """Garante header e retorna (header_row, next_row_number)."""
-    all_vals = ws.get_all_values()
-    if not all_vals:
-        header = ["#", "Event", "Athlete ID", "Name", "Fighter", "Task", "Status", "User", "Timestamp", "TimeStamp", "Notes"]
-        ws.update("A1", [header], value_input_option="USER_ENTERED")
-        return header, 2
-    else:
-        header_row = all_vals[0]
-        next_row = len(all_vals) + 1
-        return header_row, next_row
+def _ensure_header_and_get_next(count: int = 1):
+    """Garante header e retorna (header_row, next_row_number), reservando `count` linhas (sem ler a aba)."""
+    header = ["#", "Event", "Athlete ID", "Name", "Fighter", "Task", "Status", "User", "Timestamp", "TimeStamp", "Notes"]
+    header_row = tab_header(ATTENDANCE_TAB, MAIN_SHEET_NAME, default=header)
+    return header_row, allocate_row_number(ATTENDANCE_TAB, MAIN_SHEET_NAME, count)
 
 def _append_by_header_legacy(ws, values: dict) -> None:
     """Modo antigo: alinha e dá append_row (mais lento)."""
@@ -297,18 +196,16 @@ def _append_by_header_legacy(ws, values: dict) -> None:
     ws.append_row(aligned, value_input_option="USER_ENTERED")
 
 def bulk_log_fast(selected_rows: pd.DataFrame, task_name: str, status: str, note: str = "") -> int:
-    """FAST: 1 chamada com values_append."""
+    """FAST: 1 chamada com values_append, em segundo plano (estado por linha em show_delivery_status)."""
     if selected_rows.empty:
         return 0
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, MAIN_SHEET_NAME, ATTENDANCE_TAB)
-        header_row, next_row = _ensure_header_and_get_next(ws)
+        header_row, next_row = _ensure_header_and_get_next(len(selected_rows))
 
         ts = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
         user_ident = st.session_state.get("current_user_name", "System")
 
-        rows_to_append = []
+        rows_to_append, values_list = [], []
         num = next_row
         for _, r in selected_rows.iterrows():
             rowvals = {
@@ -323,16 +220,18 @@ def bulk_log_fast(selected_rows: pd.DataFrame, task_name: str, status: str, note
                 "Timestamp":  "",
                 "TimeStamp":  ts,
                 "Notes":      note or "",
+                OP_ID_COL:    new_op_id(),   # "Retry failed" reenvia com o mesmo ID (sem duplicar)
             }
             rows_to_append.append([rowvals.get(h, "") for h in header_row])
+            values_list.append(rowvals)
             num += 1
 
-        # uma única chamada
-        ws.spreadsheet.values_append(
-            f"{ATTENDANCE_TAB}!A1",
-            params={"valueInputOption": "RAW", "insertDataOption": "INSERT_ROWS"},
-            body={"values": rows_to_append},
-        )
+        # uma única chamada (junto com o que outras sessões estiverem gravando), sem esperar o Sheets;
+        # a tabela já mostra as linhas pelo overlay até o snapshot trazê-las
+        overlay = status_overlay()
+        for rowvals in values_list:
+            overlay.add(rowvals)
+        deliver_in_background(ATTENDANCE_TAB, rows_to_append, values_list, MAIN_SHEET_NAME, value_input="RAW")
         return len(rows_to_append)
     except Exception as e:
         st.error(f"Error writing logs: {e}", icon="🚨")
@@ -371,13 +270,13 @@ def bulk_log_legacy(selected_rows: pd.DataFrame, task_name: str, status: str, no
 
 def bulk_log(selected_rows: pd.DataFrame, task_name: str, status: str, note: str = "") -> int:
     """Chama FAST ou LEGACY conforme o fusível."""
-    count = bulk_log_fast(selected_rows, task_name, status, note) if USE_FAST_APPEND else bulk_log_legacy(selected_rows, task_name, status, note)
+    if USE_FAST_APPEND:
+        # a Attendance fica suja quando o Sheets confirma o lote (deliver_in_background)
+        return bulk_log_fast(selected_rows, task_name, status, note)
+    count = bulk_log_legacy(selected_rows, task_name, status, note)
     if count > 0:
-        # invalidação mínima (reidrata status rapidamente)
-        load_attendance.clear()
-        build_attendance_index.clear()
-        compute_status_for_task.clear()
-        compute_status_for_all.clear()
+        # a Attendance fica suja; índice e status seguem a nova versão sozinhos
+        invalidate_snapshot(tabs=(ATTENDANCE_TAB,))
     return count
 
 # =========================
@@ -421,16 +320,18 @@ with st.expander("Settings", expanded=True):
 # =========================
 sel_task = st.session_state[K_TASK]
 if sel_task == "All":
-    df = compute_status_for_all(tasks)
+    df = compute_status_for_all(tasks, _data_version())
 else:
-    df = compute_status_for_task(sel_task)
+    df = compute_status_for_task(sel_task, _data_version())
     if not df.empty:
         df = df.copy()
         df["task"] = sel_task
+df = with_session_rows(df)
 
 # filtros cacheados
 df_view = get_filtered_view(
-    df=df,
+    df,
+    (_data_version(), tuple(tasks), status_overlay().token()),
     event_filter=st.session_state[K_EVENT],
     status_filter=st.session_state[K_STAT],
     q=st.session_state[K_SEARCH],
@@ -455,6 +356,8 @@ with right:
     if st.button("Not Requested", use_container_width=True):
         _action = "---"  # gravar exatamente '---'
 
+show_delivery_status("tasktable_delivery")
+
 if df_view.empty:
     st.info("No records for the selected filters.")
 else:
@@ -503,10 +406,10 @@ else:
                 for t, chunk in selected.groupby("task"):
                     total += bulk_log(chunk, t, status_to_write)
                 if total > 0:
-                    st.success(f"{total} record(s) updated.", icon="✅")
+                    st.success(f"{total} record(s) queued for upload.", icon="📤")
                     st.rerun()
             else:
                 count = bulk_log(selected, sel_task, status_to_write)
                 if count > 0:
-                    st.success(f"{count} record(s) updated as '{status_to_write}'.", icon="✅")
+                    st.success(f"{count} record(s) queued as '{status_to_write}'.", icon="📤")
                     st.rerun()
@@ -1,4 +1,4 @@
-from components.layout import bootstrap_page
+from components.layout import bootstrap_page, show_data_age
 import streamlit as st
 
 bootstrap_page("Bus Attendance")  # <- PRIMEIRA LINHA DA PÁGINA
@@ -8,8 +8,6 @@ st.title("Bus Attendance")
 # --- 0. Import Libraries ---
 import streamlit as st
 import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
 from datetime import datetime
 import html
 import time
@@ -22,6 +20,7 @@ MAIN_SHEET_NAME = "UAEW_App"
 ATHLETES_TAB_NAME = "df"
 USERS_TAB_NAME = "Users"
 ATTENDANCE_TAB_NAME = "Attendance"
+ATTENDANCE_COLUMNS = ["#", "Event", "Athlete ID", "Name", "Task", "Status", "User", "Timestamp", "Notes"] # ordem das linhas gravadas (cabeçalho se a aba estiver vazia)
 ID_COLUMN_IN_ATTENDANCE = "Athlete ID"
 CONFIG_TAB_NAME = "Config"
 
@@ -48,56 +47,36 @@ STATUS_COLOR_MAP = {
     "Serious Ambulance": "#dc3545",
 }
 
-# --- 2. Google Sheets Connection (código inalterado) ---
-@st.cache_resource(ttl=3600)
-def get_gspread_client():
-    try:
-        scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-        creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=scope)
-        return gspread.authorize(creds)
-    except Exception as e:
-        st.error(f"Erro de conexão com o Google: {e}", icon="🚨"); st.stop()
-
-def connect_gsheet_tab(gspread_client, sheet_name: str, tab_name: str):
-    try:
-        spreadsheet = gspread_client.open(sheet_name)
-        return spreadsheet.worksheet(tab_name)
-    except gspread.exceptions.SpreadsheetNotFound:
-        st.error(f"Erro: Planilha '{sheet_name}' não encontrada.", icon="🚨"); st.stop()
-    except gspread.exceptions.WorksheetNotFound:
-        st.error(f"Erro: Aba '{tab_name}' não encontrada.", icon="🚨"); st.stop()
+# --- 2. Google Sheets Connection ---
+from utils import snapshot_records, snapshot_values, invalidate_snapshot, store_derived, append_rows, allocate_row_number, get_status_index
 
 # --- 3. Data Loading (código inalterado) ---
-@st.cache_data(ttl=600)
 def load_athlete_data(sheet_name: str = MAIN_SHEET_NAME, athletes_tab_name: str = ATHLETES_TAB_NAME):
     try:
-        gspread_client = get_gspread_client()
-        worksheet = connect_gsheet_tab(gspread_client, sheet_name, athletes_tab_name)
-        data = worksheet.get_all_records()
-        if not data: return pd.DataFrame()
-        df = pd.DataFrame(data)
-
-        for col in ["ROLE", "INACTIVE", "EVENT", "IMAGE", "MOBILE", "NAME", "ID"]:
-            if col not in df.columns:
-                df[col] = "" if col != "EVENT" else "Z"
-
-        df.columns = df.columns.str.strip()
-        df["INACTIVE"] = df["INACTIVE"].astype(str).str.upper().map({'FALSE': False, 'TRUE': True, '': True}).fillna(True)
-        df = df[(df["ROLE"] == "1 - Fighter") & (df["INACTIVE"] == False)].copy()
-        
-        df["EVENT"] = df["EVENT"].fillna("Z")
-        df["IMAGE"] = df["IMAGE"].fillna("")
-        df["MOBILE"] = df["MOBILE"].fillna("")
-        
-        return df.sort_values(by=["EVENT", "NAME"]).reset_index(drop=True)
+        return store_derived(athletes_tab_name, "bus:athletes", _prepare_athlete_data, sheet_name, source="record_dicts")
     except Exception as e:
         st.error(f"Erro ao carregar dados dos atletas: {e}", icon="🚨"); return pd.DataFrame()
 
-@st.cache_data(ttl=300)
+def _prepare_athlete_data(data: list):
+    if not data: return pd.DataFrame()
+    df = pd.DataFrame(data)
+
+    for col in ["ROLE", "INACTIVE", "EVENT", "IMAGE", "MOBILE", "NAME", "ID"]:
+        if col not in df.columns:
+            df[col] = "" if col != "EVENT" else "Z"
+
+    df.columns = df.columns.str.strip()
+    df["INACTIVE"] = df["INACTIVE"].astype(str).str.upper().map({'FALSE': False, 'TRUE': True, '': True}).fillna(True)
+    df = df[(df["ROLE"] == "1 - Fighter") & (df["INACTIVE"] == False)].copy()
+    
+    df["EVENT"] = df["EVENT"].fillna("Z")
+    df["IMAGE"] = df["IMAGE"].fillna("")
+    df["MOBILE"] = df["MOBILE"].fillna("")
+    
+    return df.sort_values(by=["EVENT", "NAME"]).reset_index(drop=True)
+
 def load_users_data(sheet_name: str = MAIN_SHEET_NAME, users_tab_name: str = USERS_TAB_NAME):
-    gspread_client = get_gspread_client()
-    worksheet = connect_gsheet_tab(gspread_client, sheet_name, users_tab_name)
-    return worksheet.get_all_records() or []
+    return snapshot_records(users_tab_name, sheet_name) or []
 
 def get_valid_user_info(user_input: str):
     if not user_input: return None
@@ -109,71 +88,45 @@ def get_valid_user_info(user_input: str):
         if ps_sheet == proc_input or name_sheet == proc_input: return record
     return None
 
-@st.cache_data(ttl=600)
 def load_config_data(sheet_name: str = MAIN_SHEET_NAME, config_tab_name: str = CONFIG_TAB_NAME):
-    gspread_client = get_gspread_client()
-    worksheet = connect_gsheet_tab(gspread_client, sheet_name, config_tab_name)
-    data = worksheet.get_all_values()
+    data = snapshot_values(config_tab_name, sheet_name)
     if not data: return []
     df_conf = pd.DataFrame(data[1:], columns=data[0])
     tasks = df_conf["TaskList"].dropna().unique().tolist() if "TaskList" in df_conf.columns else []
     return tasks
 
-@st.cache_data(ttl=120)
-def load_attendance_data(sheet_name: str = MAIN_SHEET_NAME, attendance_tab_name: str = ATTENDANCE_TAB_NAME):
-    gspread_client = get_gspread_client()
-    worksheet = connect_gsheet_tab(gspread_client, sheet_name, attendance_tab_name)
-    data = worksheet.get_all_records()
-    
-    expected_cols = ["#", "Event", ID_COLUMN_IN_ATTENDANCE, "Name", "Task", "Status", "User", "Timestamp", "Notes"]
-
-    if not data:
-        return pd.DataFrame(columns=expected_cols)
-
-    df_att = pd.DataFrame(data)
-    for col in expected_cols:
-        if col not in df_att.columns:
-            df_att[col] = pd.NA
-            
-    return df_att
-
 def registrar_log(ath_id: str, ath_name: str, ath_event: str, task: str, status: str, notes: str, user_log_id: str):
     try:
-        gspread_client = get_gspread_client()
-        log_ws = connect_gsheet_tab(gspread_client, MAIN_SHEET_NAME, ATTENDANCE_TAB_NAME)
         ts = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
         user_ident = st.session_state.get('current_user_name', user_log_id)
-        next_num = len(log_ws.get_all_values()) + 1
+        next_num = allocate_row_number(ATTENDANCE_TAB_NAME, MAIN_SHEET_NAME)
         new_row_data = [str(next_num), ath_event, ath_id, ath_name, task, status, user_ident, ts, notes]
-        log_ws.append_row(new_row_data, value_input_option="USER_ENTERED")
+        append_rows(ATTENDANCE_TAB_NAME, [new_row_data], MAIN_SHEET_NAME, header_default=ATTENDANCE_COLUMNS)
         st.success(f"'{task}' para {ath_name} registrado como '{status}'.", icon="✍️")
-        load_attendance_data.clear()
+        invalidate_snapshot(tabs=(ATTENDANCE_TAB_NAME,))
         return True
     except Exception as e:
         st.error(f"Erro ao registrar log: {e}", icon="🚨")
         return False
 
-# --- Helper Function (código inalterado) ---
-def get_latest_status_and_user(athlete_id, task, attendance_df):
-    if attendance_df.empty or task is None:
+# --- Helper Function ---
+# Último registro da tarefa (qualquer evento), do índice compartilhado da Attendance
+def get_latest_status_and_user(athlete_id, task, status_idx):
+    if task is None:
         return STATUS_PENDING, "N/A", "N/A"
-
-    athlete_records = attendance_df[
-        (attendance_df[ID_COLUMN_IN_ATTENDANCE].astype(str) == str(athlete_id)) & 
-        (attendance_df["Task"] == task)
-    ].copy()
-
-    if athlete_records.empty:
+    latest = status_idx.find(athlete_id, None, task)
+    if latest is None:
         return STATUS_PENDING, "N/A", "N/A"
-    
-    athlete_records['TS_dt'] = pd.to_datetime(athlete_records['Timestamp'], format="%d/%m/%Y %H:%M:%S", errors='coerce')
-    latest_record = athlete_records.sort_values(by="TS_dt", ascending=False, na_position='first').iloc[-1]
-    
-    status = latest_record.get("Status", STATUS_PENDING)
-    user = latest_record.get("User", "N/A")
-    timestamp = latest_record.get("Timestamp", "N/A")
+    return latest["status"], latest["user"] or "N/A", latest["ts_raw"] or "N/A"
 
-    return status, user, timestamp
+def get_latest_status_for_all(athlete_ids: pd.Series, task, status_idx) -> pd.DataFrame:
+    """Mesmo que get_latest_status_and_user, para a coluna de IDs inteira numa passada."""
+    latest = status_idx.join(athlete_ids, None, task)
+    return pd.DataFrame({
+        'current_task_status': latest["status"].fillna(STATUS_PENDING),
+        'latest_task_user': latest["user"].replace("", pd.NA).fillna("N/A"),
+        'latest_task_timestamp': latest["ts_raw"].replace("", pd.NA).fillna("N/A"),
+    })
 
 # --- 6. Main Application Logic ---
 st.title(f"UAEW | {ACTIVE_TASK_NAME}")
@@ -219,7 +172,8 @@ if st.session_state.user_confirmed:
     with st.spinner("Carregando dados..."):
         all_tasks_from_config = load_config_data()
         df_athletes = load_athlete_data()
-        df_attendance = load_attendance_data()
+        status_idx = get_status_index("id", MAIN_SHEET_NAME)
+    show_data_age()
 
     # --- Sidebar Section ---
     with st.sidebar:
@@ -243,8 +197,8 @@ if st.session_state.user_confirmed:
         )
         st.session_state.hide_comments = hide_actions
 
-    df_athletes[['current_task_status', 'latest_task_user', 'latest_task_timestamp']] = df_athletes['ID'].apply(
-        lambda id: pd.Series(get_latest_status_and_user(id, ACTIVE_TASK_NAME, df_attendance))
+    df_athletes[['current_task_status', 'latest_task_user', 'latest_task_timestamp']] = get_latest_status_for_all(
+        df_athletes['ID'], ACTIVE_TASK_NAME, status_idx
     )
     st.divider()
 
@@ -295,7 +249,7 @@ if st.session_state.user_confirmed:
                 if st.session_state.selected_badge_tasks:
                     badges_html = "<div style='display: flex; flex-wrap: wrap; gap: 8px; margin-top: 10px; margin-left: 5px;'>"
                     for task_for_badge in st.session_state.selected_badge_tasks:
-                        status_for_badge, user_for_badge, ts_for_badge = get_latest_status_and_user(ath_id_d, task_for_badge, df_attendance)
+                        status_for_badge, user_for_badge, ts_for_badge = get_latest_status_and_user(ath_id_d, task_for_badge, status_idx)
                         color = STATUS_COLOR_MAP.get(status_for_badge, STATUS_COLOR_MAP[STATUS_PENDING])
                         badge_style = f"background-color: {color}; color: white; padding: 3px 10px; border-radius: 12px; font-size: 12px;"
                         tooltip_content = f"Status: {str(status_for_badge)}\\nAtualizado por: {str(user_for_badge)}\\nEm: {str(ts_for_badge)}"
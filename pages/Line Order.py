@@ -1,10 +1,8 @@
 import streamlit as st
 import pandas as pd
-from streamlit_autorefresh import st_autorefresh
 from datetime import datetime
 import pytz
-import gspread
-from google.oauth2.service_account import Credentials
+from utils import snapshot_records, append_rows, next_sequence
 
 # --- Page Configuration ---
 st.set_page_config(page_title="Task Control", layout="wide")
@@ -45,12 +43,6 @@ if 'selected_corner' not in st.session_state: st.session_state.selected_corner =
 if 'create_new_task' not in st.session_state: st.session_state.create_new_task = False
 
 # --- Data Loading and Backend Functions ---
-@st.cache_resource(ttl=3600)
-def get_gspread_client():
-    scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=scope)
-    return gspread.authorize(creds)
-
 @st.cache_data(ttl=300)
 def load_base_athlete_data(url):
     try:
@@ -62,34 +54,38 @@ def load_base_athlete_data(url):
         return df
     except Exception as e: st.error(f"Error loading base athlete data: {e}"); return pd.DataFrame()
 
+@st.cache_data(ttl=10)
+def load_live_queue_rows():
+    # Full LiveQueue history via the shared utils read; one read serves the page and the check-in counter
+    return pd.DataFrame(snapshot_records(LIVE_QUEUE_SHEET_NAME, MAIN_SHEET_NAME))
+
 @st.cache_data(ttl=10)
 def load_live_queue_data_all():
     try:
-        client = get_gspread_client()
-        sheet = client.open(MAIN_SHEET_NAME).worksheet(LIVE_QUEUE_SHEET_NAME)
-        df = pd.DataFrame(sheet.get_all_records())
+        df = load_live_queue_rows()
         if df.empty: return pd.DataFrame(columns=['TaskName', 'AthleteID', 'Status', 'CheckinNumber', 'Timestamp'])
         df['AthleteID'] = df['AthleteID'].astype(str)
         df['Timestamp'] = pd.to_datetime(df['Timestamp'], errors='coerce')
         return df.sort_values('Timestamp').groupby(['TaskName', 'AthleteID']).tail(1)
     except Exception as e: st.error(f"Error loading live queue: {e}"); return pd.DataFrame(columns=['TaskName', 'AthleteID', 'Status', 'CheckinNumber', 'Timestamp'])
 
+def max_checkin_number(task_name):
+    all_records = load_live_queue_rows()
+    if all_records.empty or 'TaskName' not in all_records.columns: return 0
+    max_order = pd.to_numeric(all_records.loc[all_records['TaskName'] == task_name, 'CheckinNumber'], errors='coerce').max()
+    return int(max_order) if pd.notna(max_order) else 0
+
 def update_athlete_status_on_sheet(task_name, athlete_id, new_status):
     try:
-        client = get_gspread_client(); sheet = client.open(MAIN_SHEET_NAME).worksheet(LIVE_QUEUE_SHEET_NAME)
         check_in_number = ""
         if new_status == 'na fila':
-            all_records = pd.DataFrame(sheet.get_all_records())
-            if not all_records.empty and 'TaskName' in all_records.columns:
-                task_records = all_records[all_records['TaskName'] == task_name]
-                max_order = pd.to_numeric(task_records['CheckinNumber'], errors='coerce').max()
-                check_in_number = int(max_order + 1) if pd.notna(max_order) else 1
-            else:
-                check_in_number = 1
+            # Server-side counter per task (atomic across desks). The sheet's max is passed on every call:
+            # if it drops (task queue cleared for a new event/day) numbering restarts from it, as before.
+            check_in_number = next_sequence("line_order", task_name, observed=max_checkin_number(task_name))
         
         timestamp = datetime.now(pytz.utc).strftime('%Y-%m-%d %H:%M:%S')
         new_row = [timestamp, task_name, str(athlete_id), new_status, str(check_in_number)]
-        sheet.append_row(new_row, value_input_option='USER_ENTERED')
+        append_rows(LIVE_QUEUE_SHEET_NAME, [new_row], MAIN_SHEET_NAME)
         st.cache_data.clear()
         return True
     except Exception as e: st.error(f"Failed to update status: {e}"); return False
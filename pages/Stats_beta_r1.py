@@ -14,7 +14,8 @@ bootstrap_page("Stats")
 st.title("Stats")
 
 # --- Project Imports ---
-from utils import get_gspread_client, connect_gsheet_tab
+from utils import snapshot_records, invalidate_snapshot, store_derived, show_notices, with_notices, append_rows, tab_header, allocate_row_number
+from ts_parse import parse_ts_series
 
 # ==============================================================================
 # CONSTANTS & CONFIG
@@ -26,6 +27,8 @@ class Config:
     ATHLETES_TAB_NAME = "df"
     ATTENDANCE_TAB_NAME = "Attendance"
     STATS_TAB_NAME = "df [Stats]"
+    # Column order of the rows this page appends to Attendance (header written if the tab is empty)
+    ATTENDANCE_COLUMNS = ["#", "Event", "Athlete ID", "Name", "Fighter", "Task", "Status", "User", "Timestamp", "TimeStamp", "Notes"]
 
     # Fixed Task name for this page
     FIXED_TASK = "Stats"
@@ -133,21 +136,6 @@ def clean_and_normalize(text: str) -> str:
     text = "".join([c for c in text if not unicodedata.combining(c)])
     return " ".join(text.split())
 
-def parse_ts_series(raw: pd.Series) -> pd.Series:
-    if raw is None or raw.empty:
-        return pd.Series([], dtype='datetime64[ns]')
-    tries = [
-        pd.to_datetime(raw, format="%d/%m/%Y %H:%M:%S", errors="coerce"),
-        pd.to_datetime(raw, format="%d/%m/%Y", errors="coerce"),
-        pd.to_datetime(raw, format="%d-%m-%Y %H:%M:%S", errors="coerce"),
-        pd.to_datetime(raw, format="%d-%m-%Y", errors="coerce"),
-        pd.to_datetime(raw, errors="coerce"),
-    ]
-    ts_final = tries[0]
-    for cand in tries[1:]:
-        ts_final = ts_final.fillna(cand)
-    return ts_final
-
 def _clean_str_series(s: pd.Series) -> pd.Series:
     if s is None or s.empty:
         return pd.Series([], dtype=str)
@@ -187,74 +175,71 @@ def field_is_empty(value) -> bool:
 # ==============================================================================
 # DATA LOADING
 # ==============================================================================
-@st.cache_data(ttl=600)
 def load_athletes() -> pd.DataFrame:
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET_NAME, Config.ATHLETES_TAB_NAME)
-        df = pd.DataFrame(ws.get_all_records())
-        if df.empty:
-            return pd.DataFrame()
-        df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
-
-        if Config.COL_ROLE not in df.columns or Config.COL_INACTIVE not in df.columns:
-            st.error("Columns 'ROLE'/'INACTIVE' not found in athletes sheet.", icon="🚨")
-            return pd.DataFrame()
-
-        if df[Config.COL_INACTIVE].dtype == "object":
-            df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].astype(str).str.upper().map(
-                {"FALSE": False, "TRUE": True, "": True}
-            ).fillna(True)
-        elif pd.api.types.is_numeric_dtype(df[Config.COL_INACTIVE]):
-            df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].map({0: False, 1: True}).fillna(True)
-
-        df = df[(df[Config.COL_ROLE] == "1 - Fighter") & (df[Config.COL_INACTIVE] == False)].copy()
-
-        df[Config.COL_EVENT] = df.get(Config.COL_EVENT, "").fillna(Config.DEFAULT_EVENT_PLACEHOLDER)
-        for col in [Config.COL_IMAGE, Config.COL_MOBILE, Config.COL_FIGHT_NUMBER, Config.COL_CORNER, Config.COL_PASSPORT_IMAGE, Config.COL_ROOM]:
-            if col not in df.columns:
-                df[col] = ""
-            else:
-                df[col] = df[col].fillna("")
-
-        if Config.COL_NAME not in df.columns or Config.COL_ID not in df.columns:
-            st.error("'name' or 'id' missing in athletes sheet.", icon="🚨")
-            return pd.DataFrame()
-
-        return df.sort_values(by=[Config.COL_EVENT, Config.COL_NAME]).reset_index(drop=True)
+        return show_notices(store_derived(Config.ATHLETES_TAB_NAME, "stats_beta:athletes", _prepare_athletes, Config.MAIN_SHEET_NAME))
     except Exception as e:
         st.error(f"Error loading athletes: {e}", icon="🚨")
         return pd.DataFrame()
 
+def _prepare_athletes(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty:
+        return pd.DataFrame()
+    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+
+    if Config.COL_ROLE not in df.columns or Config.COL_INACTIVE not in df.columns:
+        return with_notices(pd.DataFrame(), ("error", "Columns 'ROLE'/'INACTIVE' not found in athletes sheet."))
+
+    if df[Config.COL_INACTIVE].dtype == "object":
+        df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].astype(str).str.upper().map(
+            {"FALSE": False, "TRUE": True, "": True}
+        ).fillna(True)
+    elif pd.api.types.is_numeric_dtype(df[Config.COL_INACTIVE]):
+        df[Config.COL_INACTIVE] = df[Config.COL_INACTIVE].map({0: False, 1: True}).fillna(True)
+
+    df = df[(df[Config.COL_ROLE] == "1 - Fighter") & (df[Config.COL_INACTIVE] == False)].copy()
+
+    df[Config.COL_EVENT] = df.get(Config.COL_EVENT, "").fillna(Config.DEFAULT_EVENT_PLACEHOLDER)
+    for col in [Config.COL_IMAGE, Config.COL_MOBILE, Config.COL_FIGHT_NUMBER, Config.COL_CORNER, Config.COL_PASSPORT_IMAGE, Config.COL_ROOM]:
+        if col not in df.columns:
+            df[col] = ""
+        else:
+            df[col] = df[col].fillna("")
+
+    if Config.COL_NAME not in df.columns or Config.COL_ID not in df.columns:
+        return with_notices(pd.DataFrame(), ("error", "'name' or 'id' missing in athletes sheet."))
+
+    return df.sort_values(by=[Config.COL_EVENT, Config.COL_NAME]).reset_index(drop=True)
+
 
-@st.cache_data(ttl=120)
 def load_attendance() -> pd.DataFrame:
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET_NAME, Config.ATTENDANCE_TAB_NAME)
-        df_att = pd.DataFrame(ws.get_all_records())
-        if df_att.empty:
-            return pd.DataFrame(columns=[
-                Config.ATT_COL_ROWID, Config.ATT_COL_EVENT, Config.ATT_COL_ATHLETE_ID,
-                Config.ATT_COL_NAME, Config.ATT_COL_FIGHTER, Config.ATT_COL_TASK, Config.ATT_COL_STATUS,
-                Config.ATT_COL_USER, Config.ATT_COL_TIMESTAMP, Config.ATT_COL_TIMESTAMP_ALT, Config.ATT_COL_NOTES
-            ])
-        for col in [
-            Config.ATT_COL_ROWID, Config.ATT_COL_EVENT, Config.ATT_COL_ATHLETE_ID,
-            Config.ATT_COL_NAME, Config.ATT_COL_FIGHTER, Config.ATT_COL_TASK, Config.ATT_COL_STATUS,
-            Config.ATT_COL_USER, Config.ATT_COL_TIMESTAMP, Config.ATT_COL_TIMESTAMP_ALT, Config.ATT_COL_NOTES
-        ]:
-            if col not in df_att.columns:
-                df_att[col] = pd.NA
-        df_att[Config.ATT_COL_ATHLETE_ID] = df_att[Config.ATT_COL_ATHLETE_ID].astype(str)
-        return df_att
+        return store_derived(Config.ATTENDANCE_TAB_NAME, "stats_beta:attendance_norm",
+                             lambda df: preprocess_attendance(_prepare_attendance(df)), Config.MAIN_SHEET_NAME)
     except Exception as e:
         st.error(f"Error loading attendance: {e}", icon="🚨")
         return pd.DataFrame()
 
+def _prepare_attendance(df_att: pd.DataFrame) -> pd.DataFrame:
+    if df_att.empty:
+        return pd.DataFrame(columns=[
+            Config.ATT_COL_ROWID, Config.ATT_COL_EVENT, Config.ATT_COL_ATHLETE_ID,
+            Config.ATT_COL_NAME, Config.ATT_COL_FIGHTER, Config.ATT_COL_TASK, Config.ATT_COL_STATUS,
+            Config.ATT_COL_USER, Config.ATT_COL_TIMESTAMP, Config.ATT_COL_TIMESTAMP_ALT, Config.ATT_COL_NOTES
+        ])
+    for col in [
+        Config.ATT_COL_ROWID, Config.ATT_COL_EVENT, Config.ATT_COL_ATHLETE_ID,
+        Config.ATT_COL_NAME, Config.ATT_COL_FIGHTER, Config.ATT_COL_TASK, Config.ATT_COL_STATUS,
+        Config.ATT_COL_USER, Config.ATT_COL_TIMESTAMP, Config.ATT_COL_TIMESTAMP_ALT, Config.ATT_COL_NOTES
+    ]:
+        if col not in df_att.columns:
+            df_att[col] = pd.NA
+    df_att[Config.ATT_COL_ATHLETE_ID] = df_att[Config.ATT_COL_ATHLETE_ID].astype(str)
+    return df_att
+
 
-@st.cache_data(ttl=120)
 def preprocess_attendance(df_attendance: pd.DataFrame) -> pd.DataFrame:
+    """Colunas normalizadas e TS_dt; roda dentro do loader, uma vez por versão da Attendance."""
     if df_attendance is None or df_attendance.empty:
         return pd.DataFrame()
     df = df_attendance.copy()
@@ -279,22 +264,16 @@ def preprocess_attendance(df_attendance: pd.DataFrame) -> pd.DataFrame:
 @st.cache_data(ttl=600)
 def load_stats() -> pd.DataFrame:
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET_NAME, Config.STATS_TAB_NAME)
-        df = pd.DataFrame(ws.get_all_records())
-        return df
+        # aba fora do snapshot: servida pelo espelho local quando configurado
+        return pd.DataFrame(snapshot_records(Config.STATS_TAB_NAME, Config.MAIN_SHEET_NAME))
     except Exception as e:
         st.error(f"Error loading stats: {e}", icon="🚨")
         return pd.DataFrame()
 
 
-def add_stats_record(row_dict: dict) -> bool:
-    """Append an aligned record to 'df [Stats]'."""
+def add_stats_records(row_dicts: list) -> bool:
+    """Append aligned records to 'df [Stats]' in a single call."""
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET_NAME, Config.STATS_TAB_NAME)
-        all_vals = ws.get_all_values()
-
         default_header = [
             'stats_record_id', 'fighter_id', 'fighter_event_name', 'gender',
             'weight_kg', 'height_cm', 'reach_cm', 'fight_style',
@@ -302,72 +281,82 @@ def add_stats_record(row_dict: dict) -> bool:
             'tshirt_size', 'updated_by_user', 'updated_at', 'event',
             'tshirt_size_c1', 'tshirt_size_c2', 'tshirt_size_c3', 'operation'
         ]
-
-        if not all_vals:
-            ws.append_row(default_header, value_input_option="USER_ENTERED")
-            header = default_header
-            next_id = 1
-        else:
-            header = all_vals[0]
-            if set(default_header) - set(header):
-                header = header + [c for c in default_header if c not in header]
-                ws.update(f"A1:{chr(64+len(header))}1", [header])
-            next_id = len(all_vals)  # header + existing rows
-
-        row_dict = dict(row_dict)
-        row_dict['stats_record_id'] = row_dict.get('stats_record_id', next_id)
-        aligned = [row_dict.get(c, "") for c in header]
-        ws.append_row(aligned, value_input_option="USER_ENTERED")
-        st.success("Stats saved.", icon="💾")
+        # cabeçalho em cache no processo (só grava a linha 1 se a aba estiver vazia ou faltar coluna)
+        header = tab_header(Config.STATS_TAB_NAME, Config.MAIN_SHEET_NAME, default=default_header, required=default_header)
+        first_id = allocate_row_number(Config.STATS_TAB_NAME, Config.MAIN_SHEET_NAME, len(row_dicts)) - 1  # header + existing rows
+
+        rows = []
+        for n, row_dict in enumerate(row_dicts):
+            row_dict = dict(row_dict)
+            row_dict['stats_record_id'] = row_dict.get('stats_record_id', first_id + n)
+            rows.append([row_dict.get(c, "") for c in header])
+        append_rows(Config.STATS_TAB_NAME, rows, Config.MAIN_SHEET_NAME)
         load_stats.clear()
+        invalidate_snapshot(tabs=(Config.STATS_TAB_NAME,))
         return True
     except Exception as e:
         st.error(f"Error saving stats: {e}", icon="🚨")
         return False
 
 
-def registrar_log(
-    athlete_id: str,
-    ath_name: str,
-    ath_event: str,
-    task: str,
-    status: str,
-    user_log_id: str,
-    notes: str = ""
-) -> bool:
+def add_stats_record(row_dict: dict) -> bool:
+    """Append an aligned record to 'df [Stats]'."""
+    if not add_stats_records([row_dict]):
+        return False
+    st.success("Stats saved.", icon="💾")
+    return True
+
+
+def registrar_logs(entries: list) -> bool:
     """
-    Append a row to Attendance with columns:
+    Append rows to Attendance in a single call; each entry: dict with athlete_id, ath_name,
+    ath_event, task, status, user_log_id and optional notes. Columns:
     ["#", "Event", "Athlete ID", "Name", "Fighter", "Task", "Status", "User", "Timestamp", "TimeStamp", "Notes"]
     """
     try:
-        gc = get_gspread_client()
-        ws = connect_gsheet_tab(gc, Config.MAIN_SHEET_NAME, Config.ATTENDANCE_TAB_NAME)
-        all_vals = ws.get_all_values()
-        next_num = (int(all_vals[-1][0]) + 1) if (len(all_vals) > 1 and str(all_vals[-1][0]).isdigit()) else (len(all_vals) + 1)
+        first_num = allocate_row_number(Config.ATTENDANCE_TAB_NAME, Config.MAIN_SHEET_NAME, len(entries))
         ts = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        user_ident = st.session_state.get('current_user_name', user_log_id)
-
-        new_row = [
-            str(next_num),
-            ath_event,
-            str(athlete_id),
-            ath_name,
-            ath_name,
-            task,
-            status,
-            user_ident,
-            ts,  # "Timestamp"
-            ts,  # "TimeStamp" (required)
-            notes
-        ]
-        ws.append_row(new_row, value_input_option="USER_ENTERED")
-        load_attendance.clear()
+
+        rows = []
+        for n, e in enumerate(entries):
+            user_ident = st.session_state.get('current_user_name', e["user_log_id"])
+            rows.append([
+                str(first_num + n),
+                e["ath_event"],
+                str(e["athlete_id"]),
+                e["ath_name"],
+                e["ath_name"],
+                e["task"],
+                e["status"],
+                user_ident,
+                ts,  # "Timestamp"
+                ts,  # "TimeStamp" (required)
+                e.get("notes", "")
+            ])
+        append_rows(Config.ATTENDANCE_TAB_NAME, rows, Config.MAIN_SHEET_NAME, header_default=Config.ATTENDANCE_COLUMNS)
+        invalidate_snapshot(tabs=(Config.ATTENDANCE_TAB_NAME,))
         return True
     except Exception as e:
         st.error(f"Error writing Attendance: {e}", icon="🚨")
         return False
 
 
+def registrar_log(
+    athlete_id: str,
+    ath_name: str,
+    ath_event: str,
+    task: str,
+    status: str,
+    user_log_id: str,
+    notes: str = ""
+) -> bool:
+    """Append a single row to Attendance (see registrar_logs)."""
+    return registrar_logs([{
+        "athlete_id": athlete_id, "ath_name": ath_name, "ath_event": ath_event,
+        "task": task, "status": status, "user_log_id": user_log_id, "notes": notes,
+    }])
+
+
 # ==============================================================================
 # PAGE UI & LOGIC
 # ==============================================================================
@@ -388,10 +377,9 @@ for k, v in default_ss.items():
 # --- Load Data ---
 with st.spinner("Loading data..."):
     df_athletes = load_athletes()
-    df_att_raw = load_attendance()
+    df_att = load_attendance()   # já normalizada (uma vez por versão)
     df_stats = load_stats()
 
-df_att = preprocess_attendance(df_att_raw)
 
 # --- Compute current status per athlete (for Task = Stats) ---
 def compute_task_status_for_athletes(df_athletes, df_attendance, fixed_task: str) -> pd.DataFrame:
@@ -567,72 +555,55 @@ def _apply_table_changes(df_before: pd.DataFrame, df_after: pd.DataFrame, df_peo
 
     people_idx = df_people.copy()
     people_idx[Config.COL_ID] = people_idx[Config.COL_ID].astype(str)
-    people_idx = people_idx.set_index(Config.COL_ID, drop=False)
-
-    changes = []
-    rows = min(len(df_before), len(df_after))
-    for i in range(rows):
-        before_row = df_before.iloc[i]
-        after_row  = df_after.iloc[i]
-
-        ath_id = str(after_row.get("ID", "")).strip()
-        if not ath_id or ath_id not in people_idx.index:
-            continue
-        person = people_idx.loc[ath_id]
-        ath_name  = str(person.get(Config.COL_NAME, ""))
-        ath_event = str(person.get(Config.COL_EVENT, ""))
-
-        changed = False
-        payload_full = {}
-        for f in Config.STATS_FIELDS:
-            if f not in after_row:
-                continue
-            old = before_row.get(f, "")
-            new = after_row.get(f, "")
-            if str(old).strip() != str(new).strip():
-                changed = True
-            payload_full[f] = new
-
-        if changed:
-            changes.append({
-                "id": ath_id,
-                "name": ath_name,
-                "event": ath_event,
-                "payload": payload_full
-            })
-
-    if not changes:
+    people_idx = people_idx.drop_duplicates(subset=Config.COL_ID).set_index(Config.COL_ID, drop=False)
+
+    # diff vetorizado: compara as duas tabelas (posição a posição) de uma vez
+    n = min(len(df_before), len(df_after))
+    fields = [f for f in Config.STATS_FIELDS if f in df_after.columns]
+    after = df_after.iloc[:n].reset_index(drop=True)
+
+    def as_text(df: pd.DataFrame) -> pd.DataFrame:
+        return df.reindex(columns=fields).fillna("").astype(str).apply(lambda col: col.str.strip())
+
+    changed = as_text(df_before.iloc[:n].reset_index(drop=True)).ne(as_text(after)).any(axis=1)
+    ids = after["ID"].astype(str).str.strip() if "ID" in after.columns else pd.Series("", index=after.index)
+    changed &= ids.ne("") & ids.isin(people_idx.index)
+
+    if not changed.any():
         st.info("Nenhuma modificação encontrada.")
         return
 
-    ok = 0
-    for ch in changes:
+    ch_ids = ids[changed]
+    names = ch_ids.map(people_idx[Config.COL_NAME]).fillna("").astype(str)
+    events = ch_ids.map(people_idx[Config.COL_EVENT]).fillna("").astype(str)
+    payloads = after.loc[changed, fields].to_dict("records")
+
+    now = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+    user = st.session_state.get('current_user_name', 'System')
+    stats_rows, log_entries = [], []
+    for ath_id, ath_name, ath_event, payload in zip(ch_ids, names, events, payloads):
         row_data = {
-            'fighter_id': ch["id"],
-            'fighter_event_name': ch["name"],
-            'event': ch["event"],
-            'updated_at': datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-            'updated_by_user': st.session_state.get('current_user_name', 'System'),
+            'fighter_id': ath_id,
+            'fighter_event_name': ath_name,
+            'event': ath_event,
+            'updated_at': now,
+            'updated_by_user': user,
             'operation': "updated_from_table"
         }
-        row_data.update(ch["payload"])
-
-        if add_stats_record(row_data):
-            registrar_log(
-                athlete_id=ch["id"],
-                ath_name=ch["name"],
-                ath_event=ch["event"],
-                task=Config.FIXED_TASK,
-                status=Config.STATUS_DONE,
-                user_log_id=st.session_state.get('current_user_name', 'System'),
-                notes="Edited via table"
-            )
-            ok += 1
-
-    st.success(f"{ok} linha(s) salva(s).", icon="✅")
-    load_stats.clear()
-    load_attendance.clear()
-    time.sleep(0.6)
+        row_data.update(payload)
+        stats_rows.append(row_data)
+        log_entries.append({
+            "athlete_id": ath_id, "ath_name": ath_name, "ath_event": ath_event,
+            "task": Config.FIXED_TASK, "status": Config.STATUS_DONE,
+            "user_log_id": user, "notes": "Edited via table",
+        })
+
+    # um append no df [Stats] e um no Attendance para o lote inteiro
+    if not add_stats_records(stats_rows):
+        return
+    registrar_logs(log_entries)
+
+    st.success(f"{len(stats_rows)} linha(s) salva(s).", icon="✅")
     st.rerun()
 
 def render_table_mode():
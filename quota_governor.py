@@ -0,0 +1,177 @@
+#quota_governor.py
+
+# --- 0. Import Libraries ---
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+# --- Constants ---
+# Cota do Sheets por usuário (a service account conta como um usuário só)
+READ_QUOTA_PER_MIN = 60
+WRITE_QUOTA_PER_MIN = 60
+BURST = 15                # fichas acumuláveis; o resto é reposto ao longo do minuto
+BACKGROUND_RESERVE = 5    # fichas que leituras de fundo não podem consumir
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0        # segundos
+BACKOFF_CAP = 32.0
+
+PRIORITY_WRITE = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BACKGROUND = 2
+
+# Leituras podem ser repetidas em qualquer erro transitório; gravações só quando
+# a API garante que nada foi aplicado (429 / 503), a menos que sejam idempotentes
+# (ver idempotent_writes).
+_RETRY_READ = {408, 429, 500, 502, 503, 504}
+_RETRY_WRITE = {429, 503}
+
+
+# --- 1. Token bucket ---
+class _Bucket:
+    def __init__(self, per_minute: int, burst: int):
+        self.capacity = float(burst)
+        # capacidade + reposição em 60 s nunca passam da cota do minuto
+        self.rate = max(per_minute - burst, 1) / 60.0
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class QuotaGovernor:
+    """
+    Governa todas as chamadas do processo à API do Sheets (todas as sessões usam o mesmo cliente).
+    - Baldes separados para leitura e gravação, medidos contra a cota por minuto.
+    - Fila por prioridade: gravação > interativo > fundo; leituras de fundo deixam
+      BACKGROUND_RESERVE fichas livres para quem está clicando.
+    - Depois de um 429 o balde é zerado, para as próximas chamadas desacelerarem juntas.
+    """
+    def __init__(self, read_per_min: int = READ_QUOTA_PER_MIN, write_per_min: int = WRITE_QUOTA_PER_MIN, burst: int = BURST):
+        self._cond = threading.Condition()
+        self._buckets = {"read": _Bucket(read_per_min, burst), "write": _Bucket(write_per_min, burst)}
+        self._waiting = {"read": [], "write": []}   # heaps de (prioridade, seq)
+        self._seq = itertools.count()
+        self.throttled = 0   # 429/5xx vistos (diagnóstico)
+
+    def acquire(self, kind: str, priority: int = PRIORITY_INTERACTIVE):
+        ticket = (priority, next(self._seq))
+        bucket = self._buckets[kind]
+        # a reserva nunca pode ocupar o balde inteiro, senão o fundo não anda nunca
+        reserve = min(BACKGROUND_RESERVE, bucket.capacity - 1) if priority >= PRIORITY_BACKGROUND else 0
+        with self._cond:
+            heapq.heappush(self._waiting[kind], ticket)
+            try:
+                while True:
+                    bucket.refill()
+                    if self._waiting[kind][0] == ticket and bucket.tokens >= 1 + reserve:
+                        bucket.tokens -= 1
+                        return
+                    missing = max(1 + reserve - bucket.tokens, 0.0)
+                    self._cond.wait(timeout=max(missing / bucket.rate, 0.05))
+            finally:
+                self._waiting[kind].remove(ticket)
+                heapq.heapify(self._waiting[kind])
+                self._cond.notify_all()
+
+    def penalize(self, kind: str):
+        with self._cond:
+            self.throttled += 1
+            self._buckets[kind].tokens = min(self._buckets[kind].tokens, 0.0)
+
+    def queue_depth(self) -> dict:
+        with self._cond:
+            return {k: len(v) for k, v in self._waiting.items()}
+
+
+_GOVERNOR = QuotaGovernor()
+
+def get_governor() -> QuotaGovernor:
+    return _GOVERNOR
+
+
+# --- 2. Prioridade da thread atual ---
+_local = threading.local()
+
+@contextmanager
+def request_priority(priority: int):
+    """Ex.: `with request_priority(PRIORITY_BACKGROUND): ...` nas threads de revalidação."""
+    previous = getattr(_local, "priority", PRIORITY_INTERACTIVE)
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+@contextmanager
+def idempotent_writes():
+    """
+    Gravações da thread dentro do bloco são repetidas em qualquer erro transitório, como as
+    leituras. Só para linhas com Op ID: se a 1ª tentativa já tiver sido aplicada, os leitores
+    descartam a repetição.
+    """
+    previous = getattr(_local, "idempotent", False)
+    _local.idempotent = True
+    try:
+        yield
+    finally:
+        _local.idempotent = previous
+
+def _current_priority(kind: str) -> int:
+    if kind == "write":
+        return PRIORITY_WRITE
+    return getattr(_local, "priority", PRIORITY_INTERACTIVE)
+
+
+# --- 3. HTTP client do gspread com o governador ---
+def _request_kind(method: str, endpoint: str):
+    if "/drive/" in endpoint:
+        return None   # Drive tem cota própria (bem maior); só entra no backoff
+    return "read" if method.upper() == "GET" else "write"
+
+def _backoff_delay(attempt: int) -> float:
+    return min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+def governed_call(kind, call):
+    """
+    Executa `call()` sob o governador: espera ficha do balde `kind` ("read"/"write";
+    None = sem medição) e repete 429/5xx com backoff exponencial com jitter.
+    """
+    retry_any = kind != "write" or getattr(_local, "idempotent", False)
+    retryable = _RETRY_READ if retry_any else _RETRY_WRITE
+    attempt = 0
+    while True:
+        if kind:
+            _GOVERNOR.acquire(kind, _current_priority(kind))
+        try:
+            return call()
+        except APIError as err:
+            if attempt >= MAX_RETRIES or err.code not in retryable:
+                raise
+            if kind:
+                _GOVERNOR.penalize(kind)
+            time.sleep(_backoff_delay(attempt))
+            attempt += 1
+        except (requests.ConnectionError, requests.Timeout):
+            # sem resposta não dá para saber se a gravação entrou: só repete o que é seguro
+            if attempt >= MAX_RETRIES or not retry_any:
+                raise
+            time.sleep(_backoff_delay(attempt))
+            attempt += 1
+
+class GovernedHTTPClient(HTTPClient):
+    """HTTPClient do gspread em que toda requisição passa por governed_call()."""
+
+    def request(self, method: str, endpoint: str, *args, **kwargs):
+        return governed_call(_request_kind(method, endpoint),
+                             lambda: super(GovernedHTTPClient, self).request(method, endpoint, *args, **kwargs))
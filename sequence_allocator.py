@@ -0,0 +1,97 @@
+#sequence_allocator.py
+"""
+Números de ordem alocados no servidor (running order do Weight-in, CheckinNumber da Line Order).
+
+- next_value(scope, key, seed) é O(1) e atômico no processo: duas mesas clicando juntas
+  recebem números diferentes, sem ler a planilha.
+- seed() só roda na 1ª vez que a chave aparece no processo e devolve o maior número já usado
+  (do snapshot/planilha); o contador nunca volta abaixo disso, então se recupera de um restart
+  mesmo sem arquivo.
+- observed (opcional): maior número visível agora na planilha, passado a cada alocação. Na 1ª
+  leitura do processo, ou se cair abaixo da leitura anterior (linhas apagadas, ex.: fila zerada
+  para outro evento/dia), o contador recomeça dele; leituras atrasadas (igual ou maior) não mexem.
+- Com caminho configurado, cada alocação também é gravada em SQLite e recarregada na abertura.
+
+Opcional: persistência ligada por st.secrets [sequence_store] path = "sequences.db" ou
+SEQUENCE_STORE_PATH no ambiente (sem isso, o contador fica só em memória).
+"""
+
+# --- 0. Import Libraries ---
+import os
+import sqlite3
+import threading
+import time
+
+# --- Constants ---
+ENV_PATH = "SEQUENCE_STORE_PATH"
+SECRETS_SECTION = "sequence_store"
+
+
+# --- 1. Alocador ---
+class SequenceAllocator:
+    def __init__(self, path: str = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._values = {}     # (scope, key) -> último número entregue
+        self._seeded = set()
+        self._observed = {}   # (scope, key) -> último `observed` recebido
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS sequences (
+                    scope TEXT, key TEXT, value INTEGER, updated_at REAL, PRIMARY KEY (scope, key))
+            """)
+            self._db.commit()
+            for scope, key, value in self._db.execute("SELECT scope, key, value FROM sequences"):
+                self._values[(scope, key)] = int(value)
+
+    def next_value(self, scope: str, key, seed=None, observed: int = None) -> int:
+        """
+        Próximo número de (scope, key). seed(): maior número já usado fora deste contador;
+        observed: maior número visível agora na planilha (ver docstring do módulo).
+        """
+        k = (scope, str(key))
+        floor = 0
+        if seed is not None and k not in self._seeded:
+            floor = int(seed() or 0)   # fora do lock: pode ler a planilha
+        with self._lock:
+            self._seeded.add(k)
+            if observed is not None:
+                observed = int(observed or 0)
+                last = self._observed.get(k)
+                if last is None or observed < last:
+                    self._values[k] = observed
+                self._observed[k] = observed
+            value = max(self._values.get(k, 0), floor) + 1
+            self._values[k] = value
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO sequences (scope, key, value, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (scope, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                    (k[0], k[1], value, time.time()))
+                self._db.commit()
+            return value
+
+    def current(self, scope: str, key) -> int:
+        with self._lock:
+            return self._values.get((scope, str(key)), 0)
+
+
+# --- 2. Configuração ---
+_ALLOCATOR = None
+_ALLOCATOR_LOCK = threading.Lock()
+
+def configure_sequences(secrets=None) -> SequenceAllocator:
+    """Abre (uma vez por processo) o alocador; persistente se houver caminho configurado."""
+    global _ALLOCATOR
+    if _ALLOCATOR is not None:
+        return _ALLOCATOR
+    with _ALLOCATOR_LOCK:
+        if _ALLOCATOR is None:
+            try:
+                path = str(dict(secrets.get(SECRETS_SECTION, {})).get("path", "")).strip() if secrets is not None else ""
+            except Exception:
+                path = ""
+            _ALLOCATOR = SequenceAllocator(path or os.environ.get(ENV_PATH, "").strip() or None)
+    return _ALLOCATOR
@@ -0,0 +1,343 @@
+#status_index.py
+"""
+Último status por (atleta, evento, tarefa) da Attendance e a camada otimista da sessão.
+
+- StatusIndex: montado uma vez por versão da aba (utils.get_status_index). A Attendance é
+  ordenada uma vez (timestamp, depois ordem de gravação) e fica só a última linha de cada
+  chave; find() é O(1) e join() casa um roster inteiro numa passada (por evento ou, com
+  events=None, em qualquer evento).
+  O atleta da chave é o "Athlete ID" (by="id") ou o nome normalizado do "Fighter" (by="name").
+- StatusOverlay: linhas que a sessão gravou/enfileirou e que ainda não voltaram da planilha.
+  Entram como remendos sobre o índice (O(k) para k linhas), sem copiar nem concatenar o log;
+  cada linha sai sozinha quando o seu Op ID aparece num índice mais novo.
+O índice é compartilhado entre sessões: não alterar o que sai dele.
+"""
+
+# --- 0. Import Libraries ---
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from ts_parse import parse_ts_series
+
+# --- Constants ---
+COL_EVENT = "Event"
+COL_NAME = "Name"
+COL_FIGHTER = "Fighter"
+COL_ATHLETE_ID = "Athlete ID"
+COL_TASK = "Task"
+COL_STATUS = "Status"
+COL_USER = "User"
+COL_TIMESTAMP = "Timestamp"
+COL_TIMESTAMP_ALT = "TimeStamp"   # a que o app grava; "Timestamp" fica de fallback
+COL_NOTES = "Notes"
+COL_OP_ID = "Op ID"
+
+KEY_COLS = ["athlete", "event_key", "task"]
+# colunas de cada registro (índice e remendos); pending=True => veio do overlay
+RECORD_COLS = ["status", "user", "ts", "ts_raw", "notes", "event", "fighter", "athlete_id", "row", "pending"]
+
+_INVALID_STRS = {"", "none", "None", "null", "NULL", "nan", "NaN", "<NA>"}
+
+
+# --- 1. Normalização das chaves ---
+def normalize_name(text) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados (mesma regra de task_app.clean_and_normalize)."""
+    if not isinstance(text, str):
+        return ""
+    text = unicodedata.normalize("NFKD", text.strip().lower())
+    return " ".join("".join(c for c in text if not unicodedata.combining(c)).split())
+
+def normalize_task(text) -> str:
+    return "" if text is None else str(text).strip().lower()
+
+def normalize_id(value) -> str:
+    s = "" if value is None else str(value).strip()
+    if s.endswith(".0") and s[:-2].isdigit():
+        s = s[:-2]   # id numérico lido como float
+    return "" if s in _INVALID_STRS else s
+
+def _map_unique(s: pd.Series, fn) -> pd.Series:
+    """fn aplicada uma vez por valor distinto (nomes/eventos se repetem muito no log)."""
+    s = pd.Series(s, dtype=object).fillna("")
+    return s.map({u: fn(u) for u in s.unique()})
+
+
+# --- 2. Índice ---
+class StatusIndex:
+    def __init__(self, values: list, by: str = "id"):
+        """values: a aba como get_all_values() (cabeçalho na linha 1)."""
+        self.by = by
+        self._latest = {}    # (tarefas, by_event) -> DataFrame (atleta[, evento]) -> registro
+        self._records = {}   # (tarefas, by_event) -> dict chave -> registro (find)
+        self._matrix = {}    # tarefas -> DataFrame (atleta, evento) x tarefa -> status
+        self._done_top = {}  # tarefas -> (último Done por atleta, último Done em outro evento)
+        header, rows = (values[0], values[1:]) if values else ([], [])
+        pos = {}
+        for i, name in enumerate(header):
+            pos.setdefault(str(name).strip(), i)
+
+        def column(name):
+            i = pos.get(name)
+            if i is None:
+                return pd.Series([""] * len(rows), dtype=object)
+            return pd.Series([r[i] if i < len(r) else "" for r in rows], dtype=object)
+
+        ts_alt, ts = column(COL_TIMESTAMP_ALT).str.strip(), column(COL_TIMESTAMP).str.strip()
+        ts_raw = ts_alt.where(~ts_alt.isin(_INVALID_STRS), ts.where(~ts.isin(_INVALID_STRS), ""))
+        fighter = column(COL_FIGHTER)
+        df = pd.DataFrame({
+            "athlete": self.athlete_keys(column(COL_ATHLETE_ID) if by == "id" else fighter),
+            "event_key": self.event_keys(column(COL_EVENT)),
+            "task": _map_unique(column(COL_TASK), normalize_task),
+            "status": column(COL_STATUS),
+            "user": column(COL_USER),
+            "ts": parse_ts_series(ts_raw),
+            "ts_raw": ts_raw,
+            "notes": column(COL_NOTES),
+            "event": column(COL_EVENT),
+            "fighter": fighter,
+            "athlete_id": column(COL_ATHLETE_ID),
+            "row": np.arange(len(rows)),
+            "pending": False,
+        })
+        df = df[df["athlete"] != ""]
+        # ordem de "mais recente": timestamp (sem data perde) e, no empate, a linha gravada depois
+        df = df.sort_values(["ts", "row"], na_position="first", kind="stable")
+        self.frame = df.drop_duplicates(KEY_COLS, keep="last").set_index(KEY_COLS)[RECORD_COLS]
+        # último "Done" por chave (o último status pode ser outro): base de last_done()
+        done = df[df["status"].str.strip().str.lower() == "done"]
+        self.done = done.drop_duplicates(KEY_COLS, keep="last").set_index(KEY_COLS)[RECORD_COLS]
+        self.tasks = tuple(sorted(self.frame.index.unique("task")))
+        ops = column(COL_OP_ID)
+        self.op_ids = frozenset(ops[ops != ""]) if COL_OP_ID in pos else frozenset()
+
+    # --- chaves ---
+    def athlete_keys(self, athletes) -> pd.Series:
+        return _map_unique(athletes, normalize_id if self.by == "id" else normalize_name)
+
+    @staticmethod
+    def event_keys(events) -> pd.Series:
+        return _map_unique(events, normalize_name)
+
+    def key_of(self, values: dict) -> tuple:
+        """Chave (atleta, evento, tarefa) de uma linha da Attendance em forma de dict."""
+        athlete = (normalize_id(values.get(COL_ATHLETE_ID)) if self.by == "id"
+                   else normalize_name(values.get(COL_FIGHTER) or values.get(COL_NAME)))
+        return athlete, normalize_name(values.get(COL_EVENT)), normalize_task(values.get(COL_TASK))
+
+    def task_keys(self, fixed_task: str, aliases=(), regex: bool = False) -> tuple:
+        """
+        Tarefas do índice que casam com a tarefa/aliases (substring, como task_app.make_task_mask;
+        regex=True para aliases em expressão regular), mais a própria tarefa (que pode ainda não
+        ter linha na aba, só no overlay).
+        """
+        pats = [(fixed_task or "").lower()] + [str(a).lower() for a in (aliases or [])]
+        if regex:
+            rx = [re.compile(re.escape(pats[0]))] + [re.compile(p) for p in pats[1:]]
+            found = {t for t in self.tasks if any(r.search(t) for r in rx)}
+        else:
+            found = {t for t in self.tasks if any(p in t for p in pats)}
+        return tuple(sorted(found | {normalize_task(fixed_task)}))
+
+    # --- consultas ---
+    def latest(self, tasks, by_event: bool = True) -> pd.DataFrame:
+        """
+        Último registro por (atleta, evento) entre `tasks` — ou só por atleta, com by_event=False
+        (qualquer evento); calculado uma vez por conjunto de tarefas.
+        """
+        tasks = _task_tuple(tasks)
+        hit = self._latest.get((tasks, by_event))
+        if hit is None:
+            sub = self.frame[self.frame.index.get_level_values("task").isin(tasks)]
+            sub = sub.reset_index("task" if by_event else ["event_key", "task"])
+            # o frame já está em ordem de recência: entre as tarefas fica a última
+            hit = self._latest[(tasks, by_event)] = sub[~sub.index.duplicated(keep="last")][RECORD_COLS]
+        return hit
+
+    def find(self, athlete, event, tasks, overlay=None):
+        """
+        Registro mais recente (dict com RECORD_COLS) de um atleta, ou None. Recebe valores crus
+        (id/nome e evento como estão no roster); event=None => qualquer evento. O(1) depois da
+        primeira consulta do conjunto de tarefas.
+        """
+        tasks = _task_tuple(tasks)
+        by_event = event is not None
+        key = normalize_id(athlete) if self.by == "id" else normalize_name(athlete)
+        if by_event:
+            key = (key, normalize_name(event))
+        if overlay is not None and len(overlay):
+            rec = overlay.find(self, key, tasks, by_event)
+            if rec is not None:
+                return rec
+        records = self._records.get((tasks, by_event))
+        if records is None:
+            frame = self.latest(tasks, by_event)
+            records = self._records[(tasks, by_event)] = dict(zip(frame.index, frame.to_dict("records")))
+        return records.get(key)
+
+    def _roster_keys(self, athletes, events):
+        if events is None:
+            return pd.Index(self.athlete_keys(athletes).to_numpy())
+        return pd.MultiIndex.from_arrays([self.athlete_keys(athletes).to_numpy(), self.event_keys(events).to_numpy()])
+
+    @staticmethod
+    def _aligned(frame: pd.DataFrame, keys, athletes) -> pd.DataFrame:
+        out = frame.reindex(keys).reset_index(drop=True)
+        out.index = athletes.index if isinstance(athletes, pd.Series) else pd.RangeIndex(len(out))
+        return out
+
+    def join(self, athletes, events, tasks, overlay=None) -> pd.DataFrame:
+        """
+        Registro mais recente (RECORD_COLS) para cada par (athletes[i], events[i]), alinhado às
+        entradas; events=None => qualquer evento; sem registro => NaN. Com overlay, as linhas
+        pendentes da sessão valem por cima.
+        """
+        by_event = events is not None
+        keys = self._roster_keys(athletes, events)
+        out = self._aligned(self.latest(tasks, by_event), keys, athletes)
+        if overlay is not None and len(overlay):
+            hit = self._aligned(overlay.patches(self, tasks, by_event), keys, athletes)
+            mask = hit["pending"].eq(True)
+            if mask.any():
+                out = out.astype({c: object for c in RECORD_COLS if c != "ts"})
+                out.loc[mask, RECORD_COLS] = hit.loc[mask, RECORD_COLS]
+        return out
+
+    def patch_rows(self, athletes, events, tasks, overlay) -> pd.DataFrame:
+        """Só os remendos do overlay, alinhados às entradas (sem remendo => pending NaN)."""
+        keys = self._roster_keys(athletes, events)
+        return self._aligned(overlay.patches(self, tasks, events is not None), keys, athletes)
+
+
+    def status_matrix(self, athletes, events, tasks, overlay=None) -> pd.DataFrame:
+        """
+        Status bruto mais recente de cada tarefa (colunas, normalizadas) para cada par
+        (athletes[i], events[i]) — um unstack do índice, calculado uma vez por conjunto de
+        tarefas; sem registro => NaN. Com overlay, as linhas pendentes da sessão valem por cima.
+        """
+        tasks = _task_tuple(tasks)
+        wide = self._matrix.get(tasks)
+        if wide is None:
+            sub = self.frame.loc[self.frame.index.get_level_values("task").isin(tasks), "status"]
+            wide = self._matrix[tasks] = sub.unstack("task").reindex(columns=list(tasks))
+        out = self._aligned(wide, self._roster_keys(athletes, events), athletes)
+        if overlay is not None and len(overlay):
+            out = out.astype(object)
+            for task in tasks:
+                hit = self.patch_rows(athletes, events, (task,), overlay)
+                mask = hit["pending"].eq(True)
+                if mask.any():
+                    out.loc[mask, task] = hit.loc[mask, "status"]
+        return out
+
+    def _last_done_top(self, tasks: tuple):
+        top = self._done_top.get(tasks)
+        if top is None:
+            sub = self.done[self.done.index.get_level_values("task").isin(tasks)].reset_index("task")
+            # (atleta, evento) -> último Done entre as tarefas; ordem de recência preservada
+            flat = sub[~sub.index.duplicated(keep="last")].reset_index("event_key")
+            rank = flat.groupby(level=0, sort=False).cumcount(ascending=False)
+            top = self._done_top[tasks] = (flat[rank.to_numpy() == 0], flat[rank.to_numpy() == 1])
+        return top
+
+    def last_done(self, athletes, events, tasks, fallback_any_event: bool = True) -> pd.DataFrame:
+        """
+        Último registro "Done" de `tasks` por atleta, num evento diferente de events[i]
+        (sem nenhum e com fallback_any_event, vale o do próprio evento); events=None => qualquer
+        evento. Alinhado às entradas, RECORD_COLS + event_key; sem registro => NaN.
+        Cada atleta guarda só os dois eventos mais recentes: não há varredura por linha.
+        """
+        first, second = self._last_done_top(_task_tuple(tasks))
+        akeys = pd.Index(self.athlete_keys(athletes).to_numpy())
+        out = self._aligned(first, akeys, athletes)
+        if events is not None:
+            other = self._aligned(second, akeys, athletes)
+            same = out["event_key"].eq(self.event_keys(events).set_axis(out.index))
+            use_other = same & (other["event_key"].notna() | (not fallback_any_event))
+            out = out.mask(use_other, other)
+        return out
+
+def _task_tuple(tasks) -> tuple:
+    """Uma tarefa (str) ou várias, como chave ordenada e normalizada."""
+    if isinstance(tasks, str):
+        tasks = (tasks,)
+    return tuple(sorted({normalize_task(t) for t in tasks}))
+
+def format_dates(ts: pd.Series, default: str = "N/A") -> pd.Series:
+    """Datas do índice (coluna ts) como dd/mm/aaaa; sem data => default."""
+    ts = pd.to_datetime(ts, errors="coerce")
+    return ts.dt.strftime("%d/%m/%Y").where(ts.notna(), default)
+
+
+# --- 3. Camada otimista (por sessão) ---
+def _overlay_record(values: dict, n: int) -> dict:
+    """Linha pendente no formato de RECORD_COLS (ts é preenchido por quem chama)."""
+    return {
+        "status": values.get(COL_STATUS, ""), "user": values.get(COL_USER, ""), "ts": pd.NaT,
+        "ts_raw": str(values.get(COL_TIMESTAMP_ALT) or values.get(COL_TIMESTAMP) or "").strip(),
+        "notes": values.get(COL_NOTES, ""), "event": values.get(COL_EVENT, ""),
+        "fighter": values.get(COL_FIGHTER, ""), "athlete_id": values.get(COL_ATHLETE_ID, ""),
+        "row": -1 - n, "pending": True,
+    }
+
+class StatusOverlay:
+    """Linhas da Attendance gravadas/enfileiradas pela sessão, por cima do índice compartilhado."""
+    def __init__(self):
+        self._rows = []   # dicts coluna -> valor, em ordem de gravação
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, values: dict):
+        self._rows.append(dict(values))
+
+    def rows(self) -> list:
+        return list(self._rows)
+
+    def clear(self):
+        self._rows.clear()
+
+    def token(self) -> tuple:
+        """Identifica o conteúdo do overlay (Op IDs em ordem), para chaves de cache."""
+        return tuple(v.get(COL_OP_ID, "") for v in self._rows)
+
+    def discard(self, values_list: list):
+        """Tira do overlay linhas que a sessão descartou (casadas pelo Op ID)."""
+        ops = {v.get(COL_OP_ID) for v in values_list if v.get(COL_OP_ID)}
+        self._rows = [v for v in self._rows if v.get(COL_OP_ID) not in ops]
+
+    def prune(self, index: StatusIndex):
+        """Linhas que o índice já contém (Op ID visto na planilha) deixam de ser remendo."""
+        if self._rows and index.op_ids:
+            self._rows = [v for v in self._rows if v.get(COL_OP_ID) not in index.op_ids]
+
+    def patches(self, index: StatusIndex, tasks, by_event: bool = True) -> pd.DataFrame:
+        """Remendos (atleta[, evento]) -> registro para `tasks`, no formato de StatusIndex.latest."""
+        tasks = set(_task_tuple(tasks))
+        hits = {}
+        for n, values in enumerate(self._rows):
+            athlete, event_key, task = index.key_of(values)
+            if athlete and task in tasks:
+                # a última da sessão vence
+                hits[(athlete, event_key) if by_event else athlete] = (n, values)
+        if not hits:
+            return pd.DataFrame(columns=RECORD_COLS)
+        recs = [_overlay_record(values, n) for n, values in hits.values()]
+        keys = (pd.MultiIndex.from_tuples(list(hits), names=KEY_COLS[:2]) if by_event
+                else pd.Index(list(hits), name=KEY_COLS[0]))
+        out = pd.DataFrame(recs, index=keys)
+        out["ts"] = parse_ts_series(out["ts_raw"])
+        return out
+
+    def find(self, index: StatusIndex, key, tasks: tuple, by_event: bool = True):
+        """Linha mais recente da sessão para a chave (já normalizada), como registro; senão None."""
+        for n in range(len(self._rows) - 1, -1, -1):
+            athlete, event_key, task = index.key_of(self._rows[n])
+            if task in tasks and ((athlete, event_key) if by_event else athlete) == key:
+                rec = _overlay_record(self._rows[n], n)
+                rec["ts"] = parse_ts_series(pd.Series([rec["ts_raw"]], dtype=object)).iloc[0]
+                return rec
+        return None
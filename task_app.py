@@ -9,20 +9,22 @@
 # --- 0. Imports ---
 import streamlit as st
 import pandas as pd
-import numpy as np
 from datetime import datetime
 import html
-import time
 import unicodedata
 import re
 from typing import List, Tuple
 
 # Helpers do projeto
 from utils import (
-    get_gspread_client, connect_gsheet_tab,
-    load_users_data, get_valid_user_info, load_config_data
+    get_gspread_client, connect_gsheet_tab, invalidate_snapshot, store_derived, show_notices, with_notices,
+    load_config_data, ROSTER_DTYPES,
+    journal_queue, journal_discard, deliver_in_background, tab_header, allocate_row_number,
+    get_status_index, status_overlay
 )
-from auth import check_authentication, display_user_sidebar
+from status_index import format_dates
+from auth import display_user_sidebar
+from components.layout import show_data_age, show_delivery_status
 
 
 # ==============================================================================
@@ -67,6 +69,9 @@ class BaseConfig:
     COL_CORNER = "corner"
     COL_PASSPORT_IMAGE = "passport_image"
     COL_ROOM = "room"
+    # Só estas colunas do df (aba larga) são lidas, já tipadas
+    ATHLETE_COLUMNS = [COL_ID, COL_NAME, COL_EVENT, COL_ROLE, COL_INACTIVE, COL_IMAGE, COL_MOBILE,
+                       COL_FIGHT_NUMBER, COL_CORNER, COL_PASSPORT_IMAGE, COL_ROOM]
 
     # Colunas (Attendance)
     ATT_COL_EVENT = "Event"
@@ -113,35 +118,6 @@ BADGE_ALLOWED_STATUSES = {BaseConfig.STATUS_DONE, BaseConfig.STATUS_REQUESTED}
 # ==============================================================================
 _INVALID_STRS = {"", "none", "None", "null", "NULL", "nan", "NaN", "<NA>"}
 
-def clean_and_normalize(text: str) -> str:
-    if not isinstance(text, str):
-        return ""
-    text = text.strip().lower()
-    text = unicodedata.normalize('NFKD', text)
-    text = "".join([c for c in text if not unicodedata.combining(c)])
-    return " ".join(text.split())
-
-def parse_ts_series(raw: pd.Series) -> pd.Series:
-    if raw is None or raw.empty:
-        return pd.Series([], dtype='datetime64[ns]')
-    tries = [
-        pd.to_datetime(raw, format="%d/%m/%Y %H:%M:%S", errors="coerce"),
-        pd.to_datetime(raw, format="%d/%m/%Y", errors="coerce"),
-        pd.to_datetime(raw, format="%d-%m-%Y %H:%M:%S", errors="coerce"),
-        pd.to_datetime(raw, format="%d-%m-%Y", errors="coerce"),
-        pd.to_datetime(raw, errors="coerce"),
-    ]
-    out = tries[0]
-    for cand in tries[1:]:
-        out = out.fillna(cand)
-    return out
-
-def _clean_str_series(s: pd.Series) -> pd.Series:
-    if s is None or s.empty:
-        return pd.Series([], dtype=str)
-    s = s.fillna("").astype(str).str.strip()
-    return s.replace({k: "" for k in _INVALID_STRS})
-
 def _fmt_date_from_text(s: str) -> str:
     if s is None:
         return "N/A"
@@ -151,12 +127,6 @@ def _fmt_date_from_text(s: str) -> str:
     dt = pd.to_datetime(s, dayfirst=True, errors="coerce")
     return dt.strftime("%d/%m/%Y") if pd.notna(dt) else "N/A"
 
-def make_task_mask(task_series: pd.Series, fixed_task: str, aliases: List[str] = None) -> pd.Series:
-    t = task_series.fillna("").astype(str).str.lower()
-    pats = [re.escape((fixed_task or "").lower())] + [re.escape(x.lower()) for x in (aliases or [])]
-    regex = "(" + "|".join(pats) + ")"
-    return t.str_contains(regex, regex=True, na=False) if hasattr(t, "str_contains") else t.str.contains(regex, regex=True, na=False)
-
 def _slugify(s: str) -> str:
     s = unicodedata.normalize('NFKD', s).encode('ascii', 'ignore').decode('ascii')
     s = re.sub(r'[^a-zA-Z0-9]+', '_', s).strip('_').lower()
@@ -170,8 +140,8 @@ def _safe_display_user_sidebar():
 # ==============================================================================
 # CACHED RESOURCES (CLIENT/WS)
 # ==============================================================================
-@st.cache_resource(ttl=3600, show_spinner=False)
 def get_attendance_ws(sheet_name: str, tab_name: str):
+    # Handles ficam no registro de utils (por ID da planilha); aqui é só um atalho.
     gc = get_gspread_client()
     return connect_gsheet_tab(gc, sheet_name, tab_name)
 
@@ -182,19 +152,18 @@ def get_attendance_header(sheet_name: str, tab_name: str) -> list:
     return header or []
 
 def ensure_header_exists(ws, cfg: BaseConfig) -> list:
-    header = ws.row_values(1)
-    if not header:
-        ws.update("A1", [ATT_HEADER_ORDER])
-        return ATT_HEADER_ORDER
-    return header
+    # cabeçalho em cache no processo (só grava se a aba estiver vazia)
+    return tab_header(ws.title, cfg.MAIN_SHEET_NAME, default=ATT_HEADER_ORDER)
 
 def align_rows_to_header(header: list, dict_rows: list, cfg: BaseConfig) -> list:
     if not header:
         header = ATT_HEADER_ORDER
     out = []
-    for v in dict_rows:
+    # "#" único por linha (alocador do processo); o Op ID de cada linha vem de journal_queue
+    first = allocate_row_number(cfg.ATTENDANCE_TAB_NAME, cfg.MAIN_SHEET_NAME, len(dict_rows)) if dict_rows else 0
+    for n, v in enumerate(dict_rows):
         vv = dict(v)
-        vv.setdefault(cfg.ATT_COL_ID, str(int(time.time())))
+        vv.setdefault(cfg.ATT_COL_ID, str(first + n))
         row = [vv.get(h, "") for h in header]
         out.append(row)
     return out
@@ -203,226 +172,118 @@ def align_rows_to_header(header: list, dict_rows: list, cfg: BaseConfig) -> list
 # ==============================================================================
 # DATA LOADING
 # ==============================================================================
-@st.cache_data(ttl=600, show_spinner=False)
 def load_athlete_data(sheet_name: str, athletes_tab_name: str, cfg: BaseConfig) -> pd.DataFrame:
     try:
-        gspread_client = get_gspread_client()
-        ws = connect_gsheet_tab(gspread_client, sheet_name, athletes_tab_name)
-        data = ws.get_all_records()
-        if not data:
-            return pd.DataFrame()
-        df = pd.DataFrame(data)
-        if df.empty:
-            return pd.DataFrame()
-
-        df.columns = [str(c).strip().lower().replace(' ', '_') for c in df.columns]
-
-        if cfg.COL_ROLE not in df.columns or cfg.COL_INACTIVE not in df.columns:
-            st.error(f"Columns '{cfg.COL_ROLE.upper()}'/'{cfg.COL_INACTIVE.upper()}' not found in '{athletes_tab_name}'.", icon="🚨")
-            return pd.DataFrame()
-        if cfg.COL_ID not in df.columns:
-            df[cfg.COL_ID] = ""
-        if cfg.COL_NAME not in df.columns:
-            st.error(f"'{cfg.COL_NAME.upper()}' not found in '{athletes_tab_name}'.", icon="🚨")
-            return pd.DataFrame()
-
-        # ativos
-        if df[cfg.COL_INACTIVE].dtype == 'object':
-            df[cfg.COL_INACTIVE] = (
-                df[cfg.COL_INACTIVE]
-                .astype(str).str.strip().str.upper()
-                .map({'FALSE': False, 'TRUE': True, '': False})
-                .fillna(False)
-            )
-        elif pd.api.types.is_numeric_dtype(df[cfg.COL_INACTIVE]):
-            df[cfg.COL_INACTIVE] = df[cfg.COL_INACTIVE].map({0: False, 1: True}).fillna(False)
-        else:
-            df[cfg.COL_INACTIVE] = False
-
-        df = df[(df[cfg.COL_ROLE] == "1 - Fighter") & (df[cfg.COL_INACTIVE] == False)].copy()
-
-        df[cfg.COL_EVENT] = df[cfg.COL_EVENT].fillna(cfg.DEFAULT_EVENT_PLACEHOLDER) if cfg.COL_EVENT in df.columns else cfg.DEFAULT_EVENT_PLACEHOLDER
-        for col_check in [cfg.COL_IMAGE, cfg.COL_MOBILE, cfg.COL_FIGHT_NUMBER, cfg.COL_CORNER, cfg.COL_PASSPORT_IMAGE, cfg.COL_ROOM]:
-            if col_check not in df.columns:
-                df[col_check] = ""
-            else:
-                df[col_check] = df[col_check].fillna("")
-
-        return df.sort_values(by=[cfg.COL_EVENT, cfg.COL_NAME]).reset_index(drop=True)
+        return show_notices(store_derived(
+            athletes_tab_name, "task_app:athletes",
+            lambda df: _prepare_athlete_data(df, athletes_tab_name, cfg), sheet_name,
+            columns=cfg.ATHLETE_COLUMNS, dtypes=ROSTER_DTYPES
+        ))
     except Exception as e:
         st.error(f"Error loading athletes (gspread): {e}", icon="🚨")
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=120, show_spinner=False)
-def load_attendance_data(sheet_name: str, attendance_tab_name: str, cfg: BaseConfig) -> pd.DataFrame:
-    try:
-        gspread_client = get_gspread_client()
-        ws = connect_gsheet_tab(gspread_client, sheet_name, attendance_tab_name)
-        df_att = pd.DataFrame(ws.get_all_records())
-        required_cols = [
-            cfg.ATT_COL_ID, cfg.ATT_COL_EVENT, cfg.ATT_COL_NAME, cfg.ATT_COL_FIGHTER,
-            cfg.ATT_COL_ATHLETE_ID, cfg.ATT_COL_TASK, cfg.ATT_COL_STATUS, cfg.ATT_COL_USER,
-            cfg.ATT_COL_TIMESTAMP, cfg.ATT_COL_TIMESTAMP_ALT, cfg.ATT_COL_NOTES
-        ]
-        if df_att.empty:
-            return pd.DataFrame(columns=required_cols)
-        for col in required_cols:
-            if col not in df_att.columns:
-                df_att[col] = pd.NA
-        return df_att
-    except Exception as e:
-        st.error(f"Error loading attendance '{attendance_tab_name}': {e}", icon="🚨")
-        return pd.DataFrame(columns=[
-            cfg.ATT_COL_ID, cfg.ATT_COL_EVENT, cfg.ATT_COL_NAME, cfg.ATT_COL_FIGHTER,
-            cfg.ATT_COL_ATHLETE_ID, cfg.ATT_COL_TASK, cfg.ATT_COL_STATUS, cfg.ATT_COL_USER,
-            cfg.ATT_COL_TIMESTAMP, cfg.ATT_COL_TIMESTAMP_ALT, cfg.ATT_COL_NOTES
-        ])
+def _prepare_athlete_data(df: pd.DataFrame, athletes_tab_name: str, cfg: BaseConfig) -> pd.DataFrame:
+    if df.empty:
+        return pd.DataFrame()
 
+    if cfg.COL_ROLE not in df.columns or cfg.COL_INACTIVE not in df.columns:
+        return with_notices(pd.DataFrame(), ("error", f"Columns '{cfg.COL_ROLE.upper()}'/'{cfg.COL_INACTIVE.upper()}' not found in '{athletes_tab_name}'."))
+    if cfg.COL_ID not in df.columns:
+        df[cfg.COL_ID] = ""
+    if cfg.COL_NAME not in df.columns:
+        return with_notices(pd.DataFrame(), ("error", f"'{cfg.COL_NAME.upper()}' not found in '{athletes_tab_name}'."))
 
-# ==============================================================================
-# DATA PROCESSING
-# ==============================================================================
-@st.cache_data(ttl=120, show_spinner=False)
-def preprocess_attendance(df_attendance: pd.DataFrame, cfg: BaseConfig) -> pd.DataFrame:
-    if df_attendance is None or df_attendance.empty:
-        return pd.DataFrame()
-    df = df_attendance.copy()
-    df["fighter_norm"] = df[cfg.ATT_COL_FIGHTER].astype(str).apply(clean_and_normalize)
-    df["event_norm"]   = df[cfg.ATT_COL_EVENT].astype(str).apply(clean_and_normalize)
-    df["task_norm"]    = df[cfg.ATT_COL_TASK].astype(str).str.strip().str.lower()
-    df["status_norm"]  = df[cfg.ATT_COL_STATUS].astype(str).str.strip().str.lower()
+    # ativos (inactive já vem booleano; vazio/desconhecido conta como ativo)
+    df[cfg.COL_INACTIVE] = df[cfg.COL_INACTIVE].fillna(False).astype(bool)
 
-    s2 = _clean_str_series(df[cfg.ATT_COL_TIMESTAMP_ALT])
-    s1 = _clean_str_series(df[cfg.ATT_COL_TIMESTAMP])
-    df["TS_raw"] = s2.where(s2 != "", s1)
-    df["TS_dt"] = parse_ts_series(df["TS_raw"])
-    return df
+    df = df[(df[cfg.COL_ROLE] == "1 - Fighter") & (df[cfg.COL_INACTIVE] == False)].copy()
 
+    df[cfg.COL_EVENT] = df[cfg.COL_EVENT].fillna(cfg.DEFAULT_EVENT_PLACEHOLDER) if cfg.COL_EVENT in df.columns else cfg.DEFAULT_EVENT_PLACEHOLDER
+    for col_check in [cfg.COL_IMAGE, cfg.COL_MOBILE, cfg.COL_CORNER, cfg.COL_PASSPORT_IMAGE, cfg.COL_ROOM]:
+        if col_check not in df.columns:
+            df[col_check] = ""
+        else:
+            df[col_check] = df[col_check].fillna("")
+    if cfg.COL_FIGHT_NUMBER not in df.columns:
+        df[cfg.COL_FIGHT_NUMBER] = pd.Series(pd.NA, index=df.index, dtype="Int64")
 
+    return df.sort_values(by=[cfg.COL_EVENT, cfg.COL_NAME]).reset_index(drop=True)
+
+
+# ==============================================================================
+# DATA PROCESSING
+# ==============================================================================
 def get_all_athletes_status(
     df_athletes: pd.DataFrame,
-    df_attendance: pd.DataFrame,
     fixed_task: str,
     aliases: List[str],
     cfg: BaseConfig
 ) -> pd.DataFrame:
+    """
+    Status da tarefa fixa por atleta (nome + evento), alinhado ao índice de df_athletes.
+    Vem do índice compartilhado da Attendance (utils.get_status_index) com as linhas
+    pendentes da sessão por cima.
+    """
+    cols = ['current_task_status', 'latest_task_user', 'latest_task_timestamp']
     if df_athletes is None or df_athletes.empty:
-        return pd.DataFrame(columns=[cfg.COL_NAME, cfg.COL_EVENT, 'current_task_status', 'latest_task_user', 'latest_task_timestamp'])
-
-    base = df_athletes.copy()
-    base['name_norm'] = base[cfg.COL_NAME].apply(clean_and_normalize)
-    base['event_norm'] = base[cfg.COL_EVENT].apply(clean_and_normalize)
-
-    if df_attendance is None or df_attendance.empty:
-        base['current_task_status'] = cfg.STATUS_PENDING
-        base['latest_task_user'] = 'N/A'
-        base['latest_task_timestamp'] = 'N/A'
-        return base[[cfg.COL_NAME, cfg.COL_EVENT, 'current_task_status', 'latest_task_user', 'latest_task_timestamp']]
-
-    task_mask = make_task_mask(df_attendance["task_norm"], fixed_task, aliases)
-    df_task = df_attendance[task_mask].copy()
-
-    if df_task.empty:
-        base['current_task_status'] = cfg.STATUS_PENDING
-        base['latest_task_user'] = 'N/A'
-        base['latest_task_timestamp'] = 'N/A'
-        return base[[cfg.COL_NAME, cfg.COL_EVENT, 'current_task_status', 'latest_task_user', 'latest_task_timestamp']]
-
-    df_task["__idx__"] = np.arange(len(df_task))
-
-    merged = pd.merge(
-        base[[cfg.COL_NAME, cfg.COL_EVENT, 'name_norm', 'event_norm']],
-        df_task,
-        left_on=['name_norm', 'event_norm'],
-        right_on=['fighter_norm', 'event_norm'],
-        how='left'
-    ).sort_values(by=['name_norm', 'event_norm', 'TS_dt', '__idx__'], ascending=[True, True, False, False])
-
-    latest = merged.drop_duplicates(subset=['name_norm', 'event_norm'], keep='first')
-
-    latest['current_task_status'] = latest[cfg.ATT_COL_STATUS].apply(cfg.map_raw_status_to_logical)
-    latest['latest_task_timestamp'] = latest.apply(
-        lambda row: row['TS_dt'].strftime("%d/%m/%Y") if pd.notna(row.get('TS_dt', pd.NaT))
-        else _fmt_date_from_text(row.get('TS_raw', row.get(cfg.ATT_COL_TIMESTAMP_ALT, row.get(cfg.ATT_COL_TIMESTAMP, '')))),
-        axis=1
-    )
-    latest['latest_task_user'] = latest[cfg.ATT_COL_USER].fillna('N/A')
+        return pd.DataFrame(columns=cols)
 
-    return latest[[cfg.COL_NAME, cfg.COL_EVENT, 'current_task_status', 'latest_task_user', 'latest_task_timestamp']]
+    status_idx = get_status_index("name", cfg.MAIN_SHEET_NAME)
+    overlay = status_overlay()
+    overlay.prune(status_idx)
+    latest = status_idx.join(df_athletes[cfg.COL_NAME], df_athletes[cfg.COL_EVENT],
+                             status_idx.task_keys(fixed_task, aliases), overlay)
 
+    out = pd.DataFrame(index=df_athletes.index)
+    out['current_task_status'] = latest["status"].map(cfg.map_raw_status_to_logical)
+    out['latest_task_user'] = latest["user"].fillna('N/A')
+    dated = format_dates(latest["ts"], default="")
+    out['latest_task_timestamp'] = dated.where(dated != "", latest["ts_raw"].map(_fmt_date_from_text))
+    return out[cols]
 
-@st.cache_data(ttl=600, show_spinner=False)
-def last_task_other_event_by_name(
-    df_attendance: pd.DataFrame,
-    athlete_name: str,
-    current_event: str,
+
+def last_task_other_event(
+    df_athletes: pd.DataFrame,
     fixed_task: str,
     aliases: List[str],
     cfg: BaseConfig,
     fallback_any_event: bool = True
-) -> Tuple[str, str]:
-    if df_attendance is None or df_attendance.empty:
-        return "N/A", ""
-
-    name_n = clean_and_normalize(athlete_name)
-    evt_n  = clean_and_normalize(current_event)
-
-    task_is = make_task_mask(df_attendance["task_norm"], fixed_task, aliases)
-    status_done = df_attendance["status_norm"] == cfg.STATUS_DONE.lower()
-    base_mask = (df_attendance["fighter_norm"] == name_n) & task_is & status_done
-
-    cand = df_attendance[base_mask & (df_attendance["event_norm"] != evt_n)].copy()
-    if not cand.empty:
-        cand["__idx__"] = np.arange(len(cand))
-        cand = cand.sort_values(by=["TS_dt", "__idx__"], ascending=[False, False])
-
-    if cand.empty and fallback_any_event:
-        cand = df_attendance[base_mask].copy()
-        if not cand.empty:
-            cand["__idx__"] = np.arange(len(cand))
-            cand = cand.sort_values(by=["TS_dt", "__idx__"], ascending=[False, False])
-
-    if cand.empty:
-        return "N/A", ""
-
-    row = cand.iloc[0]
-    ev_label = str(row.get(cfg.ATT_COL_EVENT, "")).strip()
-    if pd.notna(row.get("TS_dt", pd.NaT)):
-        dt_str = row["TS_dt"].strftime("%d/%m/%Y")
-    else:
-        dt_str = _fmt_date_from_text(row.get("TS_raw", row.get(cfg.ATT_COL_TIMESTAMP_ALT, row.get(cfg.ATT_COL_TIMESTAMP, ""))))
-    return dt_str, ev_label
+) -> pd.DataFrame:
+    """
+    (last_dt, last_event) do último Done da tarefa fixa em outro evento, para o roster inteiro
+    (alinhado ao índice de df_athletes): uma consulta ao índice compartilhado da Attendance.
+    """
+    if df_athletes is None or df_athletes.empty:
+        return pd.DataFrame(columns=["last_dt", "last_event"])
+    status_idx = get_status_index("name", cfg.MAIN_SHEET_NAME)
+    last = status_idx.last_done(df_athletes[cfg.COL_NAME], df_athletes[cfg.COL_EVENT],
+                                status_idx.task_keys(fixed_task, aliases), fallback_any_event)
+    dated = format_dates(last["ts"], default="")
+    return pd.DataFrame({
+        "last_dt": dated.where(dated != "", last["ts_raw"].map(_fmt_date_from_text)),
+        "last_event": last["event"].fillna("").astype(str).str.strip(),
+    }, index=df_athletes.index)
 
 
 # ==============================================================================
 # WRITE BUFFER + APPEND
 # ==============================================================================
-@st.cache_resource(ttl=3600, show_spinner=False)
 def _get_ws_for_fast_append() -> object:
     return get_attendance_ws(BaseConfig.MAIN_SHEET_NAME, BaseConfig.ATTENDANCE_TAB_NAME)
 
-def fast_values_append(ws, rows: list):
-    if not rows:
-        return
-    body = {"values": rows}
-    ws.spreadsheet.values_append(
-        f"{ws.title}!A1",
-        params={"valueInputOption": "USER_ENTERED", "insertDataOption": "INSERT_ROWS"},
-        body=body
-    )
-
 def _ensure_buffer_state():
     if "write_buffer" not in st.session_state:
         st.session_state["write_buffer"] = []
-    if "pending_local_updates" not in st.session_state:
-        st.session_state["pending_local_updates"] = {}
 
 def queue_log(values: dict):
     _ensure_buffer_state()
+    # vai para o diário local antes da fila da sessão: sobrevive a reload/restart
+    values = journal_queue(BaseConfig.ATTENDANCE_TAB_NAME, values, BaseConfig.MAIN_SHEET_NAME)
     st.session_state["write_buffer"].append(values)
-    key = (values.get(BaseConfig.ATT_COL_ATHLETE_ID, ""), values.get(BaseConfig.ATT_COL_EVENT, ""))
-    st.session_state["pending_local_updates"][key] = values.get(BaseConfig.ATT_COL_STATUS, BaseConfig.STATUS_PENDING)
+    # overlay da sessão: o card já mostra o novo status (sai sozinho quando o snapshot trouxer a linha)
+    status_overlay().add(values)
     st.toast("Adicionado à fila (não enviado ainda).", icon="📝")
 
 def flush_buffer(cfg: BaseConfig):
@@ -435,12 +296,12 @@ def flush_buffer(cfg: BaseConfig):
     header_real = ensure_header_exists(ws, cfg)
     rows = align_rows_to_header(header_real, st.session_state["write_buffer"], cfg)
 
-    BATCH = 100
-    for i in range(0, len(rows), BATCH):
-        fast_values_append(ws, rows[i:i+BATCH])
+    # em segundo plano: o operador segue nos próximos atletas; o painel mostra cada linha
+    # (ack no diário só depois da confirmação do Sheets; o overlay segura o status até lá)
+    deliver_in_background(ws.title, rows, list(st.session_state["write_buffer"]), cfg.MAIN_SHEET_NAME)
 
     st.session_state["write_buffer"].clear()
-    st.success("Alterações enviadas ao Google Sheets.", icon="✅")
+    st.success("Alterações na fila de envio ao Google Sheets.", icon="📤")
 
 def registrar_log(
     athlete_id: str,
@@ -476,14 +337,57 @@ def registrar_log(
         return False
 
 
+def get_other_task_statuses(
+    df_athletes: pd.DataFrame,
+    tasks: List[str],
+    fixed_task: str,
+    cfg: BaseConfig
+) -> pd.DataFrame:
+    """
+    Status lógico das outras tarefas (colunas = nomes do Config) por atleta (nome + evento),
+    alinhado ao índice de df_athletes: uma passada sobre o índice compartilhado da Attendance.
+    """
+    others = [t for t in tasks if str(t).strip().lower() != fixed_task.lower()]
+    if df_athletes is None or df_athletes.empty or not others:
+        return pd.DataFrame(index=getattr(df_athletes, "index", None), columns=others)
+
+    status_idx = get_status_index("name", cfg.MAIN_SHEET_NAME)
+    keys = [str(t).strip().lower() for t in others]
+    raw = status_idx.status_matrix(df_athletes[cfg.COL_NAME], df_athletes[cfg.COL_EVENT], keys, status_overlay())
+    out = raw[keys]
+    out.columns = others
+    # poucos valores distintos: mapeia por valor, não por célula
+    logical = {v: cfg.map_raw_status_to_logical(v) for v in pd.unique(out.to_numpy().ravel()) if pd.notna(v)}
+    return out.apply(lambda col: col.map(logical)).fillna(cfg.STATUS_PENDING)
+
+
 # ==============================================================================
 # UI HELPERS
 # ==============================================================================
+def render_task_badges(statuses: pd.Series, cfg: BaseConfig) -> str:
+    """Chips das outras tasks (SOMENTE Done/Requested), de uma linha de get_other_task_statuses."""
+    badge_color = {
+        cfg.STATUS_REQUESTED: "#D35400",  # laranja
+        cfg.STATUS_DONE: "#1E8449",       # verde
+    }
+    badges_html = ""
+    for task_name, status_for_badge in statuses.items():
+        if status_for_badge in BADGE_ALLOWED_STATUSES:
+            color = badge_color.get(status_for_badge, "#34495E")
+            badges_html += (
+                f"<span style='background-color:{color};color:#fff;"
+                f"padding:3px 10px;border-radius:12px;font-size:12px;"
+                f"font-weight:bold;margin-right:6px;'>"
+                f"{html.escape(str(task_name))}</span>"
+            )
+    return badges_html
+
 def render_athlete_card(row: pd.Series, last_info: Tuple[str, str], badges_html: str, fixed_task: str, cfg: BaseConfig) -> str:
     ath_id_d = str(row.get(cfg.COL_ID, ""))
     ath_name_d = str(row.get(cfg.COL_NAME, ""))
     ath_event_d = str(row.get(cfg.COL_EVENT, ""))
-    ath_fight_number = str(row.get(cfg.COL_FIGHT_NUMBER, ""))
+    fight_number = row.get(cfg.COL_FIGHT_NUMBER, "")
+    ath_fight_number = "" if pd.isna(fight_number) else str(fight_number)
     ath_corner_color = str(row.get(cfg.COL_CORNER, ""))
     mobile_number = str(row.get(cfg.COL_MOBILE, ""))
     passport_image_url = str(row.get(cfg.COL_PASSPORT_IMAGE, ""))
@@ -606,14 +510,16 @@ def render_task_page(page_title: str, fixed_task: str, task_aliases: List[str]):
                 flush_buffer(cfg)
         with b2:
             if st.button("Descartar fila", use_container_width=True):
+                journal_discard(st.session_state["write_buffer"])
+                status_overlay().discard(st.session_state["write_buffer"])
                 st.session_state["write_buffer"].clear()
-                st.session_state["pending_local_updates"].clear()
                 st.info("Fila limpa.")
         with b3:
             if st.button("Recarregar dados (forçado)", use_container_width=True):
-                load_attendance_data.clear(); preprocess_attendance.clear(); load_athlete_data.clear()
+                invalidate_snapshot(full=True)
                 st.toast("Caches limpos. Role a página para atualizar.", icon="🔄")
 
+        show_delivery_status(f"{_kpref}_delivery")
         st.markdown("---")
 
         col_status, col_sort = st.columns(2)
@@ -650,28 +556,15 @@ def render_task_page(page_title: str, fixed_task: str, task_aliases: List[str]):
     # Dados
     with st.spinner("Loading data..."):
         df_athletes = load_athlete_data(cfg.MAIN_SHEET_NAME, cfg.ATHLETES_TAB_NAME, cfg)
-        df_attendance_raw = load_attendance_data(cfg.MAIN_SHEET_NAME, cfg.ATTENDANCE_TAB_NAME, cfg)
         tasks_raw, _ = load_config_data()
         tasks_raw = [str(x) for x in (tasks_raw or [])]
 
-    df_attendance = preprocess_attendance(df_attendance_raw, cfg)
+    show_data_age(cfg.ATTENDANCE_TAB_NAME, cfg.ATHLETES_TAB_NAME)
 
     # Status por atleta (tarefa fixa)
     if not df_athletes.empty:
-        athletes_status = get_all_athletes_status(df_athletes, df_attendance, fixed_task, task_aliases, cfg)
-        df_athletes = pd.merge(df_athletes, athletes_status, on=[cfg.COL_NAME, cfg.COL_EVENT], how='left')
-        df_athletes.fillna({
-            'current_task_status': cfg.STATUS_PENDING,
-            'latest_task_user': 'N/A',
-            'latest_task_timestamp': 'N/A'
-        }, inplace=True)
-
-        # sobreposição otimista (sem recarregar)
-        def _apply_pending(row):
-            key = (str(row.get(cfg.COL_ID, "")), str(row.get(cfg.COL_EVENT, "")))
-            pend = st.session_state["pending_local_updates"].get(key)
-            return pend if pend is not None else row.get("current_task_status", cfg.STATUS_PENDING)
-        df_athletes["current_task_status"] = df_athletes.apply(_apply_pending, axis=1)
+        athletes_status = get_all_athletes_status(df_athletes, fixed_task, task_aliases, cfg)
+        df_athletes = df_athletes.join(athletes_status)
 
     # Aplicar filtros
     selected_status = st.session_state[K_STATUS]
@@ -723,51 +616,15 @@ def render_task_page(page_title: str, fixed_task: str, task_aliases: List[str]):
         st.info("Nenhum atleta encontrado.")
         return
 
+    # status das outras tasks e último Done em outro evento para todos os cards de uma vez
+    other_statuses = get_other_task_statuses(df_filtered, tasks_raw, fixed_task, cfg)
+    last_other = last_task_other_event(df_filtered, fixed_task, task_aliases, cfg, fallback_any_event=True)
+
     for i_l, row in df_filtered.iterrows():
-        last_dt_str, last_event_str = last_task_other_event_by_name(
-            df_attendance, row[cfg.COL_NAME], row[cfg.COL_EVENT], fixed_task, task_aliases, cfg, fallback_any_event=True
-        )
+        last_dt_str, last_event_str = last_other.at[i_l, "last_dt"], last_other.at[i_l, "last_event"]
 
         # Chips para outras tasks (SOMENTE Done/Requested)
-        badges_html = ""
-        if tasks_raw:
-            badge_color = {
-                cfg.STATUS_REQUESTED: "#D35400",  # laranja
-                cfg.STATUS_DONE: "#1E8449",       # verde
-            }
-            name_n = clean_and_normalize(row[cfg.COL_NAME])
-            evt_n  = clean_and_normalize(row[cfg.COL_EVENT])
-
-            for task_name in tasks_raw:
-                if str(task_name).strip().lower() == fixed_task.lower():
-                    continue
-
-                status_for_badge = cfg.STATUS_PENDING
-
-                if not df_attendance.empty:
-                    t_norm = str(task_name).strip().lower()
-                    mask_t = (df_attendance["task_norm"] == t_norm)
-                    mask = (
-                        (df_attendance["fighter_norm"] == name_n) &
-                        (df_attendance["event_norm"] == evt_n) &
-                        mask_t
-                    )
-                    task_records = df_attendance.loc[mask].copy()
-                    if not task_records.empty:
-                        task_records["__idx__"] = np.arange(len(task_records))
-                        task_records = task_records.sort_values(by=["TS_dt", "__idx__"], ascending=[False, False])
-                        status_for_badge = cfg.map_raw_status_to_logical(
-                            str(task_records.iloc[0].get(cfg.ATT_COL_STATUS, cfg.STATUS_PENDING))
-                        )
-
-                if status_for_badge in BADGE_ALLOWED_STATUSES:
-                    color = badge_color.get(status_for_badge, "#34495E")
-                    badges_html += (
-                        f"<span style='background-color:{color};color:#fff;"
-                        f"padding:3px 10px;border-radius:12px;font-size:12px;"
-                        f"font-weight:bold;margin-right:6px;'>"
-                        f"{html.escape(task_name)}</span>"
-                    )
+        badges_html = render_task_badges(other_statuses.loc[i_l], cfg)
 
         # Card + botões
         card_html = render_athlete_card(row, (last_dt_str, last_event_str), badges_html, fixed_task, cfg)
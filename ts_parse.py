@@ -0,0 +1,105 @@
+#ts_parse.py
+"""
+Leitura dos timestamps da planilha (TimeStamp/Timestamp da Attendance) numa passada.
+
+- Cada valor distinto tem o formato detectado uma vez; os valores são agrupados por formato
+  e cada grupo vai para um pd.to_datetime com format fixo (o dd/mm/aaaa de largura fixa que o
+  app grava é reordenado para ISO, o caminho rápido do pandas). O parser genérico (lento, que
+  infere formato) só vê o que não casou com nenhum formato conhecido.
+- O resultado de cada texto fica memorizado no processo: um refresh da aba só parseia as
+  linhas novas. Ao passar de MEMO_MAX textos a memória recomeça. A memória é compartilhada
+  entre threads (sessões e revalidação em fundo): cada chamada só lê dela uma vez, para um
+  dict local, e parseia para outro; a resposta não depende de a memória sobreviver à chamada.
+Mesma prioridade das cascatas antigas (dd/mm/aaaa antes de qualquer inferência); o fallback
+genérico agora é por valor, então um texto ISO no meio do log não vira NaT.
+"""
+
+# --- 0. Import Libraries ---
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# --- Constants ---
+MEMO_MAX = 500_000
+
+_INVALID_STRS = {"", "none", "None", "null", "NULL", "nan", "NaN", "NaT", "<NA>"}
+# (regex do texto inteiro, format do pd.to_datetime), na ordem de prioridade das cascatas antigas
+_FORMATS = (
+    (r"\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{2}:\d{2}", "%d/%m/%Y %H:%M:%S"),
+    (r"\d{1,2}/\d{1,2}/\d{4}", "%d/%m/%Y"),
+    (r"\d{1,2}-\d{1,2}-\d{4} \d{1,2}:\d{2}:\d{2}", "%d-%m-%Y %H:%M:%S"),
+    (r"\d{1,2}-\d{1,2}-\d{4}", "%d-%m-%Y"),
+    (r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}", "%Y-%m-%d %H:%M:%S"),
+    (r"\d{4}-\d{2}-\d{2}", "%Y-%m-%d"),
+)
+
+_NAT = np.iinfo(np.int64).min   # NaT em datetime64[ns] como int64
+_MEMO = {}   # texto (strip) -> ns desde a época (int64; _NAT se inválido)
+
+
+# --- 1. Parser ---
+def _remember(out: dict, texts: pd.Series, parsed: pd.Series) -> pd.Series:
+    """Guarda em `out` os que parsearam; devolve a máscara (no índice de texts) dos que ficaram NaT."""
+    ok = parsed.notna()
+    out.update(zip(texts[ok].tolist(), parsed[ok].to_numpy(dtype="datetime64[ns]").view("i8").tolist()))
+    return ~ok
+
+def _parse_new(texts: list) -> dict:
+    """Parseia textos ainda fora da memória, agrupados pelo formato detectado; devolve texto -> ns."""
+    out = {}
+    texts = pd.Series(texts, dtype="str")   # operações .str vetorizadas (Arrow, no pandas novo)
+    invalid = texts.isin(_INVALID_STRS)
+    out.update(dict.fromkeys(texts[invalid].tolist(), _NAT))
+    left = ~invalid
+
+    # o que o app grava: dd/mm/aaaa[ HH:MM:SS] com zeros (largura fixa). Reordenado para ISO,
+    # cai no parser em C do pandas, bem mais rápido que strptime com format dd/mm.
+    length = texts.str.len()
+    sep = texts.str[2]
+    fixed = left & length.isin((10, 19)) & sep.isin(("/", "-")) & texts.str[5].eq(sep)
+    if fixed.any():
+        t = texts[fixed]
+        iso = t.str[6:10] + "-" + t.str[3:5] + "-" + t.str[0:2] + t.str[10:]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            parsed = pd.to_datetime(iso, format="ISO8601", errors="coerce")
+        left &= ~fixed | _remember(out, t, parsed).reindex(texts.index, fill_value=False)
+
+    # demais formatos conhecidos (sem zeros, aaaa-mm-dd): um pd.to_datetime por grupo
+    rest = texts[left]
+    for rx, fmt in _FORMATS:
+        if rest.empty:
+            break
+        group = rest[rest.str.fullmatch(rx)]
+        if not group.empty:
+            failed = _remember(out, group, pd.to_datetime(group, format=fmt, errors="coerce"))
+            rest = rest.drop(group.index[~failed])
+
+    # sem formato conhecido, ou casou o formato mas não é data válida (ex.: 31/02): genérico
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)   # "could not infer format" por valor
+        for text in rest.tolist():
+            ts = pd.to_datetime(text, errors="coerce")
+            if pd.isna(ts):
+                out[text] = _NAT
+            else:
+                out[text] = int((ts.tz_localize(None) if ts.tzinfo else ts).as_unit("ns").value)
+    return out
+
+def parse_ts_series(raw) -> pd.Series:
+    """Texto -> datetime64[ns] (NaT se vazio/inválido), com o índice de `raw`."""
+    raw = pd.Series(raw, dtype=object) if not isinstance(raw, pd.Series) else raw
+    if raw.empty:
+        return pd.Series([], index=raw.index, dtype="datetime64[ns]")
+    codes, uniques = pd.factorize(raw.fillna("").astype(str).str.strip())
+    uniques = uniques.tolist()   # dict e iteração em str do Python, uma conversão só
+    known = {u: _MEMO.get(u) for u in uniques}   # cópia local: outra thread pode limpar a memória
+    new = [u for u, v in known.items() if v is None]
+    if new:
+        known.update(_parse_new(new))
+        if len(_MEMO) + len(new) > MEMO_MAX:
+            _MEMO.clear()
+        _MEMO.update(known)
+    values = np.fromiter((known[u] for u in uniques), dtype=np.int64, count=len(uniques))
+    return pd.Series(values.view("datetime64[ns]")[codes], index=raw.index)
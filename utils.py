@@ -4,31 +4,159 @@
 import streamlit as st
 import pandas as pd
 import gspread
+import threading
+import itertools
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import NamedTuple
+from gspread.utils import absolute_range_name, fill_gaps, numericise_all, rowcol_to_a1
 from google.oauth2.service_account import Credentials
+from quota_governor import GovernedHTTPClient, request_priority, get_governor, PRIORITY_BACKGROUND
+from fake_gsheets import fake_config, make_fake_client
+from write_queue import AppendQueue, DeliveryTracker, appended_rows, WRITE_TIMEOUT
+from write_journal import configure_journal
+from sequence_allocator import configure_sequences
+from status_index import StatusIndex, StatusOverlay
 
 # --- Constants ---
 MAIN_SHEET_NAME = "UAEW_App" 
+ATHLETES_TAB_NAME = "df"
+ATTENDANCE_TAB_NAME = "Attendance"
 USERS_TAB_NAME = "Users"
 CONFIG_TAB_NAME = "Config"
+# Abas lidas juntas num único values_batch_get (ver load_sheet_snapshot)
+SNAPSHOT_TABS = (ATHLETES_TAB_NAME, ATTENDANCE_TAB_NAME, CONFIG_TAB_NAME, USERS_TAB_NAME)
+# Abas só com append (log): depois da 1ª carga, lê-se apenas a cauda nova
+APPEND_ONLY_TABS = (ATTENDANCE_TAB_NAME,)
+# Abas cujas linhas levam um ID de operação gerado no app: gravação repetida (retry/replay)
+# vira linha com o mesmo Op ID, que os leitores descartam (fica a 1ª)
+OP_ID_COL = "Op ID"
+OP_ID_TABS = (ATTENDANCE_TAB_NAME,)
+# Número da linha nas abas de log (alocado por allocate_row_number)
+ROW_NUMBER_COL = "#"
+# Opcional em st.secrets: [spreadsheet_keys] UAEW_App = "<ID da planilha>"
+# Com o ID configurado, a abertura dispensa a busca por título no Drive.
+SPREADSHEET_KEYS_SECRET = "spreadsheet_keys"
 
 # --- 2. Google Sheets Connection ---
 @st.cache_resource(ttl=3600)
 def get_gspread_client():
+    # Backend falso (offline/benchmark): [fake_gsheets] em st.secrets ou FAKE_GSHEETS=1 no ambiente
+    fake = fake_config(st.secrets)
+    if fake is not None:
+        return make_fake_client(fake, MAIN_SHEET_NAME)
     try:
         scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
         if "gcp_service_account" not in st.secrets:
             st.error("Erro: Credenciais `gcp_service_account` não encontradas.", icon="🚨"); st.stop()
         creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=scope)
-        return gspread.authorize(creds)
+        # todas as chamadas passam pelo governador de cota (fila + backoff em 429/5xx)
+        return gspread.authorize(creds, http_client=GovernedHTTPClient)
     except KeyError as e: 
         st.error(f"Erro config: Chave GCP ausente. Detalhes: {e}", icon="🚨"); st.stop()
     except Exception as e:
         st.error(f"Erro API Google: {e}", icon="🚨"); st.stop()
 
+# --- 3. Registro de handles (Spreadsheet/Worksheet) ---
+def _configured_spreadsheet_key(sheet_name: str):
+    try:
+        keys = st.secrets.get(SPREADSHEET_KEYS_SECRET, {})
+        return str(keys.get(sheet_name, "")).strip() or None
+    except Exception:
+        return None
+
+class SheetHandleRegistry:
+    """
+    Mantém Spreadsheet/Worksheet vivos no processo, indexados pelo ID da planilha.
+    - Título -> ID é resolvido uma única vez (ou vem de st.secrets).
+    - Todas as abas (Worksheet já com title, gid, linhas e colunas) saem de uma
+      única leitura de metadata.
+    - Só re-resolve depois de um erro (invalidate; ver run_on_tab).
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._client_id = None
+        self._keys_by_title = {}
+        self._spreadsheets = {}   # key -> Spreadsheet
+        self._worksheets = {}     # (key, tab) -> Worksheet
+
+    def _bind_client(self, gspread_client):
+        # cliente novo (cache_resource expirou) => handles antigos ficam órfãos
+        if self._client_id != id(gspread_client):
+            self._client_id = id(gspread_client)
+            self._spreadsheets.clear(); self._worksheets.clear()
+
+    def spreadsheet(self, gspread_client, sheet_name: str):
+        with self._lock:
+            self._bind_client(gspread_client)
+            key = self._keys_by_title.get(sheet_name) or _configured_spreadsheet_key(sheet_name)
+            if key and key in self._spreadsheets:
+                return self._spreadsheets[key]
+            spreadsheet = gspread_client.open_by_key(key) if key else gspread_client.open(sheet_name)
+            self._keys_by_title[sheet_name] = spreadsheet.id
+            self._spreadsheets[spreadsheet.id] = spreadsheet
+            return spreadsheet
+
+    def worksheet(self, gspread_client, sheet_name: str, tab_name: str):
+        with self._lock:
+            spreadsheet = self.spreadsheet(gspread_client, sheet_name)
+            ws = self._worksheets.get((spreadsheet.id, tab_name))
+            if ws is None:
+                self._load_tabs(spreadsheet)
+                ws = self._worksheets.get((spreadsheet.id, tab_name))
+            if ws is None:
+                raise gspread.exceptions.WorksheetNotFound(tab_name)
+            return ws
+
+    def _load_tabs(self, spreadsheet):
+        for ws in spreadsheet.worksheets():
+            self._worksheets[(spreadsheet.id, ws.title)] = ws
+
+    def invalidate(self, sheet_name: str = None, tab_name: str = None):
+        with self._lock:
+            if sheet_name is None:
+                self._keys_by_title.clear(); self._spreadsheets.clear(); self._worksheets.clear()
+                return
+            key = self._keys_by_title.get(sheet_name)
+            if key is None:
+                return
+            if tab_name is None:
+                self._keys_by_title.pop(sheet_name, None)
+                self._spreadsheets.pop(key, None)
+                for k in [k for k in self._worksheets if k[0] == key]:
+                    self._worksheets.pop(k, None)
+            else:
+                self._worksheets.pop((key, tab_name), None)
+
+_SHEET_HANDLES = SheetHandleRegistry()
+
+def get_spreadsheet(gspread_client, sheet_name: str = MAIN_SHEET_NAME):
+    return _SHEET_HANDLES.spreadsheet(gspread_client, sheet_name)
+
+def get_worksheet(gspread_client, sheet_name: str, tab_name: str):
+    """Como connect_gsheet_tab, mas propaga as exceções do gspread (sem st.stop)."""
+    return _SHEET_HANDLES.worksheet(gspread_client, sheet_name, tab_name)
+
+def invalidate_sheet_handles(sheet_name: str = None, tab_name: str = None):
+    _SHEET_HANDLES.invalidate(sheet_name, tab_name)
+
+def run_on_tab(gspread_client, sheet_name: str, tab_name: str, fn):
+    """
+    Executa fn(worksheet) com o handle em cache. Se a chamada falhar (aba
+    renomeada/removida, handle velho), invalida o handle e tenta uma única vez
+    com um handle re-resolvido; propaga o erro da 2ª tentativa.
+    fn precisa poder repetir (leitura, update de intervalo fixo); appends vão pelo escritor.
+    """
+    try:
+        return fn(get_worksheet(gspread_client, sheet_name, tab_name))
+    except (gspread.exceptions.APIError, gspread.exceptions.WorksheetNotFound):
+        invalidate_sheet_handles(sheet_name, tab_name)
+        return fn(get_worksheet(gspread_client, sheet_name, tab_name))
+
 def connect_gsheet_tab(gspread_client, sheet_name: str, tab_name: str):
     try:
-        spreadsheet = gspread_client.open(sheet_name)
-        return spreadsheet.worksheet(tab_name)
+        return get_worksheet(gspread_client, sheet_name, tab_name)
     except gspread.exceptions.SpreadsheetNotFound:
         st.error(f"Erro: Planilha '{sheet_name}' não encontrada.", icon="🚨"); st.stop()
     except gspread.exceptions.WorksheetNotFound:
@@ -36,12 +164,876 @@ def connect_gsheet_tab(gspread_client, sheet_name: str, tab_name: str):
     except Exception as e:
         st.error(f"Erro ao conectar à aba '{tab_name}': {e}", icon="🚨"); st.stop()
 
-@st.cache_data(ttl=300)
+# --- 4. Snapshot (várias abas em uma única chamada) ---
+_SNAPSHOT_VERSION = itertools.count(1)
+
+class AppendOnlyTail:
+    """
+    Leitor incremental de abas append-only (ex.: Attendance).
+    Guarda, por (planilha, aba), as linhas já lidas (cabeçalho incluso, já preenchidas).
+    Na próxima leitura pede só o cabeçalho e a cauda a partir da última linha conhecida:
+    essa linha serve de sentinela. Se o cabeçalho mudou, a sentinela não bate
+    (edição) ou sumiu (linhas apagadas), a aba é relida inteira.
+    Limite: edições no meio do histórico só são vistas na próxima carga completa.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}   # (sheet, tab) -> [[...], ...]
+
+    def get(self, sheet_name: str, tab_name: str):
+        with self._lock:
+            return self._rows.get((sheet_name, tab_name))
+
+    def put(self, sheet_name: str, tab_name: str, rows: list):
+        with self._lock:
+            self._rows[(sheet_name, tab_name)] = rows
+
+    def reset(self, sheet_name: str = None, tab_name: str = None):
+        with self._lock:
+            if sheet_name is None:
+                self._rows.clear()
+            else:
+                for k in [k for k in self._rows if k[0] == sheet_name and tab_name in (None, k[1])]:
+                    self._rows.pop(k, None)
+
+    @staticmethod
+    def tail_ranges(tab_name: str, known: list) -> list:
+        """[cabeçalho, cauda a partir da sentinela] em A1 notation."""
+        width = max(len(known[0]), 1)
+        last_col = rowcol_to_a1(1, width)[:-1]
+        rng = absolute_range_name(tab_name)
+        return [f"{rng}!1:1", f"{rng}!A{len(known)}:{last_col}"]
+
+    @staticmethod
+    def merge(known: list, header: list, tail: list):
+        """Linhas atualizadas, ou None se for preciso reler a aba inteira."""
+        width = len(known[0])
+        if list(header) + [""] * (width - len(header)) != known[0] or not tail:
+            return None
+        padded = [list(r) + [""] * (width - len(r)) for r in tail]
+        if padded[0] != known[-1]:
+            return None
+        return known + padded[1:]
+
+_APPEND_TAILS = AppendOnlyTail()
+
+def load_sheet_snapshot(sheet_name: str = MAIN_SHEET_NAME, tabs: tuple = SNAPSHOT_TABS, gspread_client=None) -> dict:
+    """
+    Lê todas as abas de `tabs` com um único values_batch_get (sem cache; use o DataStore).
+    Retorna {"version": int, "fetched_at": float, "values": {aba: [[...], ...]}}
+    com as linhas já preenchidas até a largura da aba (como get_all_values).
+    Todas as abas do snapshot compartilham a mesma versão.
+    Abas de APPEND_ONLY_TABS já carregadas vêm pela cauda (AppendOnlyTail).
+    Em threads de fundo, passe `gspread_client` obtido na thread principal.
+    """
+    spreadsheet = get_spreadsheet(gspread_client or get_gspread_client(), sheet_name)
+    ranges, plan = [], []
+    for tab in tabs:
+        known = _APPEND_TAILS.get(sheet_name, tab) if tab in APPEND_ONLY_TABS else None
+        if known and len(known) > 1:
+            ranges += AppendOnlyTail.tail_ranges(tab, known)
+            plan.append((tab, known))
+        else:
+            ranges.append(absolute_range_name(tab))
+            plan.append((tab, None))
+
+    value_ranges = iter(spreadsheet.values_batch_get(ranges).get("valueRanges", []))
+    values = {}
+    for tab, known in plan:
+        if known is None:
+            rows = next(value_ranges, {}).get("values", [])
+        else:
+            header = (next(value_ranges, {}).get("values") or [[]])[0]
+            tail = next(value_ranges, {}).get("values", [])
+            rows = AppendOnlyTail.merge(known, header, tail)
+            if rows is None:
+                rows = spreadsheet.values_get(absolute_range_name(tab)).get("values", [])
+        rows = fill_gaps(rows) if rows else []
+        if tab in APPEND_ONLY_TABS:
+            _APPEND_TAILS.put(sheet_name, tab, rows)
+        values[tab] = rows
+    return {"version": next(_SNAPSHOT_VERSION), "fetched_at": time.time(), "values": values}
+
+def values_to_records(values: list) -> list:
+    """Mesma semântica de worksheet.get_all_records() (cabeçalho na linha 1, números convertidos)."""
+    if not values:
+        return []
+    header, rows = values[0], values[1:]
+    return [dict(zip(header, numericise_all(row))) for row in rows]
+
+def _header_key(name) -> str:
+    return str(name).strip().lower().replace(" ", "_")
+
+_BOOL_CELLS = {"TRUE": True, "FALSE": False, "1": True, "0": False}
+# Tipos das colunas do roster (aba df) usados pelas páginas com projected_frame/columns=
+ROSTER_DTYPES = {"inactive": "bool", "fight_number": "numeric", "event": "category", "corner": "category"}
+
+def project_values(values: list, columns, dtypes: dict = None) -> pd.DataFrame:
+    """
+    DataFrame só com `columns` (casadas pelo cabeçalho normalizado: minúsculas, espaços -> "_"),
+    nomeadas como pedidas; colunas ausentes ficam de fora.
+    dtypes: {"col": "bool" | "numeric" | "category" | "str"}; sem tipo = como get_all_records.
+      bool     -> boolean anulável (TRUE/FALSE/1/0; o resto vira <NA>, cada página decide o padrão)
+      numeric  -> Int64 se todos inteiros, senão Float64 (vazio/texto -> <NA>)
+    """
+    if not values:
+        return pd.DataFrame()
+    dtypes = dtypes or {}
+    index = {}
+    for i, name in enumerate(values[0]):
+        index.setdefault(_header_key(name), i)
+    rows = values[1:]
+    data = {}
+    for col in columns:
+        i = index.get(_header_key(col))
+        if i is None:
+            continue
+        raw = [row[i] if i < len(row) else "" for row in rows]
+        kind = dtypes.get(col)
+        if kind == "bool":
+            data[col] = pd.Series(raw, dtype=object).astype(str).str.strip().str.upper().map(_BOOL_CELLS).astype("boolean")
+        elif kind == "numeric":
+            num = pd.to_numeric(pd.Series(raw, dtype=object), errors="coerce")
+            whole = num.dropna()
+            data[col] = num.astype("Int64" if (whole == whole.round()).all() else "Float64")
+        elif kind == "category":
+            data[col] = pd.Series(raw, dtype=object).astype(str).str.strip().astype("category")
+        elif kind == "str":
+            data[col] = pd.Series(raw, dtype=object).astype(str)
+        else:
+            data[col] = pd.Series(numericise_all(raw), dtype=None if raw else object)
+    return pd.DataFrame(data)
+
+def new_op_id() -> str:
+    return uuid.uuid4().hex
+
+def dedupe_op_rows(values: list) -> list:
+    """Linhas repetidas da mesma operação (mesmo Op ID) saem; linhas sem Op ID (antigas) ficam todas."""
+    if not values or OP_ID_COL not in values[0]:
+        return values
+    i = values[0].index(OP_ID_COL)
+    seen = set()
+    out = [values[0]]
+    for row in values[1:]:
+        op = row[i] if i < len(row) else ""
+        if op:
+            if op in seen:
+                continue
+            seen.add(op)
+        out.append(row)
+    return out if len(out) != len(values) else values
+
+# --- 5. DataStore (um fetch por aba por versão, compartilhado entre sessões) ---
+# Idade máxima (segundos) de cada aba antes de revalidar em segundo plano
+TAB_MAX_AGE = {
+    ATHLETES_TAB_NAME: 600,
+    ATTENDANCE_TAB_NAME: 120,
+    CONFIG_TAB_NAME: 600,
+    USERS_TAB_NAME: 300,
+}
+DEFAULT_TAB_MAX_AGE = 120
+REFRESH_RETRY_AFTER = 30  # após falha na revalidação em fundo
+# Sonda de mudança: modifiedTime do arquivo no Drive, no máximo a cada N segundos.
+# Com a sonda funcionando, TAB_MAX_AGE vira só rede de segurança (PROBED_TAB_MAX_AGE).
+CHANGE_PROBE_INTERVAL = 10
+PROBED_TAB_MAX_AGE = 1800
+PROBE_RETRY_AFTER = 300   # sonda indisponível (ex.: sem acesso ao Drive) => volta aos TTLs
+
+# Com Copy-on-Write (pandas >= 3 ou opção ligada) a cópia rasa já isola quem altera o frame.
+_PANDAS_COW = int(pd.__version__.split(".")[0]) >= 3 or bool(pd.get_option("mode.copy_on_write"))
+
+def _readonly_view(obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return obj.copy(deep=not _PANDAS_COW)
+    return obj
+
+class DataStore:
+    """
+    Cache do processo (vale para todas as sessões/páginas) sobre load_sheet_snapshot.
+    - Cada aba tem uma versão e um instante de leitura.
+    - Stale-while-revalidate: aba mais velha que TAB_MAX_AGE é servida na hora e
+      relida numa thread de fundo; o snapshot novo entra por troca atômica.
+    - invalidate() marca abas como sujas: a próxima leitura busca essas abas antes
+      de responder (usado após gravações).
+    - Sonda de mudança: se o modifiedTime da planilha mudou, relê as abas em fundo;
+      aba com conteúdo idêntico mantém a versão (e os derivados continuam válidos).
+    - frame(): DataFrame de registros (como get_all_records) montado uma vez por versão.
+    - derived(): colunas/frames específicos de cada página, calculados uma vez por versão.
+    O que sai daqui é compartilhado: as páginas recebem visões (não o objeto guardado).
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._fetch_lock = threading.Lock()   # no máximo uma leitura da planilha por vez
+        self._snapshots = {}   # sheet -> {"version", "values", "tab_versions", "fetched_at": {aba: ts}}
+        self._derived = {}     # (sheet, tab, key) -> (versão, resultado)
+        self._dirty = {}       # sheet -> set(abas)
+        self._refreshing = set()
+        self._retry_after = {}  # sheet -> ts
+        self._errors = {}       # sheet -> (ts, erro) da última revalidação que falhou
+        self._modified = {}     # sheet -> último modifiedTime visto
+        self._probe_at = {}     # sheet -> ts da próxima sondagem
+        self._probe_ok = {}     # sheet -> bool
+
+    def snapshot(self, sheet_name: str = MAIN_SHEET_NAME) -> dict:
+        with self._lock:
+            snap = self._snapshots.get(sheet_name)
+            dirty = set(self._dirty.get(sheet_name, ()))
+        if snap is None or dirty:
+            tabs = SNAPSHOT_TABS if snap is None else tuple(t for t in SNAPSHOT_TABS if t in dirty)
+            self._refresh(sheet_name, tabs, get_gspread_client(), dirty)
+            with self._lock:
+                return self._snapshots[sheet_name]
+        now = time.time()
+        probed = self._probe_ok.get(sheet_name, False)
+        stale = tuple(t for t in SNAPSHOT_TABS
+                      if now - snap["fetched_at"].get(t, 0) > (PROBED_TAB_MAX_AGE if probed else TAB_MAX_AGE.get(t, DEFAULT_TAB_MAX_AGE)))
+        probe = now >= self._probe_at.get(sheet_name, 0)
+        if stale or probe:
+            self._revalidate_async(sheet_name, stale, probe)
+        return snap
+
+    def _refresh(self, sheet_name: str, tabs: tuple, gspread_client, served_dirty: set = frozenset()):
+        requested_at = time.time()
+        with self._fetch_lock:
+            # outra sessão pode ter lido as mesmas abas enquanto esperávamos
+            with self._lock:
+                snap = self._snapshots.get(sheet_name)
+                dirty = self._dirty.get(sheet_name, set())
+                if snap and all(snap["fetched_at"].get(t, 0) >= requested_at and t not in dirty for t in tabs):
+                    return
+            try:
+                fresh = load_sheet_snapshot(sheet_name, tabs, gspread_client)
+            except (gspread.exceptions.APIError, gspread.exceptions.SpreadsheetNotFound):
+                invalidate_sheet_handles(sheet_name)   # a próxima tentativa re-resolve a planilha
+                raise
+            self._swap(sheet_name, fresh, served_dirty)
+
+    def _swap(self, sheet_name: str, fresh: dict, served_dirty: set):
+        # linhas reais da planilha (o "#" das abas de log conta estas, não as que sobram do dedupe)
+        row_counts = {t: len(v) for t, v in fresh["values"].items()}
+        # dedupe na entrada: todo leitor (frames, derivados) já vê cada operação uma vez
+        for t in OP_ID_TABS:
+            if t in fresh["values"]:
+                fresh["values"][t] = dedupe_op_rows(fresh["values"][t])
+        with self._lock:
+            old = self._snapshots.get(sheet_name) or {"values": {}, "tab_versions": {}, "fetched_at": {}, "row_counts": {}}
+            tabs = list(fresh["values"])
+            snap = {
+                "version": fresh["version"],
+                "values": {**old["values"], **fresh["values"]},
+                "tab_versions": {**old["tab_versions"], **{t: fresh["version"] for t in tabs}},
+                "fetched_at": {**old["fetched_at"], **{t: fresh["fetched_at"] for t in tabs}},
+                "row_counts": {**old["row_counts"], **row_counts},
+            }
+            # conteúdo igual => mesma versão e mesma lista (derivados seguem válidos)
+            for t in tabs:
+                if t in old["tab_versions"] and old["values"].get(t) == fresh["values"][t]:
+                    snap["values"][t] = old["values"][t]
+                    snap["tab_versions"][t] = old["tab_versions"][t]
+            self._snapshots[sheet_name] = snap
+            # só limpa o que foi marcado antes desta leitura (gravações durante o fetch continuam sujas)
+            self._dirty[sheet_name] = self._dirty.get(sheet_name, set()) - (set(served_dirty) & set(tabs))
+            # derivados de versões antigas não servem mais
+            self._derived = {k: v for k, v in self._derived.items()
+                             if k[0] != sheet_name or v[0] == snap["tab_versions"].get(k[1])}
+
+    def _probe_changed(self, sheet_name: str, gspread_client) -> bool:
+        """
+        True se o modifiedTime da planilha mudou desde a última sondagem. Na 1ª sondagem (logo após
+        a carga inicial) só conta como mudança se o arquivo for mais novo que a leitura mais antiga do snapshot.
+        """
+        now = time.time()
+        try:
+            key = get_spreadsheet(gspread_client, sheet_name).id
+            modified = gspread_client.get_file_drive_metadata(key).get("modifiedTime")
+        except Exception:
+            self._probe_ok[sheet_name] = False
+            self._probe_at[sheet_name] = now + PROBE_RETRY_AFTER
+            return False
+        self._probe_ok[sheet_name] = bool(modified)
+        self._probe_at[sheet_name] = now + CHANGE_PROBE_INTERVAL
+        last = self._modified.get(sheet_name)
+        self._modified[sheet_name] = modified
+        if last is not None:
+            return modified != last
+        fetched = (self._snapshots.get(sheet_name) or {}).get("fetched_at") or {}
+        try:
+            return not fetched or pd.Timestamp(modified).timestamp() > min(fetched.values())
+        except (TypeError, ValueError):
+            return True
+
+    def _revalidate_async(self, sheet_name: str, tabs: tuple, probe: bool = False):
+        with self._lock:
+            if sheet_name in self._refreshing:
+                return
+            if not probe and time.time() < self._retry_after.get(sheet_name, 0):
+                return
+            self._refreshing.add(sheet_name)
+            if probe:
+                # evita que outras sessões disparem a mesma sondagem enquanto esta roda
+                self._probe_at[sheet_name] = time.time() + CHANGE_PROBE_INTERVAL
+        gspread_client = get_gspread_client()  # resolvido aqui: a thread não usa st.*
+
+        def run():
+            try:
+                # leituras de fundo cedem a vez às interativas e às gravações
+                with request_priority(PRIORITY_BACKGROUND):
+                    changed = probe and self._probe_changed(sheet_name, gspread_client)
+                    to_fetch = SNAPSHOT_TABS if changed else tabs
+                    if to_fetch and (changed or time.time() >= self._retry_after.get(sheet_name, 0)):
+                        self._refresh(sheet_name, to_fetch, gspread_client)
+                self._errors.pop(sheet_name, None)
+            except Exception as e:
+                # mantém o último snapshot bom; tenta de novo depois
+                self._errors[sheet_name] = (time.time(), repr(e))
+                self._retry_after[sheet_name] = time.time() + REFRESH_RETRY_AFTER
+            finally:
+                with self._lock:
+                    self._refreshing.discard(sheet_name)
+
+        threading.Thread(target=run, name=f"revalidate-{sheet_name}", daemon=True).start()
+
+    def data_age(self, tab_name: str, sheet_name: str = MAIN_SHEET_NAME):
+        """Segundos desde a última leitura da aba (None se ainda não lida)."""
+        with self._lock:
+            snap = self._snapshots.get(sheet_name)
+            ts = snap["fetched_at"].get(tab_name) if snap else None
+        return None if ts is None else max(0.0, time.time() - ts)
+
+    def last_error(self, sheet_name: str = MAIN_SHEET_NAME):
+        return self._errors.get(sheet_name)
+
+    def version(self, tab_name: str, sheet_name: str = MAIN_SHEET_NAME) -> int:
+        return self.snapshot(sheet_name)["tab_versions"].get(tab_name, 0)
+
+    def values(self, tab_name: str, sheet_name: str = MAIN_SHEET_NAME) -> list:
+        return self.snapshot(sheet_name)["values"].get(tab_name, [])
+
+    def row_count(self, tab_name: str, sheet_name: str = MAIN_SHEET_NAME) -> int:
+        """Linhas da aba na planilha (cabeçalho incluso), antes do dedupe por Op ID."""
+        return self.snapshot(sheet_name)["row_counts"].get(tab_name, 0)
+
+    def _cached(self, sheet_name: str, tab_name: str, key: str, build):
+        # Nada aqui chama snapshot() segurando o _lock: snapshot() pode esperar o _fetch_lock,
+        # e quem segura o _fetch_lock (revalidação de fundo) precisa do _lock para o _swap.
+        version = self.version(tab_name, sheet_name)
+        with self._lock:
+            hit = self._derived.get((sheet_name, tab_name, key))
+            if hit is not None and hit[0] == version:
+                return hit[1]
+        # build() fora do lock: um derivado lento não segura as leituras das outras sessões.
+        # Duas sessões podem montar o mesmo derivado ao mesmo tempo; fica o primeiro guardado.
+        result = build()
+        with self._lock:
+            snap = self._snapshots.get(sheet_name)
+            if snap is None or snap["tab_versions"].get(tab_name, 0) != version:
+                return result   # a aba mudou durante o build: serve, mas não guarda
+            hit = self._derived.get((sheet_name, tab_name, key))
+            if hit is None or hit[0] != version:
+                hit = self._derived[(sheet_name, tab_name, key)] = (version, result)
+            return hit[1]
+
+    def frame(self, tab_name: str, sheet_name: str = MAIN_SHEET_NAME) -> pd.DataFrame:
+        def build():
+            df = pd.DataFrame(values_to_records(self.values(tab_name, sheet_name)))
+            df.attrs["snapshot_version"] = self.version(tab_name, sheet_name)
+            return df
+        return _readonly_view(self._cached(sheet_name, tab_name, "__records__", build))
+
+    def _projected(self, tab_name: str, columns, dtypes: dict = None, sheet_name: str = MAIN_SHEET_NAME) -> pd.DataFrame:
+        dtypes = dict(dtypes or {})
+        key = ("__projected__", tuple(columns), tuple(sorted(dtypes.items())))
+        return self._cached(sheet_name, tab_name, key,
+                            lambda: project_values(self.values(tab_name, sheet_name), columns, dtypes))
+
+    def projected(self, tab_name: str, columns, dtypes: dict = None, sheet_name: str = MAIN_SHEET_NAME) -> pd.DataFrame:
+        """Só as colunas pedidas, já tipadas (ver project_values); montado uma vez por versão."""
+        return _readonly_view(self._projected(tab_name, columns, dtypes, sheet_name))
+
+    def derived(self, tab_name: str, key: str, fn, sheet_name: str = MAIN_SHEET_NAME, source: str = "records",
+                columns=None, dtypes: dict = None):
+        """
+        fn(base) -> resultado, calculado uma vez por versão da aba.
+        source="records": base é o DataFrame de frame(); "record_dicts": a lista de dicts
+        (como get_all_records); "values": a lista crua (como get_all_values).
+        Com `columns`, base é o DataFrame projetado e tipado (projected()) no lugar de frame().
+        """
+        def build():
+            if columns is not None:
+                return fn(self._projected(tab_name, columns, dtypes, sheet_name).copy())
+            if source == "values":
+                return fn(self.values(tab_name, sheet_name))
+            if source == "record_dicts":
+                return fn(values_to_records(self.values(tab_name, sheet_name)))
+            return fn(self.frame(tab_name, sheet_name).copy())
+        return _readonly_view(self._cached(sheet_name, tab_name, key, build))
+
+    def invalidate(self, sheet_name: str = None, tabs: tuple = None, full: bool = False):
+        with self._lock:
+            sheets = [sheet_name] if sheet_name else (list(self._snapshots) or [MAIN_SHEET_NAME])
+            for sh in sheets:
+                if full:
+                    self._snapshots.pop(sh, None)
+                    self._dirty.pop(sh, None)
+                else:
+                    self._dirty.setdefault(sh, set()).update(t for t in (tabs or SNAPSHOT_TABS) if t in SNAPSHOT_TABS)
+            if full:
+                self._derived.clear()
+                _APPEND_TAILS.reset(sheet_name)
+
+_STORE = DataStore()
+
+def get_data_store() -> DataStore:
+    return _STORE
+
+def invalidate_snapshot(full: bool = False, tabs: tuple = None):
+    """
+    Marca as abas (todas, por padrão) como sujas; a próxima leitura as busca de novo
+    antes de responder (usar após gravações).
+    full=True descarta tudo, inclusive a cauda das abas append-only (recarga completa).
+    """
+    _STORE.invalidate(tabs=tabs, full=full)
+    if full:
+        _ROW_IDS.forget()
+
+def tab_version(tab_name: str, sheet_name: str = MAIN_SHEET_NAME) -> int:
+    """Versão atual da aba no DataStore (muda só quando o conteúdo muda)."""
+    return _STORE.version(tab_name, sheet_name)
+
+def data_age_seconds(tab_name: str, sheet_name: str = MAIN_SHEET_NAME):
+    """Idade (s) dos dados da aba servidos pelo DataStore; None se ainda não carregada."""
+    return _STORE.data_age(tab_name, sheet_name)
+
+def api_queue_depth() -> int:
+    """Chamadas ao Sheets aguardando cota neste processo (leitura + gravação)."""
+    return sum(get_governor().queue_depth().values())
+
+# --- 6. Cabeçalho e próximo "#" por aba (gravar sem ler a aba antes) ---
+class TabRowRegistry:
+    """
+    Cabeçalho e número da próxima linha por (planilha, aba).
+    - Semeado uma vez pelo snapshot; nas abas do snapshot o cabeçalho acompanha cada versão nova
+      e o contador parte do total de linhas da planilha (contando duplicatas de Op ID).
+    - allocate() reserva números de linha localmente: todo append do app passa pelo escritor
+      do processo, então o contador acompanha a aba sem ler nada.
+    - observe() recebe a última linha de cada resposta de append; se a aba cresceu além do
+      alocado (gravação de fora do app), o contador pula para depois dela.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}   # (planilha, aba) -> {"header", "next", "version"}
+
+    def _entry(self, sheet_name: str, tab_name: str) -> dict:
+        key = (sheet_name, tab_name)
+        entry = self._entries.get(key)
+        # (versão, linhas reais): uma duplicata gravada por fora não muda a versão, mas ocupa linha
+        version = ((_STORE.version(tab_name, sheet_name), _STORE.row_count(tab_name, sheet_name))
+                   if tab_name in SNAPSHOT_TABS else None)
+        if entry is None or (version is not None and version != entry["version"]):
+            values = snapshot_values(tab_name, sheet_name)
+            rows = version[1] if version is not None else len(values)
+            with self._lock:
+                entry = self._entries.setdefault(key, {"header": [], "next": 1, "version": None})
+                if values:
+                    entry["header"] = list(values[0])
+                entry["next"] = max(entry["next"], rows + 1)
+                entry["version"] = version
+        return entry
+
+    def header(self, sheet_name: str, tab_name: str, default: list = None, required: list = None) -> list:
+        """
+        Cabeçalho da aba; grava `default` se a aba estiver vazia e acrescenta colunas `required` ausentes.
+        Aba vazia sem `default` devolve [] sem gravar: um cabeçalho só com as `required` desalinharia as linhas.
+        """
+        if tab_name in OP_ID_TABS:
+            default = list(default) + [OP_ID_COL] if default and OP_ID_COL not in default else default
+            required = list(required or []) + [OP_ID_COL]
+        entry = self._entry(sheet_name, tab_name)
+        with self._lock:
+            header = list(entry["header"])
+            if not header and not default:
+                return []
+            if not header:
+                new = list(default)
+            else:
+                new = header + [c for c in (required or []) if c not in header]
+            if new == header:
+                return header
+            run_on_tab(get_gspread_client(), sheet_name, tab_name,
+                       lambda ws: ws.update(range_name=f"A1:{rowcol_to_a1(1, len(new))}", values=[new],
+                                            value_input_option="USER_ENTERED"))
+            entry["header"] = new
+            entry["next"] = max(entry["next"], 2)
+            return list(new)
+
+    def allocate(self, sheet_name: str, tab_name: str, count: int = 1) -> int:
+        """Reserva `count` linhas e devolve o número da primeira (linha da planilha, 1 = cabeçalho)."""
+        entry = self._entry(sheet_name, tab_name)
+        with self._lock:
+            first = max(entry["next"], 2)
+            entry["next"] = first + count
+            return first
+
+    def observe(self, sheet_name: str, tab_name: str, last_row: int):
+        with self._lock:
+            entry = self._entries.get((sheet_name, tab_name))
+            if entry is not None and last_row and entry["next"] <= last_row:
+                entry["next"] = last_row + 1
+
+    def forget(self):
+        with self._lock:
+            self._entries.clear()
+
+_ROW_IDS = TabRowRegistry()
+
+def _on_rows_appended(sheet_name: str, tab_name: str, rows: list, response):
+    _ROW_IDS.observe(sheet_name, tab_name, appended_rows(response)[1])
+
+def tab_header(tab_name: str, sheet_name: str = MAIN_SHEET_NAME, default: list = None, required: list = None) -> list:
+    """Cabeçalho da aba sem ler a linha 1 a cada gravação (ver TabRowRegistry.header)."""
+    return _ROW_IDS.header(sheet_name, tab_name, default, required)
+
+def allocate_row_number(tab_name: str, sheet_name: str = MAIN_SHEET_NAME, count: int = 1) -> int:
+    """Número da linha em que o próximo append cai (o "#" das abas de log), sem ler a aba."""
+    return _ROW_IDS.allocate(sheet_name, tab_name, count)
+
+def next_sequence(scope: str, key, seed=None, observed: int = None) -> int:
+    """Próximo número de ordem de (scope, key), atômico no processo (ver sequence_allocator)."""
+    return configure_sequences(st.secrets).next_value(scope, key, seed, observed)
+
+# --- 7. Abas "uma linha por chave" (upsert indexado, sem reler a aba) ---
+UPSERT_RESYNC_AFTER = 120   # releitura completa (pega gravações de fora do app)
+
+class UpsertTab:
+    """
+    Cópia local de uma aba com uma linha por chave (ex.: df [Transfers] por athlete_id + event)
+    e índice chave -> linha da planilha.
+    - upsert(): chave existente => um único update do intervalo da linha; nova => append pelo
+      escritor, que devolve a linha exata onde caiu.
+    - records()/get(): a cópia local, já com as próprias gravações (read-your-writes).
+    - Relida por inteiro só a cada UPSERT_RESYNC_AFTER s ou após invalidate().
+    """
+    def __init__(self, sheet_name: str, tab_name: str, key_cols: tuple):
+        self.sheet_name, self.tab_name, self.key_cols = sheet_name, tab_name, tuple(key_cols)
+        self._lock = threading.RLock()
+        self._values = None    # linhas da aba (cabeçalho incluso)
+        self._index = {}       # chave -> nº da linha na planilha (1 = cabeçalho)
+        self._loaded_at = 0.0
+
+    def _key(self, header: list, row) -> tuple:
+        if isinstance(row, dict):
+            return tuple(str(row.get(c, "")).strip() for c in self.key_cols)
+        return tuple(str(row[header.index(c)]).strip() if c in header and header.index(c) < len(row) else ""
+                     for c in self.key_cols)
+
+    def _load(self, force: bool = False):
+        if self._values is not None and not force and time.time() - self._loaded_at < UPSERT_RESYNC_AFTER:
+            return
+        values = [list(r) for r in self._run(lambda ws: ws.get_all_values())]
+        index = {}
+        for n, row in enumerate(values[1:], start=2):
+            index.setdefault(self._key(values[0], row), n)   # 1ª ocorrência, como antes
+        self._values, self._index, self._loaded_at = values, index, time.time()
+
+    def _run(self, fn):
+        return run_on_tab(get_gspread_client(), self.sheet_name, self.tab_name, fn)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def records(self) -> list:
+        with self._lock:
+            self._load()
+            return values_to_records(self._values)
+
+    def get(self, key) -> dict:
+        """Registro da chave (dict coluna -> valor) ou None."""
+        with self._lock:
+            self._load()
+            n = self._index.get(tuple(str(k).strip() for k in key))
+            if n is None:
+                return None
+            header, row = self._values[0], self._values[n - 1]
+            return {h: (row[i] if i < len(row) else "") for i, h in enumerate(header)}
+
+    def max_int(self, column: str) -> int:
+        with self._lock:
+            self._load()
+            if not self._values or column not in self._values[0]:
+                return 0
+            i = self._values[0].index(column)
+            nums = [int(r[i]) for r in self._values[1:] if i < len(r) and str(r[i]).strip().lstrip("-").isdigit()]
+            return max(nums, default=0)
+
+    def upsert(self, values: dict, default_header: list, keep: tuple = ()) -> bool:
+        """Grava `values`; colunas em `keep` não são sobrescritas numa linha existente. True se criou a linha."""
+        with self._lock:
+            self._load()
+            if not self._values:
+                self._run(lambda ws: ws.update(range_name="A1", values=[list(default_header)], value_input_option="USER_ENTERED"))
+                self._values = [list(default_header)]
+            header = self._values[0]
+            key = self._key(header, values)
+            n = self._index.get(key)
+            if n is not None:
+                row = list(self._values[n - 1]) + [""] * max(0, len(header) - len(self._values[n - 1]))
+                for i, h in enumerate(header):
+                    if h in values and h not in keep:
+                        row[i] = str(values[h])
+                self._run(lambda ws: ws.update(range_name=f"A{n}:{rowcol_to_a1(n, len(header))}", values=[row],
+                                               value_input_option="USER_ENTERED"))
+                self._values[n - 1] = row
+                return False
+            row = [values.get(h, "") for h in header]
+            n = append_rows(self.tab_name, [row], self.sheet_name)
+            if n and n == len(self._values) + 1:
+                self._values.append([str(v) for v in row])
+                self._index[key] = n
+            else:
+                self._loaded_at = 0.0   # alguém gravou por fora: relê antes do próximo uso
+            return True
+
+_UPSERT_TABS = {}
+_UPSERT_TABS_LOCK = threading.Lock()
+
+def get_upsert_tab(tab_name: str, key_cols: tuple, sheet_name: str = MAIN_SHEET_NAME) -> UpsertTab:
+    """UpsertTab do processo para a aba (compartilhado entre sessões)."""
+    with _UPSERT_TABS_LOCK:
+        table = _UPSERT_TABS.get((sheet_name, tab_name))
+        if table is None:
+            table = _UPSERT_TABS[(sheet_name, tab_name)] = UpsertTab(sheet_name, tab_name, key_cols)
+        return table
+
+# Escritor único do processo: appends de todas as sessões saem juntos, por aba
+_WRITER = AppendQueue(on_appended=lambda sheet, tab, rows, response: _on_rows_appended(sheet, tab, rows, response))
+
+def _stamp_op_ids(tab_name: str, rows: list, sheet_name: str, header_default: list = None) -> list:
+    """Garante um Op ID em cada linha (as que já vêm com um, p.ex. do diário, mantêm o seu)."""
+    header = tab_header(tab_name, sheet_name, default=header_default)
+    if OP_ID_COL not in header:
+        raise ValueError(f"Aba '{tab_name}' sem cabeçalho: informe header_default com a ordem das colunas das linhas.")
+    i = header.index(OP_ID_COL)
+    out = []
+    for row in rows:
+        row = list(row) + [""] * max(0, i + 1 - len(row))
+        if not str(row[i]).strip():
+            row[i] = new_op_id()
+        out.append(row)
+    return out
+
+def append_rows(tab_name: str, rows: list, sheet_name: str = MAIN_SHEET_NAME, wait: bool = True,
+                value_input: str = "USER_ENTERED", header_default: list = None):
+    """
+    Append de linhas (já alinhadas ao cabeçalho) pelo escritor único do processo.
+    wait=True: bloqueia até o Sheets confirmar (devolve a linha onde caiu a 1ª) e propaga o erro do lote
+    (ver _wait_written para o que acontece se passar de WRITE_TIMEOUT); wait=False: devolve o Future.
+    header_default: ordem das colunas das linhas, gravada como cabeçalho se a aba estiver vazia.
+    """
+    spreadsheet = get_spreadsheet(get_gspread_client(), sheet_name)
+    idempotent = tab_name in OP_ID_TABS
+    if idempotent:
+        rows = _stamp_op_ids(tab_name, rows, sheet_name, header_default)
+    future = _WRITER.submit(spreadsheet, sheet_name, tab_name, rows, value_input, idempotent)
+    return _wait_written(future, len(rows)) if wait else future
+
+def _wait_written(future: Future, n_rows: int):
+    """
+    Espera a confirmação por até WRITE_TIMEOUT. Job ainda na fila é retirado e falha com TimeoutError
+    (nada foi gravado: reenviar não duplica). Job já em envio vai cair na planilha: devolve None
+    (pendente, como "linha não informada") e o desfecho fica no delivery_tracker() da sessão.
+    """
+    try:
+        return future.result(timeout=WRITE_TIMEOUT)
+    except FutureTimeout:
+        error = TimeoutError(f"Sheets não respondeu em {WRITE_TIMEOUT}s; nada foi gravado.")
+        if _WRITER.cancel(future, error):
+            raise error from None
+        delivery_tracker().track(["row"] * n_rows, future)
+        return None
+
+def pending_writes() -> int:
+    """Linhas entregues ao escritor e ainda não enviadas ao Sheets."""
+    return _WRITER.pending()
+
+# Diário local das filas de sessão (write_journal): nada enfileirado se perde em reload/restart
+JOURNAL_ID_KEY = "_journal_id"   # chave interna nos dicts das filas de sessão (não vai ao Sheets)
+JOURNAL_ORPHAN_AFTER = 900       # linhas sem ack há mais que isso e sem sessão viva segurando são reenviadas
+JOURNAL_SWEEP_INTERVAL = 60
+
+def get_write_journal():
+    """Diário (write_journal.WriteJournal) se configurado. Na 1ª abertura reenvia tudo que ficou pendente."""
+    journal = configure_journal(st.secrets)
+    if journal is not None and time.time() >= journal.next_sweep:
+        first = journal.next_sweep == 0
+        journal.next_sweep = time.time() + JOURNAL_SWEEP_INTERVAL
+        replay_journal(0 if first else JOURNAL_ORPHAN_AFTER)
+    return journal
+
+def journal_queue(tab_name: str, values: dict, sheet_name: str = MAIN_SHEET_NAME) -> dict:
+    """Grava a linha no diário (fsync) antes de ela entrar na fila da sessão; devolve o dict com JOURNAL_ID_KEY."""
+    journal = get_write_journal()
+    values = dict(values)
+    if tab_name in OP_ID_TABS:
+        values.setdefault(OP_ID_COL, new_op_id())   # o replay reenvia com o mesmo ID
+    if journal is not None:
+        # o tracker da sessão é o dono: enquanto ela existir, o replay de órfãs não pega a linha
+        values[JOURNAL_ID_KEY] = journal.add(sheet_name, tab_name, [values], owner=delivery_tracker())[0]
+    return values
+
+def journal_discard(values_list: list):
+    """Operador descartou a fila: as linhas saem do diário sem ir ao Sheets."""
+    journal = get_write_journal()
+    if journal is not None:
+        journal.ack([v.get(JOURNAL_ID_KEY) for v in values_list])
+
+def append_journaled(tab_name: str, rows: list, journal_ids: list, sheet_name: str = MAIN_SHEET_NAME,
+                     value_input: str = "USER_ENTERED", wait: bool = True):
+    """
+    append_rows para linhas que estão no diário (journal_ids paralelo a rows; None = fora do diário).
+    Pula as que o replay já levou, dá ack depois da confirmação e devolve as demais ao diário se falhar.
+    wait=False: devolve o Future (ack/devolução acontecem quando o Sheets responder).
+    """
+    journal = get_write_journal()
+    if journal is None:
+        return append_rows(tab_name, rows, sheet_name, wait=wait, value_input=value_input)
+    live = journal.claim([jid for jid in journal_ids if jid is not None])
+    keep = [row for row, jid in zip(rows, journal_ids) if jid is None or jid in live]
+    try:
+        future = append_rows(tab_name, keep, sheet_name, wait=False, value_input=value_input)
+    except Exception:
+        journal.release(live)
+        raise
+    future.add_done_callback(lambda f: journal.release(live) if f.exception() is not None else journal.ack(live))
+    return _wait_written(future, len(keep)) if wait else future
+
+def delivery_tracker() -> DeliveryTracker:
+    """Estado por linha dos envios em segundo plano desta sessão (ver components.layout.show_delivery_status)."""
+    if "delivery_tracker" not in st.session_state:
+        st.session_state["delivery_tracker"] = DeliveryTracker()
+    return st.session_state["delivery_tracker"]
+
+def _delivery_label(values: dict) -> str:
+    parts = [values.get("Fighter") or values.get("Name") or values.get("Athlete ID"), values.get("Task"), values.get("Status")]
+    return " · ".join(str(p) for p in parts if str(p or "").strip()) or "row"
+
+def deliver_in_background(tab_name: str, rows: list, values_list: list, sheet_name: str = MAIN_SHEET_NAME,
+                          value_input: str = "USER_ENTERED"):
+    """
+    Envio sem segurar a sessão: as linhas (alinhadas; values_list = os dicts de origem, em paralelo)
+    vão ao escritor e a sessão segue na hora. Cada linha aparece no delivery_tracker() como
+    queued -> sent/failed; com a confirmação a aba fica suja (a próxima leitura traz as linhas).
+    Linhas do diário que falharem continuam nele e podem ser reenviadas pelo tracker.
+    """
+    journal_ids = [v.get(JOURNAL_ID_KEY) for v in values_list]
+
+    def send():
+        future = append_journaled(tab_name, rows, journal_ids, sheet_name, value_input, wait=False)
+        future.add_done_callback(lambda f: f.exception() is None and invalidate_snapshot(tabs=(tab_name,)))
+        return future
+
+    try:
+        future = send()
+    except Exception as e:
+        future = Future()
+        future.set_exception(e)
+    return delivery_tracker().track([_delivery_label(v) for v in values_list], future, resend=send)
+
+def replay_journal(older_than: float = 0.0) -> int:
+    """
+    Reenvia pelo escritor as linhas do diário sem ack há mais de `older_than` s (e sem sessão
+    viva segurando); devolve quantas. O "#" de cada linha é realocado: o do diário já pode ter
+    sido usado por outra gravação.
+    """
+    journal = configure_journal(st.secrets)
+    recs = journal.claim_older_than(older_than) if journal is not None else []
+    groups = {}
+    for rec in recs:
+        groups.setdefault((rec["sheet"], rec["tab"]), []).append(rec)
+    for (sheet, tab), group in groups.items():
+        ids = [rec["id"] for rec in group]
+        try:
+            header = tab_header(tab, sheet, default=list(group[0]["values"]))
+            first = allocate_row_number(tab, sheet, len(group)) if ROW_NUMBER_COL in header else None
+        except Exception:
+            journal.release(ids)
+            continue
+        rows = [[rec["values"].get(h, "") for h in header] for rec in group]
+        if first is not None:
+            i = header.index(ROW_NUMBER_COL)
+            for n, row in enumerate(rows):
+                row[i] = str(first + n)
+        future = append_rows(tab, rows, sheet, wait=False)
+        future.add_done_callback(
+            lambda f, ids=ids: journal.release(ids) if f.exception() is not None else journal.ack(ids))
+    return len(recs)
+
+def snapshot_version(sheet_name: str = MAIN_SHEET_NAME) -> int:
+    return _STORE.snapshot(sheet_name)["version"]
+
+def snapshot_values(tab_name: str, sheet_name: str = MAIN_SHEET_NAME) -> list:
+    """Equivalente a worksheet.get_all_values(), servido pelo snapshot (não modificar a lista)."""
+    if tab_name not in SNAPSHOT_TABS:
+        # aba fora do snapshot: leitura direta
+        return run_on_tab(get_gspread_client(), sheet_name, tab_name, lambda ws: ws.get_all_values())
+    return _STORE.values(tab_name, sheet_name)
+
+def snapshot_records(tab_name: str, sheet_name: str = MAIN_SHEET_NAME) -> list:
+    """Equivalente a worksheet.get_all_records(), servido pelo snapshot."""
+    return values_to_records(snapshot_values(tab_name, sheet_name))
+
+def snapshot_frame(tab_name: str, sheet_name: str = MAIN_SHEET_NAME) -> pd.DataFrame:
+    """DataFrame tipado (como pd.DataFrame(get_all_records())) carimbado com a versão da aba."""
+    if tab_name not in SNAPSHOT_TABS:
+        return pd.DataFrame(snapshot_records(tab_name, sheet_name))
+    return _STORE.frame(tab_name, sheet_name)
+
+def store_derived(tab_name: str, key: str, fn, sheet_name: str = MAIN_SHEET_NAME, source: str = "records",
+                  columns=None, dtypes: dict = None):
+    """Atalho para DataStore.derived (ver acima)."""
+    return _STORE.derived(tab_name, key, fn, sheet_name, source, columns, dtypes)
+
+class WithNotices(NamedTuple):
+    """
+    Resultado de um derivado que traz avisos para o usuário (aba vazia, coluna ausente...).
+    O build roda uma vez por versão, na sessão que chegar primeiro: st.error/st.warning lá
+    dentro só apareceriam para ela. O build devolve os avisos junto e quem chama mostra.
+    """
+    value: object
+    notices: tuple   # (("error" | "warning", texto), ...)
+
+def with_notices(value, *notices) -> WithNotices:
+    return WithNotices(value, tuple(notices))
+
+def show_notices(result):
+    """Mostra nesta sessão os avisos de um WithNotices e devolve o valor (outros resultados passam direto)."""
+    if not isinstance(result, WithNotices):
+        return result
+    for level, text in result.notices:
+        if level == "error":
+            st.error(text, icon="🚨")
+        else:
+            st.warning(text, icon="⚠️")
+    return _readonly_view(result.value)
+
+def projected_frame(tab_name: str, columns, dtypes: dict = None, sheet_name: str = MAIN_SHEET_NAME) -> pd.DataFrame:
+    """Atalho para DataStore.projected: só as colunas pedidas da aba, tipadas."""
+    return _STORE.projected(tab_name, columns, dtypes, sheet_name)
+
+def get_status_index(by: str = "id", sheet_name: str = MAIN_SHEET_NAME) -> StatusIndex:
+    """Último status por (atleta, evento, tarefa) da Attendance, montado uma vez por versão (ver status_index)."""
+    return _STORE.derived(ATTENDANCE_TAB_NAME, f"status_index:{by}",
+                          lambda values: StatusIndex(values, by), sheet_name, source="values")
+
+def status_overlay() -> StatusOverlay:
+    """Linhas de Attendance que esta sessão gravou e que o snapshot ainda não trouxe (uma por sessão, todas as páginas)."""
+    if "status_overlay" not in st.session_state:
+        st.session_state["status_overlay"] = StatusOverlay()
+    return st.session_state["status_overlay"]
+
 def load_users_data(sheet_name: str = MAIN_SHEET_NAME, users_tab_name: str = USERS_TAB_NAME):
     try:
-        gspread_client = get_gspread_client()
-        worksheet = connect_gsheet_tab(gspread_client, sheet_name, users_tab_name)
-        return worksheet.get_all_records() or []
+        return snapshot_records(users_tab_name, sheet_name) or []
     except Exception as e:
         st.error(f"Erro ao carregar usuários '{users_tab_name}': {e}", icon="🚨"); return []
 
@@ -60,23 +1052,22 @@ def get_valid_user_info(user_input: str, sheet_name: str = MAIN_SHEET_NAME, user
         if ps_sheet == val_id_input or ("PS" + ps_sheet) == proc_input or name_sheet == proc_input or ps_sheet == proc_input: return record
     return None
 
-@st.cache_data(ttl=600)
 def load_config_data(sheet_name: str = MAIN_SHEET_NAME, config_tab_name: str = CONFIG_TAB_NAME):
     try:
-        gspread_client = get_gspread_client()
-        worksheet = connect_gsheet_tab(gspread_client, sheet_name, config_tab_name)
-        data = worksheet.get_all_values()
-        if not data or len(data) < 1: 
-            st.error(f"Aba '{config_tab_name}' vazia/sem cabeçalho.", icon="🚨")
-            return [],[]
-        df_conf = pd.DataFrame(data[1:], columns=data[0])
-        tasks = df_conf["TaskList"].dropna().unique().tolist() if "TaskList" in df_conf.columns else []
-        statuses = df_conf["TaskStatus"].dropna().unique().tolist() if "TaskStatus" in df_conf.columns else []
-        if not tasks: 
-            st.warning(f"'TaskList' não encontrada/vazia em '{config_tab_name}'.", icon="⚠️")
-        if not statuses: 
-            st.warning(f"'TaskStatus' não encontrada/vazia em '{config_tab_name}'.", icon="⚠️")
-        return tasks, statuses
+        return show_notices(store_derived(config_tab_name, "utils:config", lambda data: _prepare_config_data(data, config_tab_name), sheet_name, source="values"))
     except Exception as e: 
         st.error(f"Erro ao carregar config '{config_tab_name}': {e}", icon="🚨")
-        return [], []
\ No newline at end of file
+        return [], []
+
+def _prepare_config_data(data: list, config_tab_name: str):
+    if not data or len(data) < 1: 
+        return with_notices(([], []), ("error", f"Aba '{config_tab_name}' vazia/sem cabeçalho."))
+    df_conf = pd.DataFrame(data[1:], columns=data[0])
+    tasks = df_conf["TaskList"].dropna().unique().tolist() if "TaskList" in df_conf.columns else []
+    statuses = df_conf["TaskStatus"].dropna().unique().tolist() if "TaskStatus" in df_conf.columns else []
+    notices = []
+    if not tasks: 
+        notices.append(("warning", f"'TaskList' não encontrada/vazia em '{config_tab_name}'."))
+    if not statuses: 
+        notices.append(("warning", f"'TaskStatus' não encontrada/vazia em '{config_tab_name}'."))
+    return with_notices((tasks, statuses), *notices)
@@ -0,0 +1,162 @@
+#write_journal.py
+"""
+Diário local (append-only) das linhas que as páginas deixam na fila antes de mandar ao Sheets
+(task_app.queue_log, buffer do Weight-in).
+
+Cada linha enfileirada vira um registro "add" gravado em disco antes da sessão seguir; quando
+o append no Sheets é confirmado entra um registro "ack" (ou "ack" de descarte, se o operador
+limpou a fila). O que não tiver ack sobrevive a reload do navegador, queda da sessão ou
+restart do app e é reenviado por utils.replay_journal().
+  - fsync em grupo: quem grava espera um fsync que cobre todos os registros escritos até ali,
+    então N sessões gravando juntas custam ~1 fsync;
+  - claim()/release(): uma linha em envio fica reservada, para a sessão e o replay não
+    mandarem a mesma linha duas vezes;
+  - add(..., owner=): a sessão que enfileirou segura a linha enquanto estiver viva (fila,
+    escritor em backoff, painel de reenvio); o replay de órfãs só pega linhas sem dono vivo;
+  - na abertura o arquivo é compactado (só os registros pendentes são reescritos).
+
+Opcional: ligado por st.secrets [write_journal] path = "writes.wal" ou WRITE_JOURNAL_PATH no ambiente.
+"""
+
+# --- 0. Import Libraries ---
+import itertools
+import json
+import os
+import threading
+import time
+import weakref
+
+# --- Constants ---
+ENV_PATH = "WRITE_JOURNAL_PATH"
+SECRETS_SECTION = "write_journal"
+
+
+# --- 1. Diário ---
+class WriteJournal:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._pending = {}        # id -> {"id", "sheet", "tab", "values", "at"}
+        self._in_flight = set()
+        self._owners = {}         # id -> weakref do dono (ex.: DeliveryTracker da sessão)
+        self._written = 0         # registros escritos no arquivo
+        self._synced = 0          # registros cobertos pelo último fsync
+        self.next_sweep = 0.0     # controlado por utils.get_write_journal
+        self._load()
+        self._ids = itertools.count(max(self._pending, default=0) + 1)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue   # última linha cortada por queda no meio da escrita
+                if rec.get("op") == "add":
+                    self._pending[rec["id"]] = rec
+                elif rec.get("op") == "ack":
+                    for jid in rec.get("ids", []):
+                        self._pending.pop(jid, None)
+        # compacta: só o que ainda falta enviar
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            for rec in self._pending.values():
+                fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.path)
+
+    def _write(self, records: list):
+        """Grava e só retorna depois de um fsync que cubra estes registros."""
+        with self._lock:
+            for rec in records:
+                self._file.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._written += len(records)
+            mine = self._written
+        with self._sync_lock:
+            if self._synced >= mine:
+                return   # outro fsync já levou estes registros junto
+            with self._lock:
+                target = self._written
+            os.fsync(self._file.fileno())
+            self._synced = target
+
+    # --- API ---
+    def add(self, sheet: str, tab: str, values_list: list, owner=None) -> list:
+        """Registra linhas (dicts coluna -> valor) na fila; devolve os ids do diário."""
+        now = time.time()
+        with self._lock:
+            records = [{"op": "add", "id": next(self._ids), "sheet": sheet, "tab": tab,
+                        "values": dict(values), "at": now} for values in values_list]
+            for rec in records:
+                self._pending[rec["id"]] = rec
+                if owner is not None:
+                    self._owners[rec["id"]] = weakref.ref(owner)
+        self._write(records)
+        return [rec["id"] for rec in records]
+
+    def ack(self, ids):
+        """Linhas enviadas (ou descartadas de propósito): saem do diário."""
+        ids = [jid for jid in ids if jid is not None]
+        if not ids:
+            return
+        with self._lock:
+            for jid in ids:
+                self._pending.pop(jid, None)
+                self._in_flight.discard(jid)
+                self._owners.pop(jid, None)
+        self._write([{"op": "ack", "ids": ids, "at": time.time()}])
+
+    def claim(self, ids) -> set:
+        """Reserva para envio os ids ainda pendentes e livres; devolve os reservados."""
+        with self._lock:
+            got = {jid for jid in ids if jid in self._pending and jid not in self._in_flight}
+            self._in_flight |= got
+            return got
+
+    def _owned(self, jid) -> bool:
+        ref = self._owners.get(jid)
+        return ref is not None and ref() is not None
+
+    def claim_older_than(self, age: float) -> list:
+        """Reserva as linhas pendentes há mais de `age` segundos e sem dono vivo (replay)."""
+        limit = time.time() - age
+        with self._lock:
+            recs = [rec for jid, rec in self._pending.items()
+                    if jid not in self._in_flight and not self._owned(jid) and rec.get("at", 0) <= limit]
+            self._in_flight |= {rec["id"] for rec in recs}
+            return recs
+
+    def release(self, ids):
+        """Envio falhou: as linhas continuam pendentes para a próxima tentativa."""
+        with self._lock:
+            self._in_flight.difference_update(ids)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+# --- 2. Configuração ---
+_JOURNAL = None
+_JOURNAL_LOCK = threading.Lock()
+
+def configure_journal(secrets=None):
+    """Abre (uma vez por processo) o diário configurado; None se desligado."""
+    global _JOURNAL
+    if _JOURNAL is not None:
+        return _JOURNAL or None
+    with _JOURNAL_LOCK:
+        if _JOURNAL is None:
+            try:
+                path = str(dict(secrets.get(SECRETS_SECTION, {})).get("path", "")).strip() if secrets is not None else ""
+            except Exception:
+                path = ""
+            path = path or os.environ.get(ENV_PATH, "").strip()
+            _JOURNAL = WriteJournal(path) if path else False
+    return _JOURNAL or None
@@ -0,0 +1,259 @@
+#write_queue.py
+
+# --- 0. Import Libraries ---
+import itertools
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import Future
+
+from gspread.utils import a1_to_rowcol
+
+from quota_governor import idempotent_writes
+
+# --- Constants ---
+WRITE_WINDOW = 0.3       # segundos que o escritor espera juntando linhas antes de enviar
+MAX_BATCH_ROWS = 500     # linhas por values_append
+WRITE_TIMEOUT = 90       # quanto a sessão espera pela confirmação do Sheets
+KEEP_SENT = 200          # linhas já enviadas que o DeliveryTracker ainda mostra
+
+
+def appended_rows(response) -> tuple:
+    """(primeira, última) linha gravada, de updates.updatedRange da resposta do values_append; (0, 0) se ausente."""
+    try:
+        cells = response["updates"]["updatedRange"].rsplit("!", 1)[-1].split(":")
+        return a1_to_rowcol(cells[0])[0], a1_to_rowcol(cells[-1])[0]
+    except (TypeError, KeyError, IndexError, ValueError, AttributeError):
+        return 0, 0
+
+
+class AppendQueue:
+    """
+    Escritor único do processo para appends no Sheets.
+    - Todas as sessões/páginas entregam linhas já alinhadas ao cabeçalho via submit().
+    - Uma thread junta o que chegar dentro de WRITE_WINDOW, agrupa por (planilha, aba,
+      valueInputOption) e faz um values_append por grupo (fatiado em MAX_BATCH_ROWS sem partir
+      um remetente entre fatias, salvo se ele sozinho passar do limite), mantendo a ordem de chegada.
+    - Lotes marcados como idempotentes (linhas com Op ID) são repetidos em qualquer erro
+      transitório; os leitores descartam uma eventual linha duplicada.
+    - Cada submit() devolve um Future: resultado = linha da planilha onde caiu a 1ª linha
+      daquele remetente (None se a resposta não disser), ou a exceção da fatia que falhou.
+      Se uma fatia falha, os remetentes já gravados inteiros nas anteriores recebem o resultado;
+      só os demais recebem o erro (e podem reenviar sem duplicar).
+    - cancel() tira da fila um job que o escritor ainda não pegou.
+    A thread não usa st.*: o Spreadsheet vem resolvido pela sessão.
+    """
+    def __init__(self, window: float = WRITE_WINDOW, max_rows: int = MAX_BATCH_ROWS, on_appended=None):
+        self.window = window
+        self.max_rows = max_rows
+        self.on_appended = on_appended   # fn(sheet_name, tab_name, rows, resposta) após append confirmado
+        self._cond = threading.Condition()
+        self._jobs = []                  # (spreadsheet, sheet_name, tab_name, rows, future, value_input, idempotent)
+        self._thread = None
+        self.batches_sent = 0            # diagnóstico
+        self.rows_sent = 0
+
+    def submit(self, spreadsheet, sheet_name: str, tab_name: str, rows: list,
+               value_input: str = "USER_ENTERED", idempotent: bool = False) -> Future:
+        future = Future()
+        if not rows:
+            future.set_result(None)
+            return future
+        with self._cond:
+            self._jobs.append((spreadsheet, sheet_name, tab_name, [list(r) for r in rows], future, value_input, idempotent))
+            self._ensure_thread()
+            self._cond.notify_all()
+        return future
+
+    def pending(self) -> int:
+        """Linhas aguardando envio (ainda não entregues ao Sheets)."""
+        with self._cond:
+            return sum(len(job[3]) for job in self._jobs)
+
+    def cancel(self, future: Future, error: Exception) -> bool:
+        """Tira da fila o job do Future (que falha com `error`); False se o escritor já o pegou (vai ser gravado)."""
+        with self._cond:
+            for i, job in enumerate(self._jobs):
+                if job[4] is future:
+                    del self._jobs[i]
+                    break
+            else:
+                return False
+        future.set_exception(error)
+        return True
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    self._cond.wait()
+            time.sleep(self.window)   # deixa as outras sessões entrarem no mesmo lote
+            with self._cond:
+                jobs, self._jobs = self._jobs, []
+            groups = {}
+            for job in jobs:
+                groups.setdefault((job[0].id, job[2], job[5]), []).append(job)
+            for group in groups.values():
+                try:
+                    self._flush(group)
+                except Exception as e:
+                    # erro inesperado fora do append: falha só este grupo, a thread continua servindo
+                    for job in group:
+                        if not job[4].done():
+                            job[4].set_exception(e)
+
+    def _flush(self, group: list):
+        spreadsheet, sheet_name, tab_name, value_input = group[0][0], group[0][1], group[0][2], group[0][5]
+        idempotent = all(job[6] for job in group)
+        chunks, spans = self._chunks(group)
+        responses, error = [], None
+        try:
+            # gravações já entram com prioridade máxima no governador de cota
+            with idempotent_writes() if idempotent else nullcontext():
+                for chunk in chunks:
+                    responses.append(spreadsheet.values_append(
+                        f"'{tab_name}'!A1",
+                        params={"valueInputOption": value_input, "insertDataOption": "INSERT_ROWS"},
+                        body={"values": chunk},
+                    ))
+        except Exception as e:
+            error = e   # lote parcial: as fatias já enviadas ficam na planilha
+        sent = len(responses)
+        if sent:
+            rows = [row for chunk in chunks[:sent] for row in chunk]
+            self.batches_sent += sent
+            self.rows_sent += len(rows)
+            if self.on_appended is not None:
+                try:
+                    self.on_appended(sheet_name, tab_name, rows, responses[-1])
+                except Exception:
+                    pass   # o append no Sheets já valeu; espelho/cache se acertam no próximo pull
+        # quem caiu inteiro nas fatias enviadas recebe a sua posição; os demais, o erro
+        starts = [appended_rows(r)[0] for r in responses]
+        for job, (first, last, pos) in zip(group, spans):
+            if last < sent:
+                job[4].set_result(starts[first] + pos if starts[first] else None)
+            else:
+                job[4].set_exception(error)
+
+    def _chunks(self, group: list) -> tuple:
+        """
+        Fatias de até max_rows linhas; um remetente só é partido se sozinho passar do limite.
+        Devolve (fatias, [(1ª fatia, última fatia, posição na 1ª) por remetente]).
+        """
+        chunks, spans = [[]], []
+        for job in group:
+            rows = job[3]
+            if chunks[-1] and len(chunks[-1]) + len(rows) > self.max_rows:
+                chunks.append([])
+            first, pos = len(chunks) - 1, len(chunks[-1])
+            for i in range(0, len(rows), self.max_rows):
+                if i:
+                    chunks.append([])
+                chunks[-1].extend(rows[i:i + self.max_rows])
+            spans.append((first, len(chunks) - 1, pos))
+        return chunks, spans
+
+
+class DeliveryTracker:
+    """
+    Estado de entrega por linha para a UI, uma instância por sessão (utils.delivery_tracker).
+    - track() registra as linhas de um lote como "queued" e acompanha o Future do escritor;
+      a thread do escritor as passa a "sent" (com a linha da planilha) ou "failed" (com o erro).
+    - Lotes que falharam guardam a função de reenvio: retry_failed() os manda de novo.
+    - take_finished() diz se algum lote terminou desde a última consulta (o polling da UI
+      usa isso para recarregar a página uma vez, com os dados já confirmados).
+    """
+    QUEUED, SENT, FAILED = "queued", "sent", "failed"
+
+    def __init__(self, keep_sent: int = KEEP_SENT):
+        self.keep_sent = keep_sent
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._rows = {}      # id -> {"label", "state", "detail", "at"}
+        self._batches = {}   # lote -> (ids, resend)
+        self._finished = 0
+
+    def track(self, labels: list, future: Future, resend=None) -> int:
+        """Registra um lote (um rótulo por linha) e devolve o id do lote."""
+        now = time.time()
+        with self._lock:
+            ids = [next(self._ids) for _ in labels]
+            for i, label in zip(ids, labels):
+                self._rows[i] = {"label": label, "state": self.QUEUED, "detail": "", "at": now}
+            batch = ids[0] if ids else next(self._ids)
+            self._batches[batch] = (ids, resend)
+        future.add_done_callback(lambda f: self._done(batch, f))
+        return batch
+
+    def _done(self, batch: int, future: Future):
+        err = future.exception()
+        first = None if err is not None else future.result()
+        now = time.time()
+        with self._lock:
+            ids, resend = self._batches.get(batch, ((), None))
+            for n, i in enumerate(ids):
+                row = self._rows.get(i)
+                if row is None:
+                    continue
+                if err is not None:
+                    row.update(state=self.FAILED, detail=str(err)[:200] or type(err).__name__, at=now)
+                else:
+                    row.update(state=self.SENT, detail=f"row {first + n}" if first else "", at=now)
+            if err is None:
+                self._batches.pop(batch, None)   # lote com falha fica para retry_failed()
+            self._finished += 1
+            self._trim()
+
+    def _trim(self):
+        sent = [i for i, row in self._rows.items() if row["state"] == self.SENT]
+        for i in sent[:max(0, len(sent) - self.keep_sent)]:
+            del self._rows[i]
+
+    def retry_failed(self) -> int:
+        """Reenvia os lotes que falharam; devolve quantas linhas voltaram à fila."""
+        with self._lock:
+            failed = [(b, ids, resend) for b, (ids, resend) in self._batches.items()
+                      if resend is not None and any(self._rows.get(i, {}).get("state") == self.FAILED for i in ids)]
+            for _, ids, _ in failed:
+                for i in ids:
+                    if i in self._rows:
+                        self._rows[i].update(state=self.QUEUED, detail="", at=time.time())
+        for b, ids, resend in failed:
+            try:
+                future = resend()
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(lambda f, b=b: self._done(b, f))
+        return sum(len(ids) for _, ids, _ in failed)
+
+    def clear_finished(self):
+        """Tira da lista o que já foi enviado (falhas ficam até serem reenviadas)."""
+        with self._lock:
+            self._rows = {i: row for i, row in self._rows.items() if row["state"] != self.SENT}
+
+    def rows(self) -> list:
+        """Linhas acompanhadas, da mais nova para a mais antiga."""
+        with self._lock:
+            return [dict(row) for _, row in sorted(self._rows.items(), reverse=True)]
+
+    def counts(self) -> dict:
+        out = {self.QUEUED: 0, self.SENT: 0, self.FAILED: 0}
+        with self._lock:
+            for row in self._rows.values():
+                out[row["state"]] += 1
+        return out
+
+    def pending(self) -> int:
+        return self.counts()[self.QUEUED]
+
+    def take_finished(self) -> int:
+        with self._lock:
+            n, self._finished = self._finished, 0
+            return n